@@ -1,12 +1,15 @@
 from django.contrib import admin
 
 from .models import (
+    BluffNumberGameState,
     BluffNumberResult,
     DiscordGuild,
     DiscordUser,
     FlashResult,
     OverSleptResult,
     PredictionResult,
+    QuizAsk,
+    QuizQuestion,
     QuizResult,
 )
 
@@ -45,3 +48,18 @@ class BluffNumberResultAdmin(admin.ModelAdmin):
 @admin.register(FlashResult)
 class FlashResultAdmin(admin.ModelAdmin):
     list_display = ("user", "play_count", "correct_count")
+
+
+@admin.register(QuizQuestion)
+class QuizQuestionAdmin(admin.ModelAdmin):
+    list_display = ("question", "answer", "ask_count", "created_at")
+
+
+@admin.register(QuizAsk)
+class QuizAskAdmin(admin.ModelAdmin):
+    list_display = ("guild", "question", "asked_at")
+
+
+@admin.register(BluffNumberGameState)
+class BluffNumberGameStateAdmin(admin.ModelAdmin):
+    list_display = ("channel_id", "updated_at")
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DiscordappConfig(AppConfig):
     name = 'discordapp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,211 @@
+import json
+
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authtoken.models import Token
+
+from .mixins import (
+    RESULT_MODELS,
+    acreate_or_update_discord_guild,
+    acreate_or_update_discord_user,
+    aget_leaderboard,
+    aget_leaderboard_rank,
+    aincrement_result,
+    apop_quiz_question,
+    get_counter_fields,
+)
+from .serializers import (
+    BluffNumberResultSerializer,
+    DiscordGuildRequestSerializer,
+    DiscordUserRequestSerializer,
+    FlashResultSerializer,
+    LeaderboardRequestSerializer,
+    OverSleptResultSerializer,
+    PredictionResultSerializer,
+    QuizQuestionSerializer,
+    QuizResultSerializer,
+    is_snowflake,
+)
+
+# ゲーム名 -> 結果のシリアライザ
+RESULT_SERIALIZERS = {
+    "quiz": QuizResultSerializer,
+    "overslept": OverSleptResultSerializer,
+    "prediction": PredictionResultSerializer,
+    "bluff_number": BluffNumberResultSerializer,
+    "flash": FlashResultSerializer,
+}
+
+LEADERBOARD_DEFAULT_LIMIT = 10
+LEADERBOARD_MAX_LIMIT = 100
+
+# 本文にあればDiscordのスノーフレーク（64bit整数）でなければならない項目
+SNOWFLAKE_FIELDS = ("guild_id", "discord_id")
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncAPIView(View):
+    """非同期APIビューの基底クラス
+
+    DRFのTokenAuthenticationと同じ "Authorization: Token <key>" で認証し、
+    JSONの本文を self.data に読み込んでからハンドラを呼ぶ。
+    request_serializersのシリアライザで本文を検証し、通らなければ400を返す。
+    """
+
+    # 本文を検証するシリアライザ（検証済みの値でself.dataを上書きする）
+    request_serializers = ()
+
+    async def dispatch(self, request, *args, **kwargs):
+        if not await self.authenticate(request):
+            response = JsonResponse({"detail": "Invalid or missing token."}, status=401)
+            response["WWW-Authenticate"] = "Token"
+            return response
+        try:
+            self.data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"message": "Invalid JSON"}, status=400)
+        if not isinstance(self.data, dict):
+            return JsonResponse({"message": "Expected a JSON object"}, status=400)
+        for name in SNOWFLAKE_FIELDS:
+            value = self.data.get(name)
+            if value is not None and not is_snowflake(value):
+                return JsonResponse(
+                    {"message": f"{name} must be a Discord ID"}, status=400
+                )
+        for serializer_class in self.request_serializers:
+            serializer = serializer_class(data=self.data)
+            if not serializer.is_valid():
+                return JsonResponse(serializer.errors, status=400)
+            self.data.update(serializer.validated_data)
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def authenticate(self, request) -> bool:
+        auth = request.headers.get("Authorization", "").split()
+        if len(auth) != 2 or auth[0].lower() != "token":
+            return False
+        try:
+            token = await Token.objects.select_related("user").aget(key=auth[1])
+        except Token.DoesNotExist:
+            return False
+        if not token.user.is_active:
+            return False
+        request.user = token.user
+        return True
+
+
+class AsyncAddMemberToGuildView(AsyncAPIView):
+    """ギルドにメンバーを追加する非同期APIビュー"""
+
+    request_serializers = (DiscordGuildRequestSerializer, DiscordUserRequestSerializer)
+
+    async def post(self, request, *args, **kwargs):
+        guild = await acreate_or_update_discord_guild(
+            self.data.get("guild_id"), self.data.get("guild_name", "")
+        )
+        user = await acreate_or_update_discord_user(
+            self.data.get("discord_id"), self.data.get("username")
+        )
+        await guild.members.aadd(user)
+        return JsonResponse({"message": "Member added to guild"})
+
+
+class AsyncRemoveMemberFromGuildView(AsyncAPIView):
+    """ギルドからメンバーを削除する非同期APIビュー"""
+
+    request_serializers = (DiscordGuildRequestSerializer, DiscordUserRequestSerializer)
+
+    async def post(self, request, *args, **kwargs):
+        guild = await acreate_or_update_discord_guild(
+            self.data.get("guild_id"), self.data.get("guild_name", "")
+        )
+        user = await acreate_or_update_discord_user(
+            self.data.get("discord_id"), self.data.get("username")
+        )
+        await guild.members.aremove(user)
+        return JsonResponse({"message": "Member removed from guild"})
+
+
+class AsyncIncrementView(AsyncAPIView):
+    """結果のカウンタを1増やす非同期APIビュー
+
+    as_view(game=..., field=...) で対象のゲームとカウンタを指定する。
+    """
+
+    game = None
+    field = None
+    request_serializers = (DiscordUserRequestSerializer,)
+
+    async def post(self, request, *args, **kwargs):
+        user = await acreate_or_update_discord_user(
+            self.data.get("discord_id"), self.data.get("username")
+        )
+        result = await aincrement_result(
+            RESULT_MODELS[self.game], user, **{self.field: 1}
+        )
+        return JsonResponse(RESULT_SERIALIZERS[self.game](result).data)
+
+
+class AsyncLeaderboardView(AsyncAPIView):
+    """ギルド内の結果を並べ替えてページ単位で取得する非同期APIビュー"""
+
+    request_serializers = (DiscordGuildRequestSerializer, LeaderboardRequestSerializer)
+
+    async def get(self, request, game, *args, **kwargs):
+        if game not in RESULT_MODELS:
+            return JsonResponse({"message": "Unknown game"}, status=404)
+        model = RESULT_MODELS[game]
+        serializer_class = RESULT_SERIALIZERS[game]
+        counter_fields = get_counter_fields(model)
+        order_by = self.data.get("order_by") or counter_fields[0]
+        if order_by not in counter_fields:
+            return JsonResponse(
+                {"message": f"order_by must be one of {counter_fields}"}, status=400
+            )
+        limit = self.data.get("limit", LEADERBOARD_DEFAULT_LIMIT)
+        limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+
+        guild = await acreate_or_update_discord_guild(
+            self.data.get("guild_id"), self.data.get("guild_name", "")
+        )
+        try:
+            results, next_cursor = await aget_leaderboard(
+                model, guild, order_by, limit, self.data["cursor"]
+            )
+        except ValueError:
+            return JsonResponse({"message": "Invalid cursor"}, status=400)
+
+        me = None
+        discord_id = self.data.get("discord_id")
+        if discord_id:
+            ranked = await aget_leaderboard_rank(
+                model, guild, int(discord_id), order_by
+            )
+            if ranked is not None:
+                result, rank = ranked
+                me = {**serializer_class(result).data, "rank": rank}
+
+        return JsonResponse(
+            {
+                "order_by": order_by,
+                "results": serializer_class(results, many=True).data,
+                "next_cursor": next_cursor or None,
+                "me": me,
+            }
+        )
+
+
+class AsyncQuizQuestionPopView(AsyncAPIView):
+    """ギルドに出題するクイズの問題をプールから1問取り出す非同期APIビュー"""
+
+    request_serializers = (DiscordGuildRequestSerializer,)
+
+    async def post(self, request, *args, **kwargs):
+        guild = await acreate_or_update_discord_guild(
+            self.data.get("guild_id"), self.data.get("guild_name", "")
+        )
+        question = await apop_quiz_question(guild)
+        if question is None:
+            return JsonResponse({"message": "Question pool is empty"}, status=404)
+        return JsonResponse(QuizQuestionSerializer(question).data)
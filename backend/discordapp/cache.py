@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from django.conf import settings
+
+
+class SnowflakeCache:
+    """Discordのスノーフレーク -> (モデルのPK, 最後に見た名前) のキャッシュ
+
+    プロセス内に保持するTTL付きのLRUキャッシュ。スレッドセーフ。
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict[int, tuple[int, str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: int) -> Optional[tuple[int, str]]:
+        """(PK, 名前) を返す。無い、または期限切れの場合はNone"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            pk, name, expires_at = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return pk, name
+
+    def set(self, key: int, pk: int, name: str) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (pk, name, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: int) -> None:
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# discord_id -> (DiscordUserのPK, username)
+user_cache = SnowflakeCache(
+    maxsize=settings.DISCORD_CACHE_MAX_SIZE, ttl=settings.DISCORD_CACHE_TTL
+)
+
+# guild_id -> (DiscordGuildのPK, name)
+guild_cache = SnowflakeCache(
+    maxsize=settings.DISCORD_CACHE_MAX_SIZE, ttl=settings.DISCORD_CACHE_TTL
+)
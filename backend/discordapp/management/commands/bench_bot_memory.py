@@ -0,0 +1,211 @@
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import discord
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from .commands.gateway import INTENT_PROFILES, client_options
+
+TIMESTAMP = "2024-01-01T00:00:00+00:00"
+
+
+def current_rss() -> int:
+    """プロセスの現在の常駐メモリ（バイト）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # /procが無い環境では最大値で代用する（Linux以外はバイト単位）
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def fake_guild(
+    index: int, members: int, channels: int, voice: int, presences: bool
+) -> dict:
+    """GUILD_CREATE（チャンク済み）に相当するギルドのデータ"""
+    base = (index + 1) * 1_000_000
+    users = [
+        {
+            "id": str(base + 10_000 + i),
+            "username": f"user{i}",
+            "discriminator": "0",
+            "global_name": f"User {i}",
+            "avatar": None,
+        }
+        for i in range(members)
+    ]
+    data = {
+        "id": str(base),
+        "name": f"guild{index}",
+        "owner_id": users[0]["id"],
+        "member_count": members,
+        "features": [],
+        "emojis": [],
+        "roles": [
+            {
+                "id": str(base),
+                "name": "@everyone",
+                "permissions": "0",
+                "position": 0,
+                "color": 0,
+                "hoist": False,
+                "managed": False,
+                "mentionable": False,
+            }
+        ],
+        # 先頭の1つはボイスチャンネル
+        "channels": [
+            {
+                "id": str(base + 1 + i),
+                "type": 2 if i == 0 else 0,
+                "name": f"channel{i}",
+                "position": i,
+                "permission_overwrites": [],
+                "bitrate": 64000,
+                "user_limit": 0,
+            }
+            for i in range(channels)
+        ],
+        "members": [
+            {
+                "user": user,
+                "roles": [],
+                "joined_at": TIMESTAMP,
+                "deaf": False,
+                "mute": False,
+                "flags": 0,
+            }
+            for user in users
+        ],
+        "voice_states": [
+            {
+                "user_id": user["id"],
+                "channel_id": str(base + 1),
+                "session_id": "session",
+                "deaf": False,
+                "mute": False,
+                "self_deaf": False,
+                "self_mute": False,
+                "self_video": False,
+                "suppress": False,
+                "request_to_speak_timestamp": None,
+            }
+            for user in users[:voice]
+        ],
+    }
+    if presences:
+        data["presences"] = [
+            {
+                "user": {"id": user["id"]},
+                "status": "online",
+                "activities": [{"name": "game", "type": 0}],
+                "client_status": {"desktop": "online"},
+            }
+            for user in users
+        ]
+    return data
+
+
+def fake_message(guild: dict, index: int) -> dict:
+    """MESSAGE_CREATEに相当するメッセージのデータ"""
+    member = guild["members"][index % len(guild["members"])]
+    return {
+        "id": str(int(guild["id"]) + 500_000 + index),
+        "channel_id": guild["channels"][-1]["id"],
+        "guild_id": guild["id"],
+        "author": member["user"],
+        "member": {k: v for k, v in member.items() if k != "user"},
+        "content": f"message {index}",
+        "timestamp": TIMESTAMP,
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+
+class Command(BaseCommand):
+    help = "measures bot cache memory (RSS per 1,000 guilds) for each intents profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--guilds", type=int, default=1000)
+        parser.add_argument("--members", type=int, default=200)
+        parser.add_argument("--channels", type=int, default=20)
+        parser.add_argument("--voice", type=int, default=5)
+        parser.add_argument("--messages", type=int, default=50)
+        # 1つのプロファイルだけを測ってJSONで出力する（内部用）
+        parser.add_argument("--profile", choices=INTENT_PROFILES)
+
+    def handle(self, *args, **options):
+        if options["profile"]:
+            self.stdout.write(json.dumps(self.measure(options["profile"], options)))
+            return
+
+        # 前の測定で確保したメモリが残らないよう、プロファイルごとに別プロセスで測る
+        self.stdout.write(
+            f"{options['guilds']} guilds x {options['members']} members, "
+            f"{options['voice']} in voice, {options['messages']} messages each"
+        )
+        for profile in INTENT_PROFILES:
+            command = [
+                sys.executable,
+                str(settings.BASE_DIR / "manage.py"),
+                "bench_bot_memory",
+                f"--profile={profile}",
+            ]
+            for name in ("guilds", "members", "channels", "voice", "messages"):
+                command.append(f"--{name}={options[name]}")
+            output = subprocess.run(
+                command, capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            per_1000 = result["rss"] / result["guilds"] * 1000 / 2**20
+            self.stdout.write(
+                f"{profile:>8}: {per_1000:8.1f} MiB RSS / 1,000 guilds "
+                f"({result['cached_members']} members, "
+                f"{result['cached_messages']} messages cached, "
+                f"{result['seconds']:.2f}s to parse)"
+            )
+
+    def measure(self, profile: str, options: dict) -> dict:
+        client = discord.Client(**client_options(profile))
+        state = client._connection
+        intents = state._intents
+        gc.collect()
+        baseline = current_rss()
+        started = time.perf_counter()
+        for index in range(options["guilds"]):
+            # 受け取らないイベントはDiscordから送られてこない
+            data = fake_guild(
+                index,
+                options["members"],
+                options["channels"],
+                options["voice"] if intents.voice_states else 0,
+                intents.presences,
+            )
+            state._add_guild_from_data(data)
+            if intents.guild_messages:
+                for i in range(options["messages"]):
+                    state.parse_message_create(fake_message(data, i))
+        seconds = time.perf_counter() - started
+        gc.collect()
+        return {
+            "profile": profile,
+            "guilds": options["guilds"],
+            "rss": current_rss() - baseline,
+            "cached_members": sum(len(g.members) for g in client.guilds),
+            "cached_messages": len(state._messages or ()),
+            "seconds": seconds,
+        }
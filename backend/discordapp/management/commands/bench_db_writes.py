@@ -0,0 +1,80 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from discordapp.mixins import create_or_update_discord_user, increment_result
+from discordapp.models import QuizResult
+
+# ベンチマーク用ユーザーのスノーフレークの開始値
+USER_ID_BASE = 900_000_000_000_000_000
+
+
+class Command(BaseCommand):
+    help = (
+        "measures counter increment throughput of the configured database "
+        "(runs against a scratch test database)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--seconds", type=float, default=5.0)
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=10,
+            help="number of users the increments are spread over",
+        )
+
+    def handle(self, *args, **options):
+        threads = options["threads"]
+        seconds = options["seconds"]
+        vendor = connection.vendor
+        # 本番データを汚さないよう、テスト用DBを作って計測後に削除する
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            users = [
+                create_or_update_discord_user(USER_ID_BASE + i, f"bench {i}")
+                for i in range(options["users"])
+            ]
+            done = [0] * threads
+            errors = [0] * threads
+            barrier = threading.Barrier(threads + 1)
+            deadline = [0.0]
+
+            def worker(index):
+                try:
+                    barrier.wait()
+                    while time.perf_counter() < deadline[0]:
+                        user = users[(index + done[index]) % len(users)]
+                        try:
+                            increment_result(QuizResult, user, correct_count=1)
+                            done[index] += 1
+                        except Exception:
+                            errors[index] += 1
+                finally:
+                    connection.close()
+
+            workers = [
+                threading.Thread(target=worker, args=(i,)) for i in range(threads)
+            ]
+            for thread in workers:
+                thread.start()
+            deadline[0] = time.perf_counter() + seconds
+            started = time.perf_counter()
+            barrier.wait()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            stored = sum(QuizResult.objects.values_list("correct_count", flat=True))
+            total = sum(done)
+            self.stdout.write(f"backend:     {vendor}")
+            self.stdout.write(f"threads:     {threads}")
+            self.stdout.write(f"increments:  {total}")
+            self.stdout.write(f"errors:      {sum(errors)}")
+            self.stdout.write(f"lost:        {total - stored}")
+            self.stdout.write(f"throughput:  {total / elapsed:.1f} writes/s")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
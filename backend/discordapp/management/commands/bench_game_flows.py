@@ -0,0 +1,153 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from .commands.bluff_number import bluff_number_views
+from .commands.bluff_number.bluff_number_store import MemoryGameStore
+from .commands.fake_discord import GAME_FLOWS, FakeDiscord
+from .loadtest import percentile
+
+
+class LoopLagProbe:
+    """イベントループの遅延の最大値を測る"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._sample())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _sample(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, time.monotonic() - expected)
+
+
+async def run_games(discord_: FakeDiscord, game: str, games: int) -> dict:
+    """gameをgames個同時に最後まで遊び、かかった時間とCPU時間を返す"""
+    players, play = GAME_FLOWS[game]
+    durations = []
+
+    async def one(index):
+        guild = discord_.guild(f"guild{index}")
+        members = [guild.member(f"player{index}-{i}") for i in range(players)]
+        started = time.monotonic()
+        await play(discord_, guild.text_channel(), members)
+        durations.append(time.monotonic() - started)
+
+    probe = LoopLagProbe()
+    probe.start()
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    try:
+        results = await asyncio.gather(
+            *(one(i) for i in range(games)), return_exceptions=True
+        )
+    finally:
+        await probe.stop()
+    failed = [r for r in results if isinstance(r, BaseException)]
+    for error in failed[:3]:
+        print(f"{game} failed: {error!r}")
+    return {
+        "games": games - len(failed),
+        "failed": len(failed),
+        "wall": time.perf_counter() - started,
+        "cpu": time.process_time() - cpu_started,
+        "duration": sum(durations) / len(durations) if durations else 0.0,
+        "max_lag": probe.max_lag,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "plays whole game flows against an in-process Discord stand-in and "
+        "reports CPU time, event loop lag and Discord API calls per game"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--games", type=int, default=50, help="concurrent games per game type"
+        )
+        parser.add_argument(
+            "--game",
+            action="append",
+            choices=sorted(GAME_FLOWS),
+            help="game types to play (default: all)",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.05,
+            help="seconds each Discord API call takes",
+        )
+        parser.add_argument(
+            "--burst",
+            type=int,
+            default=5,
+            help="channel message sends/edits/deletes allowed per --per seconds",
+        )
+        parser.add_argument("--per", type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        if options["games"] < 1:
+            raise CommandError("--games must be at least 1")
+        # Bot側の処理だけを測るため、ゲームの状態はメモリに保存する
+        store = bluff_number_views.game_store
+        bluff_number_views.game_store = MemoryGameStore()
+        try:
+            for game in options["game"] or sorted(GAME_FLOWS):
+                self.report(game, asyncio.run(self.bench(game, options)))
+        finally:
+            bluff_number_views.game_store = store
+
+    async def bench(self, game: str, options: dict) -> tuple[FakeDiscord, dict]:
+        discord_ = FakeDiscord(
+            latency=options["latency"], burst=options["burst"], per=options["per"]
+        )
+        return discord_, await run_games(discord_, game, options["games"])
+
+    def report(self, game: str, result: tuple[FakeDiscord, dict]) -> None:
+        discord_, stats = result
+        games = max(stats["games"], 1)
+        cpu_per_game = stats["cpu"] / games
+        api_calls = sum(discord_.client.api.calls.values())
+        self.stdout.write(f"{game}:")
+        self.stdout.write(
+            f"  games:          {stats['games']} concurrent ({stats['failed']} failed)"
+        )
+        self.stdout.write(
+            f"  wall:           {stats['wall']:.2f}s "
+            f"(mean game {stats['duration']:.2f}s)"
+        )
+        self.stdout.write(
+            f"  cpu:            {stats['cpu']:.2f}s "
+            f"({cpu_per_game * 1000:.1f}ms per game)"
+        )
+        self.stdout.write(f"  max loop lag:   {stats['max_lag'] * 1000:.1f}ms")
+        self.stdout.write(
+            f"  rate limited:   {discord_.rate_limited} calls "
+            f"({discord_.rate_limit_wait / games:.1f}s waited per game)"
+        )
+        if discord_.response_latencies:
+            p95 = percentile(sorted(discord_.response_latencies), 95)
+            self.stdout.write(f"  response p95:   {p95 * 1000:.1f}ms")
+        self.stdout.write(f"  backend calls:  {api_calls / games:.1f} per game")
+        self.stdout.write("  discord calls per game:")
+        for route, count in sorted(
+            discord_.calls.items(), key=lambda item: (-item[1], item[0])
+        ):
+            self.stdout.write(f"    {route:<34}{count / games:8.1f}")
+        if cpu_per_game > 0:
+            # 1コアで同時に進められるゲームの数の目安
+            self.stdout.write(
+                f"  sustainable:    ~{stats['duration'] / cpu_per_game:.0f} "
+                "concurrent games per core"
+            )
@@ -0,0 +1,51 @@
+import json
+import re
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from .commands.quiz_parser import is_valid_quiz, parse_quizzes
+
+CORPUS_PATH = Path(__file__).resolve().parents[2] / "testdata" / "quiz_outputs.json"
+
+
+def legacy_parse(content: str) -> list[dict]:
+    """以前の実装（最初の { から最初の } までを読む）"""
+    match = re.search(r"({[\s\S]*?})", content)
+    if match:
+        try:
+            q = json.loads(match.group(1))
+        except ValueError:
+            return []
+        return [q] if is_valid_quiz(q) else []
+    return []
+
+
+class Command(BaseCommand):
+    help = "measures quiz parser throughput over the model output test corpus"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        cases = json.loads(CORPUS_PATH.read_text(encoding="utf-8"))
+        outputs = [case["output"] for case in cases]
+        expected = sum(len(case["expected"]) for case in cases)
+        size = sum(len(output.encode()) for output in outputs)
+
+        for name, parse in (("parse_quizzes", parse_quizzes), ("legacy", legacy_parse)):
+            found = sum(len(parse(output)) for output in outputs)
+            started = time.perf_counter()
+            for _ in range(iterations):
+                for output in outputs:
+                    parse(output)
+            elapsed = time.perf_counter() - started
+            parses = iterations * len(outputs)
+            self.stdout.write(f"{name}:")
+            self.stdout.write(f"  quizzes:     {found}/{expected}")
+            self.stdout.write(f"  throughput:  {parses / elapsed:.0f} outputs/s")
+            self.stdout.write(
+                f"  bandwidth:   {size * iterations / elapsed / 1e6:.1f} MB/s"
+            )
@@ -0,0 +1,202 @@
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+
+from discordapp.models import DiscordUser, QuizResult
+
+from .bench_db_writes import USER_ID_BASE
+
+BATCH_SIZE = 5000
+
+LEGACY_USER_TABLE = "bench_legacy_discorduser"
+LEGACY_RESULT_TABLE = "bench_legacy_quizresult"
+
+
+def create_legacy_tables() -> None:
+    """UUIDの主キーと文字列のDiscord IDを使っていた頃と同じ形の表を作る"""
+    uuid_type = models.UUIDField().db_type(connection)
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {qn(LEGACY_USER_TABLE)} ("
+            f"id {uuid_type} NOT NULL PRIMARY KEY, "
+            "discord_id varchar(255) NOT NULL UNIQUE, "
+            "username varchar(255) NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE TABLE {qn(LEGACY_RESULT_TABLE)} ("
+            f"id {uuid_type} NOT NULL PRIMARY KEY, "
+            f"user_id {uuid_type} NOT NULL UNIQUE "
+            f"REFERENCES {qn(LEGACY_USER_TABLE)} (id), "
+            "correct_count integer NOT NULL, "
+            "failed_count integer NOT NULL)"
+        )
+        # リーダーボード用のインデックスも当時と同じくUUIDのPKを含める
+        for column in ["correct_count", "failed_count"]:
+            cursor.execute(
+                f"CREATE INDEX {qn(f'bench_legacy_{column}_idx')} "
+                f"ON {qn(LEGACY_RESULT_TABLE)} ({column} DESC, id)"
+            )
+
+
+def fill_legacy_tables(snowflakes: list[int]) -> None:
+    to_db = models.UUIDField().get_db_prep_value
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for start in range(0, len(snowflakes), BATCH_SIZE):
+            users = []
+            results = []
+            for snowflake in snowflakes[start : start + BATCH_SIZE]:
+                user_id = to_db(uuid.uuid4(), connection)
+                users.append((user_id, str(snowflake), f"user {snowflake}"))
+                results.append(
+                    (to_db(uuid.uuid4(), connection), user_id, snowflake % 100, 0)
+                )
+            with transaction.atomic():
+                cursor.executemany(
+                    f"INSERT INTO {qn(LEGACY_USER_TABLE)} "
+                    "(id, discord_id, username) VALUES (%s, %s, %s)",
+                    users,
+                )
+                cursor.executemany(
+                    f"INSERT INTO {qn(LEGACY_RESULT_TABLE)} "
+                    "(id, user_id, correct_count, failed_count) "
+                    "VALUES (%s, %s, %s, %s)",
+                    results,
+                )
+
+
+def fill_snowflake_tables(snowflakes: list[int]) -> None:
+    for start in range(0, len(snowflakes), BATCH_SIZE):
+        batch = snowflakes[start : start + BATCH_SIZE]
+        with transaction.atomic():
+            DiscordUser.objects.bulk_create(
+                DiscordUser(discord_id=snowflake, username=f"user {snowflake}")
+                for snowflake in batch
+            )
+            QuizResult.objects.bulk_create(
+                QuizResult(user_id=snowflake, correct_count=snowflake % 100)
+                for snowflake in batch
+            )
+
+
+def relation_sizes(tables: list[str]) -> tuple[int, int]:
+    """tablesの本体とインデックスの合計バイト数を返す"""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT COALESCE(SUM(pg_relation_size(t::regclass)), 0), "
+                "COALESCE(SUM(pg_indexes_size(t::regclass)), 0) "
+                "FROM unnest(%s::text[]) AS t",
+                [tables],
+            )
+            return tuple(cursor.fetchone())
+        if connection.vendor == "sqlite":
+            placeholders = ", ".join(["%s"] * len(tables))
+            cursor.execute(
+                "SELECT m.type, SUM(s.pgsize) FROM dbstat AS s "
+                "JOIN sqlite_master AS m ON m.name = s.name "
+                f"WHERE m.tbl_name IN ({placeholders}) GROUP BY m.type",
+                tables,
+            )
+            sizes = dict(cursor.fetchall())
+            return sizes.get("table", 0), sizes.get("index", 0)
+    raise CommandError(f"sizes are not supported on {connection.vendor}")
+
+
+def time_lookups(sql: str, params: list) -> float:
+    """1件ずつsqlを実行し、1回あたりの秒数を返す"""
+    with connection.cursor() as cursor:
+        started = time.perf_counter()
+        for param in params:
+            cursor.execute(sql, [param])
+            if cursor.fetchone() is None:
+                raise CommandError(f"no row for {param}")
+        return (time.perf_counter() - started) / len(params)
+
+
+class Command(BaseCommand):
+    help = (
+        "compares table/index size and lookup latency of UUID primary keys with "
+        "string Discord IDs against snowflake primary keys "
+        "(runs against a scratch test database)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1_000_000)
+        parser.add_argument(
+            "--lookups", type=int, default=20_000, help="random lookups to time"
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["lookups"] < 1:
+            raise CommandError("--users and --lookups must be at least 1")
+        vendor = connection.vendor
+        if vendor not in ("postgresql", "sqlite"):
+            raise CommandError(f"sizes are not supported on {vendor}")
+        # 本番データを汚さないよう、テスト用DBを作って計測後に削除する
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            rng = random.Random(0)
+            # 実際のIDと同じく、登録順とほぼ同じ順に増えるスノーフレークにする
+            snowflakes = [
+                USER_ID_BASE + (i << 22) + rng.randrange(1 << 22)
+                for i in range(options["users"])
+            ]
+            create_legacy_tables()
+
+            started = time.perf_counter()
+            fill_legacy_tables(snowflakes)
+            legacy_insert = time.perf_counter() - started
+            started = time.perf_counter()
+            fill_snowflake_tables(snowflakes)
+            snowflake_insert = time.perf_counter() - started
+
+            if vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+            legacy_size = relation_sizes([LEGACY_USER_TABLE, LEGACY_RESULT_TABLE])
+            snowflake_size = relation_sizes(
+                [DiscordUser._meta.db_table, QuizResult._meta.db_table]
+            )
+
+            # Botから届くのは文字列のIDなので、旧形式は文字列で引く
+            sample = rng.choices(snowflakes, k=options["lookups"])
+            qn = connection.ops.quote_name
+            legacy_lookup = time_lookups(
+                f"SELECT r.correct_count FROM {qn(LEGACY_RESULT_TABLE)} AS r "
+                f"JOIN {qn(LEGACY_USER_TABLE)} AS u ON u.id = r.user_id "
+                "WHERE u.discord_id = %s",
+                [str(snowflake) for snowflake in sample],
+            )
+            snowflake_lookup = time_lookups(
+                f"SELECT correct_count FROM {qn(QuizResult._meta.db_table)} "
+                "WHERE user_id = %s",
+                sample,
+            )
+
+            mib = 1024 * 1024
+            self.stdout.write(f"backend:  {vendor}")
+            self.stdout.write(f"users:    {options['users']} (users + quiz results)")
+            self.stdout.write(
+                f"{'':10}{'table MiB':>12}{'index MiB':>12}"
+                f"{'insert s':>12}{'lookup us':>12}"
+            )
+            for name, (table, index), insert, lookup in [
+                ("uuid", legacy_size, legacy_insert, legacy_lookup),
+                ("snowflake", snowflake_size, snowflake_insert, snowflake_lookup),
+            ]:
+                self.stdout.write(
+                    f"{name:<10}{table / mib:>12.1f}{index / mib:>12.1f}"
+                    f"{insert:>12.2f}{lookup * 1e6:>12.1f}"
+                )
+            if snowflake_size[1] and snowflake_lookup:
+                self.stdout.write(
+                    f"index size: {legacy_size[1] / snowflake_size[1]:.2f}x smaller, "
+                    f"lookup: {legacy_lookup / snowflake_lookup:.2f}x faster"
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
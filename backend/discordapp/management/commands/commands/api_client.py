@@ -0,0 +1,452 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+
+import aiohttp
+from django.conf import settings
+
+from .instrumentation import record_backend_wait
+from .resilience import CircuitBreaker, ResilientCaller, RetryPolicy
+
+
+@dataclass
+class APIResponse:
+    """バックエンドAPIのレスポンス（本文は読み込み済み）"""
+
+    status_code: int
+    data: Any = None
+    retry_after: Optional[float] = None
+
+    def json(self) -> Any:
+        return self.data
+
+
+class APIAuthError(Exception):
+    """バックエンドAPIにログインできなかった"""
+
+
+class TokenManager:
+    """バックエンドAPIのトークンをキャッシュし、必要になったときだけ取得する
+
+    トークンはメモリと、cache_pathを指定した場合はファイルにも保持するので、
+    再起動してもログインし直さずに済む。トークンの検証は実際のリクエストに任せ、
+    401が返ったときにrefresh()で取り直す。取得はロックで1本にまとめるため、
+    多数のリクエストが同時に401を受けても再ログインは1回だけになる。
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Awaitable[str]],
+        cache_path: Optional[str] = None,
+    ):
+        self._fetch = fetch
+        self.cache_path = Path(cache_path) if cache_path else None
+        self._token = self._load()
+        self._lock = asyncio.Lock()
+        self._generation = 0
+        self._last_error: Optional[BaseException] = None
+
+    @property
+    def token(self) -> str:
+        return self._token
+
+    async def get(self) -> str:
+        """キャッシュ済みのトークンを返す。無ければ取得する"""
+        if self._token:
+            return self._token
+        return await self.refresh(stale="")
+
+    async def refresh(self, stale: str) -> str:
+        """staleが拒否されたトークンのとき、新しいトークンを取得する"""
+        generation = self._generation
+        async with self._lock:
+            # ロック待ちの間に他のリクエストが取り直していれば、それを使う
+            if self._token and self._token != stale:
+                return self._token
+            # 待っている間の取得が失敗していれば、ログインを繰り返さずに同じ失敗を返す
+            if self._generation != generation and self._last_error is not None:
+                raise self._last_error
+            self._token = ""
+            try:
+                token = await self._fetch()
+            except Exception as e:
+                self._last_error = e
+                raise
+            finally:
+                self._generation += 1
+            self._last_error = None
+            self._token = token
+            self._save(token)
+            return token
+
+    def _load(self) -> str:
+        if self.cache_path is None:
+            return ""
+        try:
+            return self.cache_path.read_text().strip()
+        except OSError:
+            return ""
+
+    def _save(self, token: str) -> None:
+        if self.cache_path is None:
+            return
+        try:
+            fd = os.open(self.cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(token)
+        except OSError:
+            # キャッシュファイルに書けなくてもメモリ上のトークンで動かせる
+            pass
+
+
+class APIClient:
+    """バックエンドAPIを非同期で呼び出すクライアント
+
+    1つのaiohttp.ClientSessionを共有し、キープアライブ接続をプールして使い回す。
+    セッションはイベントループ上で作る必要があるため、start()で生成する。
+    ログインは最初に認証が必要になったときに行うので、起動時にバックエンドが
+    動いている必要はない。
+    再試行とサーキットブレーカーはResilientCallerに任せ、GET以外（カウンタの
+    加算など）は二重に処理されない失敗だけを再試行する。
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        timeout: Optional[float] = None,
+        connect_timeout: Optional[float] = None,
+        pool_size: Optional[int] = None,
+        token_cache_path: Optional[str] = None,
+        backoff: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+    ):
+        self.base_url = (base_url or settings.API_BASE_URL).rstrip("/")
+        self.timeout = aiohttp.ClientTimeout(
+            total=timeout if timeout is not None else settings.API_TIMEOUT,
+            connect=(
+                connect_timeout
+                if connect_timeout is not None
+                else settings.API_CONNECT_TIMEOUT
+            ),
+        )
+        self.pool_size = pool_size if pool_size is not None else settings.API_POOL_SIZE
+        self.caller = ResilientCaller(
+            RetryPolicy(
+                attempts=settings.API_RETRY_ATTEMPTS,
+                backoff=backoff if backoff is not None else settings.API_RETRY_BACKOFF,
+                backoff_max=(
+                    backoff_max
+                    if backoff_max is not None
+                    else settings.API_RETRY_BACKOFF_MAX
+                ),
+            ),
+            CircuitBreaker(
+                failure_threshold=settings.API_CIRCUIT_FAILURE_THRESHOLD,
+                reset_timeout=settings.API_CIRCUIT_RESET_TIMEOUT,
+            ),
+        )
+        self.tokens = TokenManager(
+            self._fetch_token,
+            (
+                token_cache_path
+                if token_cache_path is not None
+                else settings.API_TOKEN_CACHE_FILE
+            ),
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        """接続プールを持つセッションを生成する"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout
+            )
+
+    async def close(self) -> None:
+        """セッションを閉じて接続を解放する"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _send(
+        self, method: str, url: str, payload: Any, token: Optional[str]
+    ) -> APIResponse:
+        headers = {"Authorization": f"Token {token}"} if token is not None else {}
+        async with self._session.request(
+            method, url, headers=headers, json=payload
+        ) as res:
+            try:
+                data = await res.json(content_type=None)
+            except ValueError:
+                data = None
+            try:
+                retry_after = float(res.headers["Retry-After"])
+            except (KeyError, ValueError):
+                retry_after = None
+            return APIResponse(
+                status_code=res.status, data=data, retry_after=retry_after
+            )
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        payload: Any,
+        auth: bool = True,
+        idempotent: Optional[bool] = None,
+    ) -> APIResponse:
+        if self._session is None or self._session.closed:
+            await self.start()
+        if idempotent is None:
+            idempotent = method == "GET"
+        url = f"{self.base_url}/{path}"
+        started = time.perf_counter()
+        try:
+            token = await self.tokens.get() if auth else None
+            response = await self.caller.call(
+                lambda: self._send(method, url, payload, token), idempotent
+            )
+            if auth and response.status_code == 401:
+                # トークンが失効している。取り直して1回だけやり直す
+                token = await self.tokens.refresh(stale=token)
+                response = await self.caller.call(
+                    lambda: self._send(method, url, payload, token), idempotent
+                )
+            return response
+        finally:
+            # 実行中のスラッシュコマンドがバックエンドを待った時間として記録する
+            # （ログインはトークンを待つ外側の呼び出しに含まれる）
+            if auth:
+                record_backend_wait(time.perf_counter() - started)
+
+    def metrics(self) -> dict:
+        """再試行とサーキットブレーカーの統計"""
+        return self.caller.metrics()
+
+    async def _get(self, path: str, payload: dict) -> APIResponse:
+        return await self._request("GET", path, payload)
+
+    async def _post(self, path: str, payload: Any) -> APIResponse:
+        return await self._request("POST", path, payload)
+
+    # --- 認証 ---
+
+    async def login(self) -> APIResponse:
+        """ログインしてトークンを取り直す"""
+        await self.tokens.refresh(stale=self.tokens.token)
+        return APIResponse(status_code=200, data={"token": self.tokens.token})
+
+    @property
+    def token(self) -> str:
+        return self.tokens.token
+
+    async def _fetch_token(self) -> str:
+        res = await self._request(
+            "POST",
+            "login/",
+            {
+                "username": settings.ADMIN_USERNAME,
+                "password": settings.ADMIN_PASSWORD,
+            },
+            auth=False,
+            idempotent=True,
+        )
+        token = res.data.get("token", "") if isinstance(res.data, dict) else ""
+        if res.status_code != 200 or not token:
+            raise APIAuthError(f"login failed with status {res.status_code}")
+        return token
+
+    # --- ギルド ---
+
+    async def add_member_to_guild(self, guild_id, guild_name, discord_id, username):
+        return await self._post(
+            "guild/add-member/",
+            {
+                "guild_id": guild_id,
+                "guild_name": guild_name,
+                "discord_id": discord_id,
+                "username": username,
+            },
+        )
+
+    async def remove_member_from_guild(
+        self, guild_id, guild_name, discord_id, username
+    ):
+        return await self._post(
+            "guild/remove-member/",
+            {
+                "guild_id": guild_id,
+                "guild_name": guild_name,
+                "discord_id": discord_id,
+                "username": username,
+            },
+        )
+
+    async def sync_guild_members(
+        self, guild_id, guild_name, members: list[dict], after: str, final: bool
+    ):
+        """IDの昇順に区切ったメンバー一覧の1区切りを同期する（何度送っても同じ結果）"""
+        return await self._request(
+            "POST",
+            "guild/sync-members/",
+            {
+                "guild_id": guild_id,
+                "guild_name": guild_name,
+                "members": members,
+                "after": after,
+                "final": final,
+            },
+            idempotent=True,
+        )
+
+    # --- クイズ ---
+
+    async def quiz_result_list(self, guild_id, guild_name):
+        return await self._get(
+            "quiz-results/", {"guild_id": guild_id, "guild_name": guild_name}
+        )
+
+    async def quiz_result_retrieve(self, discord_id, username):
+        return await self._get(
+            "quiz-result/", {"discord_id": discord_id, "username": username}
+        )
+
+    async def quiz_result_plus(self, discord_id, username):
+        return await self._post(
+            "quiz-result/plus/", {"discord_id": discord_id, "username": username}
+        )
+
+    async def quiz_result_minus(self, discord_id, username):
+        return await self._post(
+            "quiz-result/minus/", {"discord_id": discord_id, "username": username}
+        )
+
+    async def quiz_question_pool(self):
+        """まだ出題していない問題の数を取得する"""
+        return await self._get("quiz/questions/", {})
+
+    async def quiz_question_add(self, questions: list[dict]):
+        return await self._post("quiz/questions/", questions)
+
+    async def quiz_question_pop(self, guild_id, guild_name):
+        return await self._post(
+            "quiz/questions/pop/", {"guild_id": guild_id, "guild_name": guild_name}
+        )
+
+    # --- 寝坊 ---
+
+    async def overslept_result_list(self, guild_id, guild_name):
+        return await self._get(
+            "overslept-results/", {"guild_id": guild_id, "guild_name": guild_name}
+        )
+
+    async def overslept_result_retrieve(self, discord_id, username):
+        return await self._get(
+            "overslept-result/", {"discord_id": discord_id, "username": username}
+        )
+
+    async def overslept_result_plus(self, discord_id, username):
+        return await self._post(
+            "overslept-result/plus/",
+            {"discord_id": discord_id, "username": username},
+        )
+
+    # --- 予測 ---
+
+    async def prediction_result_list(self, guild_id, guild_name):
+        return await self._get(
+            "prediction-results/", {"guild_id": guild_id, "guild_name": guild_name}
+        )
+
+    async def prediction_result_retrieve(self, discord_id, username):
+        return await self._get(
+            "prediction-result/", {"discord_id": discord_id, "username": username}
+        )
+
+    async def prediction_result_plus(self, discord_id, username):
+        return await self._post(
+            "prediction-result/plus/",
+            {"discord_id": discord_id, "username": username},
+        )
+
+    async def prediction_result_minus(self, discord_id, username):
+        return await self._post(
+            "prediction-result/minus/",
+            {"discord_id": discord_id, "username": username},
+        )
+
+    # --- ブラフナンバー ---
+
+    async def bluff_number_result_list(self, guild_id, guild_name):
+        return await self._get(
+            "bluff-number/results/", {"guild_id": guild_id, "guild_name": guild_name}
+        )
+
+    async def bluff_number_result_retrieve(self, discord_id, username):
+        return await self._get(
+            "bluff-number/result/", {"discord_id": discord_id, "username": username}
+        )
+
+    async def bluff_number_result_play(self, discord_id, username):
+        return await self._post(
+            "bluff-number/play/", {"discord_id": discord_id, "username": username}
+        )
+
+    async def bluff_number_result_win(self, discord_id, username):
+        return await self._post(
+            "bluff-number/win/", {"discord_id": discord_id, "username": username}
+        )
+
+    # --- フラッシュ暗算 ---
+
+    async def flash_result_list(self, guild_id, guild_name):
+        return await self._get(
+            "flash/results/", {"guild_id": guild_id, "guild_name": guild_name}
+        )
+
+    async def flash_result_retrieve(self, discord_id, username):
+        return await self._get(
+            "flash/result/", {"discord_id": discord_id, "username": username}
+        )
+
+    async def flash_result_play(self, discord_id, username):
+        return await self._post(
+            "flash/play/", {"discord_id": discord_id, "username": username}
+        )
+
+    async def flash_result_correct(self, discord_id, username):
+        return await self._post(
+            "flash/correct/", {"discord_id": discord_id, "username": username}
+        )
+
+    # --- リーダーボード ---
+
+    async def leaderboard(
+        self,
+        game,
+        guild_id,
+        guild_name,
+        order_by=None,
+        limit=None,
+        cursor=None,
+        discord_id=None,
+    ):
+        payload = {"guild_id": guild_id, "guild_name": guild_name}
+        optional = {
+            "order_by": order_by,
+            "limit": limit,
+            "cursor": cursor,
+            "discord_id": discord_id,
+        }
+        payload.update({key: value for key, value in optional.items() if value})
+        return await self._get(f"leaderboard/{game}/", payload)
+
+    # --- 結果のまとめて送信 ---
+
+    async def result_batch(self, events: list[dict]):
+        """{game, discord_id, username, field, delta} のイベント列を1回で送る"""
+        return await self._post("results/batch/", events)
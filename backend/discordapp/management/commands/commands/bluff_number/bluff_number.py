@@ -2,7 +2,8 @@ import discord
 from discord import app_commands
 
 from .bluff_number_game import BluffNumberGame
-from .bluff_number_views import LobbyView, active_games, game_messages
+from .bluff_number_store import game_store
+from .bluff_number_views import LobbyView, active_games, end_game, start_lobby
 
 
 @app_commands.command(
@@ -11,13 +12,22 @@ from .bluff_number_views import LobbyView, active_games, game_messages
 async def bluff_number(interaction: discord.Interaction):
     channel_id = interaction.channel_id
 
+    # 放置されたゲームが残っていたら終了してチャンネルを空ける
+    game = active_games.get(channel_id)
+    if game is not None and game_store.is_expired(game):
+        await end_game(game)
+
     if channel_id in active_games:
         await interaction.response.send_message(
             "このチャンネルでは既にゲームが進行中です。", ephemeral=True
         )
         return
 
-    game = BluffNumberGame(channel_id=channel_id, host_user_id=interaction.user.id)
+    game = BluffNumberGame(
+        channel_id=channel_id,
+        host_user_id=interaction.user.id,
+        guild_id=interaction.guild_id,
+    )
     active_games[channel_id] = game
 
     # コマンド実行者を自動参加
@@ -52,4 +62,4 @@ async def bluff_number(interaction: discord.Interaction):
 
     # ロビーメッセージを記録
     lobby_msg = await interaction.original_response()
-    game_messages[channel_id] = [lobby_msg]
\ No newline at end of file
+    await start_lobby(game, view, lobby_msg)
\ No newline at end of file
@@ -1,5 +1,6 @@
 import random
-from dataclasses import dataclass, field
+import time
+from dataclasses import asdict, dataclass, field
 from enum import Enum
 from typing import Optional
 
@@ -42,16 +43,27 @@ class BluffNumberGame:
     MAX_ROUNDS = 3
     MIN_NUMBER = 1
     MAX_NUMBER = 10
+    SNAPSHOT_VERSION = 1
 
-    def __init__(self, channel_id: int, host_user_id: int):
+    def __init__(
+        self, channel_id: int, host_user_id: int, guild_id: Optional[int] = None
+    ):
         self.channel_id = channel_id
         self.host_user_id = host_user_id
+        self.guild_id = guild_id  # シャードごとに再開するゲームを分けるため
         self.players: list[Player] = []
         self.phase = GamePhase.LOBBY
         self.current_round: Optional[RoundState] = None
         self.round_number = 0
         self.round_logs: list[RoundLog] = []
         self._current_log: Optional[RoundLog] = None
+        # 以下は再起動後に表示を復元するための情報
+        self.message_ids: list[int] = []  # ゲーム中にBotが送ったメッセージ（削除用）
+        self.lobby_message_id: Optional[int] = None
+        self.secret_message_id: Optional[int] = None
+        self.turn_message_id: Optional[int] = None
+        self.deadline: Optional[float] = None  # ロビー/ターンの締め切り（UNIX時刻）
+        self.updated_at = time.time()  # 最後に保存した時刻（放置されたゲームの判定用）
 
     def add_player(self, user_id: int, display_name: str) -> tuple[bool, str]:
         if self.phase != GamePhase.LOBBY:
@@ -221,3 +233,60 @@ class BluffNumberGame:
         for i, p in enumerate(sorted_players):
             lines.append(f"{medals[i]} {p.display_name}: {p.score} ポイント")
         return "\n".join(lines)
+
+    def to_snapshot(self) -> dict:
+        """ゲームの状態をJSONにできる辞書にする。"""
+        return {
+            "v": self.SNAPSHOT_VERSION,
+            "channel": self.channel_id,
+            "guild": self.guild_id,
+            "host": self.host_user_id,
+            "phase": self.phase.value,
+            "round": self.round_number,
+            "players": [
+                [p.user_id, p.display_name, p.score, p.secret_number]
+                for p in self.players
+            ],
+            "state": asdict(self.current_round) if self.current_round else None,
+            "logs": [asdict(log) for log in self.round_logs],
+            "log": asdict(self._current_log) if self._current_log else None,
+            "messages": self.message_ids,
+            "lobby": self.lobby_message_id,
+            "secret": self.secret_message_id,
+            "turn": self.turn_message_id,
+            "deadline": self.deadline,
+            "updated": self.updated_at,
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> "BluffNumberGame":
+        """to_snapshot()の辞書からゲームを復元する。"""
+        if data.get("v") != cls.SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version: {data.get('v')}")
+        game = cls(
+            channel_id=data["channel"],
+            host_user_id=data["host"],
+            guild_id=data.get("guild"),
+        )
+        game.phase = GamePhase(data["phase"])
+        game.round_number = data["round"]
+        game.players = [
+            Player(user_id=u, display_name=n, score=s, secret_number=x)
+            for u, n, s, x in data["players"]
+        ]
+        game.current_round = RoundState(**data["state"]) if data["state"] else None
+        game.round_logs = [RoundLog(**log) for log in data["logs"]]
+        # 進行中のラウンドの履歴は、終わるとround_logsの末尾と同じものになる
+        if data["log"] is None:
+            game._current_log = None
+        elif game.round_logs and asdict(game.round_logs[-1]) == data["log"]:
+            game._current_log = game.round_logs[-1]
+        else:
+            game._current_log = RoundLog(**data["log"])
+        game.message_ids = list(data["messages"])
+        game.lobby_message_id = data["lobby"]
+        game.secret_message_id = data["secret"]
+        game.turn_message_id = data["turn"]
+        game.deadline = data["deadline"]
+        game.updated_at = data["updated"]
+        return game
@@ -0,0 +1,86 @@
+import time
+from typing import Optional
+
+from django.conf import settings
+
+from discordapp.models import BluffNumberGameState
+
+from .bluff_number_game import BluffNumberGame
+
+
+class MemoryGameStore:
+    """ゲームの状態をプロセスのメモリに保存する（再起動すると消える）。"""
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else settings.BLUFF_NUMBER_GAME_TTL
+        self._snapshots: dict[int, dict] = {}
+
+    def is_expired(self, game: BluffNumberGame, now: Optional[float] = None) -> bool:
+        """ttl秒以上更新されていない（放置された）ゲームか"""
+        now = time.time() if now is None else now
+        return now - game.updated_at >= self.ttl
+
+    async def save(self, game: BluffNumberGame) -> None:
+        game.updated_at = time.time()
+        self._snapshots[game.channel_id] = game.to_snapshot()
+
+    async def delete(self, channel_id: int) -> None:
+        self._snapshots.pop(channel_id, None)
+
+    async def load_all(self) -> list[BluffNumberGame]:
+        """保存されているゲームを復元する。放置されたゲームは削除する。"""
+        games = []
+        for channel_id, snapshot in list(self._snapshots.items()):
+            game = _restore(snapshot)
+            if game is None or self.is_expired(game):
+                del self._snapshots[channel_id]
+                continue
+            games.append(game)
+        return games
+
+
+class DatabaseGameStore(MemoryGameStore):
+    """ゲームの状態をデータベースに保存する（再起動しても続きから遊べる）。"""
+
+    async def save(self, game: BluffNumberGame) -> None:
+        game.updated_at = time.time()
+        await BluffNumberGameState.objects.aupdate_or_create(
+            channel_id=game.channel_id,
+            defaults={"snapshot": game.to_snapshot()},
+        )
+
+    async def delete(self, channel_id: int) -> None:
+        await BluffNumberGameState.objects.filter(channel_id=channel_id).adelete()
+
+    async def load_all(self) -> list[BluffNumberGame]:
+        games, expired = [], []
+        async for state in BluffNumberGameState.objects.all():
+            game = _restore(state.snapshot)
+            if game is None or self.is_expired(game):
+                expired.append(state.channel_id)
+                continue
+            games.append(game)
+        if expired:
+            await BluffNumberGameState.objects.filter(channel_id__in=expired).adelete()
+        return games
+
+
+def _restore(snapshot: dict) -> Optional[BluffNumberGame]:
+    try:
+        return BluffNumberGame.from_snapshot(snapshot)
+    except (KeyError, TypeError, ValueError) as e:
+        # 形式の違う古いスナップショットは再開できないので捨てる
+        print(f"Discarding bluff number snapshot: {e!r}")
+        return None
+
+
+def make_game_store(backend: Optional[str] = None) -> MemoryGameStore:
+    backend = backend or settings.BLUFF_NUMBER_STORE
+    if backend == "memory":
+        return MemoryGameStore()
+    if backend == "database":
+        return DatabaseGameStore()
+    raise ValueError(f"unknown BLUFF_NUMBER_STORE: {backend}")
+
+
+game_store = make_game_store()
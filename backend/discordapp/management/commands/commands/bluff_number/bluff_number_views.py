@@ -1,35 +1,118 @@
 import asyncio
-from typing import Optional
+import time
+from typing import Awaitable, Callable, Optional
 
 import discord
 from discord import ui
 
 from .bluff_number_game import BluffNumberGame, GamePhase
+from .bluff_number_store import game_store
 
 # チャンネルID → ゲームインスタンス
+# ギルドのイベントはそのギルドを受け持つシャードにだけ届くので、シャードを
+# 複数のプロセスに分けてもチャンネルのゲームは1つのプロセスにしか存在しない
 active_games: dict[int, BluffNumberGame] = {}
 
-# チャンネルID → ゲーム中にBotが送ったメッセージ一覧（削除用）
-game_messages: dict[int, list[discord.Message]] = {}
+# チャンネルID → ゲームのボタンを受け付けているView（ゲーム終了時に止める）
+game_views: dict[int, list[ui.View]] = {}
 
+# チャンネルID → 締め切りを待つタスク
+# Viewのtimeoutは再起動すると消えるので、締め切りはgame.deadlineに保存して自前で待つ
+deadline_tasks: dict[int, asyncio.Task] = {}
+
+# 再起動後にゲームを再開するタスク（実行中に消えないよう参照を持っておく）
+_resume_tasks: set[asyncio.Task] = set()
+
+LOBBY_TIMEOUT_SECONDS = 120
 TURN_TIMEOUT_SECONDS = 60
+# 結果を読んでもらうために次の表示まで待つ秒数
+RESULT_PAUSE_SECONDS = 3
 
 
-def _track_message(channel_id: int, message: discord.Message):
+def _track_message(game: BluffNumberGame, message: discord.Message):
     """ゲーム中のBotメッセージを記録する。"""
-    if channel_id not in game_messages:
-        game_messages[channel_id] = []
-    game_messages[channel_id].append(message)
+    game.message_ids.append(message.id)
+
+
+def _register_view(game: BluffNumberGame, view: ui.View):
+    game_views.setdefault(game.channel_id, []).append(view)
+
+
+def _turn_key(game: BluffNumberGame) -> tuple[int, int]:
+    """ターンを識別する値。宣言・ラウンドの切り替えで変わる。"""
+    return game.round_number, game.current_round.turn_count
+
+
+async def save_game(game: BluffNumberGame):
+    """ゲームの状態を保存する。保存できなくてもゲームは続ける。"""
+    try:
+        await game_store.save(game)
+    except Exception as e:
+        print(f"Failed to save bluff number game {game.channel_id}: {e!r}")
+
+
+async def end_game(game: BluffNumberGame):
+    """ゲームを片付けてチャンネルを空ける。"""
+    cancel_deadline(game.channel_id)
+    for view in game_views.pop(game.channel_id, []):
+        view.stop()
+    if active_games.get(game.channel_id) is game:
+        del active_games[game.channel_id]
+    try:
+        await game_store.delete(game.channel_id)
+    except Exception as e:
+        print(f"Failed to delete bluff number game {game.channel_id}: {e!r}")
+
+
+def set_deadline(
+    game: BluffNumberGame, seconds: float, on_expire: Callable[[], Awaitable[None]]
+):
+    """seconds秒後を締め切りにし、過ぎたらon_expire()を呼ぶ。"""
+    game.deadline = time.time() + seconds
+    start_deadline(game, on_expire)
+
+
+def start_deadline(game: BluffNumberGame, on_expire: Callable[[], Awaitable[None]]):
+    """game.deadlineを過ぎたらon_expire()を呼ぶ（既に過ぎていればすぐ呼ぶ）。"""
+    cancel_deadline(game.channel_id)
+
+    async def wait():
+        await asyncio.sleep(max(game.deadline - time.time(), 0))
+        deadline_tasks.pop(game.channel_id, None)
+        game.deadline = None
+        await on_expire()
+
+    deadline_tasks[game.channel_id] = asyncio.create_task(wait())
+
+
+def cancel_deadline(channel_id: int):
+    task = deadline_tasks.pop(channel_id, None)
+    # 締め切りの処理の中から呼ばれたときは自分自身をキャンセルしない
+    if task is not None and task is not asyncio.current_task():
+        task.cancel()
+
+
+async def _edit_message(channel, message_id, **kwargs):
+    if message_id is None:
+        return
+    try:
+        await channel.get_partial_message(message_id).edit(**kwargs)
+    except discord.NotFound:
+        pass
 
 
 class LobbyView(ui.View):
     """ゲーム開始前のロビー。参加ボタンを表示する。"""
 
     def __init__(self, game: BluffNumberGame):
-        super().__init__(timeout=120)
+        super().__init__(timeout=None)
         self.game = game
 
-    @ui.button(label="参加する", style=discord.ButtonStyle.primary)
+    @ui.button(
+        label="参加する",
+        style=discord.ButtonStyle.primary,
+        custom_id="bluff_number:join",
+    )
     async def join_button(self, interaction: discord.Interaction, button: ui.Button):
         success, msg = self.game.add_player(
             interaction.user.id, interaction.user.display_name
@@ -42,11 +125,14 @@ class LobbyView(ui.View):
 
         if self.game.can_start():
             self.stop()
+            cancel_deadline(self.game.channel_id)
             self.game.start_game()
             await interaction.response.edit_message(embed=embed, view=None)
+            await save_game(self.game)
             await send_round_start(interaction.channel, self.game)
         else:
             await interaction.response.edit_message(embed=embed, view=self)
+            await save_game(self.game)
 
     def _build_lobby_embed(self) -> discord.Embed:
         embed = discord.Embed(
@@ -77,19 +163,34 @@ class LobbyView(ui.View):
         embed.set_footer(text="3人揃うと自動的にゲームが開始されます")
         return embed
 
-    async def on_timeout(self):
-        if self.game.channel_id in active_games:
-            del active_games[self.game.channel_id]
+    async def on_deadline(self):
+        if self.game.phase != GamePhase.LOBBY:
+            return
+        await end_game(self.game)
+
+
+async def start_lobby(game: BluffNumberGame, view: LobbyView, message: discord.Message):
+    """ロビーメッセージを記録し、参加の締め切りを設定して保存する。"""
+    game.lobby_message_id = message.id
+    _track_message(game, message)
+    _register_view(game, view)
+    set_deadline(game, LOBBY_TIMEOUT_SECONDS, view.on_deadline)
+    await save_game(game)
 
 
 class SecretNumberView(ui.View):
     """秘密の数字を確認するためのボタン。"""
 
     def __init__(self, game: BluffNumberGame):
-        super().__init__(timeout=300)
+        super().__init__(timeout=None)
         self.game = game
 
-    @ui.button(label="秘密の数字を見る", style=discord.ButtonStyle.secondary, emoji="\U0001f440")
+    @ui.button(
+        label="秘密の数字を見る",
+        style=discord.ButtonStyle.secondary,
+        emoji="\U0001f440",
+        custom_id="bluff_number:secret",
+    )
     async def see_number(self, interaction: discord.Interaction, button: ui.Button):
         player = next(
             (p for p in self.game.players if p.user_id == interaction.user.id), None
@@ -127,13 +228,18 @@ class TurnWaitView(ui.View):
     """チャンネルに表示する待機用View。ターンプレイヤーだけがボタンを押せる。"""
 
     def __init__(self, game: BluffNumberGame, channel):
-        super().__init__(timeout=TURN_TIMEOUT_SECONDS)
+        super().__init__(timeout=None)
         self.game = game
         self.channel = channel
-        self.message: Optional[discord.Message] = None
+        self.turn = _turn_key(game)
+        self.action_view: Optional[TurnActionView] = None
         self.acted = False
 
-    @ui.button(label="アクションする", style=discord.ButtonStyle.primary)
+    @ui.button(
+        label="アクションする",
+        style=discord.ButtonStyle.primary,
+        custom_id="bluff_number:action",
+    )
     async def action_button(self, interaction: discord.Interaction, button: ui.Button):
         current_player = self.game.get_current_turn_player()
         if interaction.user.id != current_player.user_id:
@@ -150,15 +256,19 @@ class TurnWaitView(ui.View):
             return
         self.acted = True
 
-        action_view = TurnActionView(self.game, self.channel, self)
+        self.action_view = TurnActionView(self.game, self.channel, self)
         embed = _build_action_embed(self.game)
         await interaction.response.send_message(
-            embed=embed, view=action_view, ephemeral=True
+            embed=embed, view=self.action_view, ephemeral=True
         )
 
-    async def on_timeout(self):
-        if self.acted:
+    async def on_deadline(self):
+        # アクション画面を開いたまま放置された場合もタイムアウトにする
+        if self.game.phase != GamePhase.TURN or _turn_key(self.game) != self.turn:
             return
+        self.stop()
+        if self.action_view is not None:
+            self.action_view.stop()
 
         timeout_msg = self.game.timeout_current_player()
         embed = discord.Embed(
@@ -171,15 +281,13 @@ class TurnWaitView(ui.View):
             value=self.game.get_scoreboard(),
             inline=False,
         )
-        if self.message:
-            await self.message.edit(embed=embed, view=None)
+        await save_game(self.game)
+        await _edit_message(
+            self.channel, self.game.turn_message_id, embed=embed, view=None
+        )
 
-        await asyncio.sleep(3)
-        continues = self.game.advance_to_next_round_or_end()
-        if continues:
-            await send_round_start(self.channel, self.game)
-        else:
-            await send_game_over(self.channel, self.game)
+        await asyncio.sleep(RESULT_PAUSE_SECONDS)
+        await finish_round(self.channel, self.game)
 
 
 class DeclarationSelect(ui.Select):
@@ -206,11 +314,16 @@ class DeclarationSelect(ui.Select):
 
         self.view.stop()
         self.view.wait_view.stop()
+        cancel_deadline(self.game.channel_id)
+        # 再起動後に古い待機メッセージを使わないよう、次のターンの送信前に外す
+        wait_message_id = self.game.turn_message_id
+        self.game.turn_message_id = None
 
         # ephemeralメッセージを更新（本人のみ）
         await interaction.response.edit_message(
             content="宣言しました！", embed=None, view=None
         )
+        await save_game(self.game)
 
         # チャンネルの待機メッセージを宣言結果に更新
         embed = discord.Embed(
@@ -218,10 +331,9 @@ class DeclarationSelect(ui.Select):
             description=msg,
             color=0x3498DB,
         )
-        if self.view.wait_view.message:
-            await self.view.wait_view.message.edit(
-                content=None, embed=embed, view=None
-            )
+        await _edit_message(
+            interaction.channel, wait_message_id, content=None, embed=embed, view=None
+        )
 
         await send_turn_view(interaction.channel, self.game)
 
@@ -246,6 +358,18 @@ class TurnActionView(ui.View):
         challenge_btn.callback = self.challenge_callback
         self.add_item(challenge_btn)
 
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # タイムアウトなどでターンが終わった後の操作は受け付けない
+        if (
+            self.game.phase == GamePhase.TURN
+            and _turn_key(self.game) == self.wait_view.turn
+        ):
+            return True
+        await interaction.response.edit_message(
+            content="このターンは終了しています。", embed=None, view=None
+        )
+        return False
+
     async def challenge_callback(self, interaction: discord.Interaction):
         success, msg, loser, winner = self.game.make_challenge(interaction.user.id)
         if not success:
@@ -254,11 +378,13 @@ class TurnActionView(ui.View):
 
         self.stop()
         self.wait_view.stop()
+        cancel_deadline(self.game.channel_id)
 
         # ephemeralメッセージを更新（本人のみ）
         await interaction.response.edit_message(
             content="チャレンジしました！", embed=None, view=None
         )
+        await save_game(self.game)
 
         # チャンネルにチャレンジ結果を表示
         embed = discord.Embed(
@@ -271,17 +397,21 @@ class TurnActionView(ui.View):
             value=self.game.get_scoreboard(),
             inline=False,
         )
-        if self.wait_view.message:
-            await self.wait_view.message.edit(
-                content=None, embed=embed, view=None
-            )
+        await _edit_message(
+            self.channel, self.game.turn_message_id, content=None, embed=embed, view=None
+        )
+
+        await asyncio.sleep(RESULT_PAUSE_SECONDS)
+        await finish_round(self.channel, self.game)
 
-        await asyncio.sleep(3)
-        continues = self.game.advance_to_next_round_or_end()
-        if continues:
-            await send_round_start(self.channel, self.game)
-        else:
-            await send_game_over(self.channel, self.game)
+
+async def finish_round(channel, game: BluffNumberGame):
+    """ラウンドの結果を表示した後、次のラウンドかゲーム終了に進む。"""
+    continues = game.advance_to_next_round_or_end()
+    if continues:
+        await send_round_start(channel, game)
+    else:
+        await send_game_over(channel, game)
 
 
 async def send_round_start(channel, game: BluffNumberGame):
@@ -296,17 +426,22 @@ async def send_round_start(channel, game: BluffNumberGame):
         value=game.get_scoreboard(),
         inline=False,
     )
+    game.secret_message_id = None
+    game.turn_message_id = None
     msg1 = await channel.send(embed=embed)
-    _track_message(game.channel_id, msg1)
+    _track_message(game, msg1)
 
     secret_view = SecretNumberView(game)
     msg2 = await channel.send(
         "\U0001f522 下のボタンを押して自分の秘密の数字を確認してください。",
         view=secret_view,
     )
-    _track_message(game.channel_id, msg2)
+    _track_message(game, msg2)
+    _register_view(game, secret_view)
+    game.secret_message_id = msg2.id
+    await save_game(game)
 
-    await asyncio.sleep(3)
+    await asyncio.sleep(RESULT_PAUSE_SECONDS)
     await send_turn_view(channel, game)
 
 
@@ -329,17 +464,19 @@ async def send_turn_view(channel, game: BluffNumberGame):
 
     view = TurnWaitView(game, channel)
     msg = await channel.send(embed=embed, view=view)
-    view.message = msg
-    _track_message(game.channel_id, msg)
+    _track_message(game, msg)
+    _register_view(game, view)
+    game.turn_message_id = msg.id
+    set_deadline(game, TURN_TIMEOUT_SECONDS, view.on_deadline)
+    await save_game(game)
 
 
 async def send_game_over(channel, game: BluffNumberGame):
     """ゲーム中のログを削除し、まとめを投稿してクリーンアップ。"""
     # ゲーム中のBotメッセージを一括削除
-    messages = game_messages.pop(game.channel_id, [])
-    for msg in messages:
+    for message_id in game.message_ids:
         try:
-            await msg.delete()
+            await channel.get_partial_message(message_id).delete()
         except discord.NotFound:
             pass
 
@@ -351,5 +488,75 @@ async def send_game_over(channel, game: BluffNumberGame):
     )
     await channel.send(embed=embed)
 
-    if game.channel_id in active_games:
-        del active_games[game.channel_id]
\ No newline at end of file
+    await end_game(game)
+
+
+def handles_game(client: discord.Client, game: BluffNumberGame) -> bool:
+    """このプロセスのシャードが受け持つギルドのゲームか"""
+    shard_ids = getattr(client, "shard_ids", None)
+    if shard_ids is None:
+        return True
+    if game.guild_id is None:
+        # DMはシャード0に届く
+        return 0 in shard_ids
+    return (game.guild_id >> 22) % client.shard_count in shard_ids
+
+
+def _resume(coro):
+    task = asyncio.create_task(coro)
+    _resume_tasks.add(task)
+    task.add_done_callback(_resume_tasks.discard)
+
+
+async def rehydrate_games(client: discord.Client) -> int:
+    """保存されているゲームを読み込み、ボタンを再び押せるようにして再開する。
+
+    Botの起動時（setup_hook）に呼ぶ。放置されたゲームとチャンネルが
+    見つからないゲームは削除する。シャードを分けて複数のプロセスで
+    動かしているときは、自分のシャードのギルドのゲームだけを再開する。
+    再開したゲームの数を返す。
+    """
+    resumed = 0
+    try:
+        games = await game_store.load_all()
+    except Exception as e:
+        print(f"Failed to load bluff number games: {e!r}")
+        return 0
+
+    for game in games:
+        if not handles_game(client, game):
+            continue
+        try:
+            channel = client.get_channel(game.channel_id) or await client.fetch_channel(
+                game.channel_id
+            )
+        except (discord.NotFound, discord.Forbidden):
+            await end_game(game)
+            continue
+        active_games[game.channel_id] = game
+        resumed += 1
+
+        if game.phase == GamePhase.LOBBY:
+            view = LobbyView(game)
+            client.add_view(view, message_id=game.lobby_message_id)
+            _register_view(game, view)
+            start_deadline(game, view.on_deadline)
+        elif game.phase == GamePhase.TURN:
+            if game.secret_message_id is None:
+                _resume(send_round_start(channel, game))
+                continue
+            secret_view = SecretNumberView(game)
+            client.add_view(secret_view, message_id=game.secret_message_id)
+            _register_view(game, secret_view)
+            if game.turn_message_id is None:
+                _resume(send_turn_view(channel, game))
+                continue
+            view = TurnWaitView(game, channel)
+            client.add_view(view, message_id=game.turn_message_id)
+            _register_view(game, view)
+            start_deadline(game, view.on_deadline)
+        elif game.phase == GamePhase.ROUND_END:
+            _resume(finish_round(channel, game))
+        else:
+            _resume(send_game_over(channel, game))
+    return resumed
\ No newline at end of file
@@ -0,0 +1,616 @@
+import asyncio
+import itertools
+import random
+import time
+import types
+from collections import Counter
+from typing import Awaitable, Callable, Optional
+
+import discord
+from discord.utils import MISSING
+
+from .api_client import APIResponse
+from .bluff_number import bluff_number_views
+from .bluff_number.bluff_number import bluff_number
+from .bluff_number.bluff_number_game import GamePhase
+from .flash import AnswerModal, AnswerPortalView, SetupAndJoinView, flash
+from .quizcmd import QUESTION, QuizView, quiz
+from .wakewake import wake1
+
+# チャンネルごとの送信・編集の上限（Discordは概ね5秒に5回）に掛かるルート
+CHANNEL_ROUTES = frozenset({"channel.send", "message.edit", "message.delete"})
+
+# 偽のスノーフレークの開始値
+SNOWFLAKE_BASE = 1_100_000_000_000_000_000
+
+
+class FakeDiscord:
+    """ネットワークを使わずにコマンドやゲームを動かすための偽のDiscord
+
+    チャンネル、メッセージ、メンバー、Interactionを偽物に置き換え、
+    送信・編集・削除などのDiscord APIの呼び出しをルートごとに数える。
+    呼び出しごとにlatency秒待ち、チャンネルへの送信・編集・削除は
+    チャンネルごとにper秒あたりburst回までに制限する（超えた分は待たされる）。
+    rate_limitedは上限で待たされた呼び出しの数、rate_limit_waitは待った秒数。
+    ボタンやセレクトの操作はclick()、モーダルの送信はsubmit_modal()で行う。
+    Viewのtimeoutは動かないので、締め切りはゲーム側の仕組みに任せる。
+    """
+
+    def __init__(self, latency: float = 0.0, burst: int = 5, per: float = 5.0):
+        self.latency = latency
+        self.burst = burst
+        self.per = per
+        self.calls: Counter = Counter()
+        self.rate_limited = 0
+        self.rate_limit_wait = 0.0
+        # Interactionを受け取ってから最初に応答するまでの秒数
+        self.response_latencies: list[float] = []
+        self.client = FakeClient(self)
+        self._ids = itertools.count(SNOWFLAKE_BASE)
+        # チャンネルID -> (残りのトークン, 最後に補充した時刻)
+        self._buckets: dict[int, tuple[float, float]] = {}
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def guild(self, name: str = "guild") -> "FakeGuild":
+        return FakeGuild(self, self.next_id(), name)
+
+    async def call(self, route: str, channel: Optional["FakeChannel"] = None) -> None:
+        """Discord APIの呼び出し1回分を数え、遅延と上限を再現する"""
+        self.calls[route] += 1
+        if channel is not None and route in CHANNEL_ROUTES:
+            await self._acquire(channel.id)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def _acquire(self, channel_id: int) -> None:
+        # FrameSchedulerと同じく、per秒でburst回分たまるトークンバケット
+        rate = self.burst / self.per
+        delayed = False
+        while True:
+            now = time.monotonic()
+            tokens, refilled_at = self._buckets.get(channel_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - refilled_at) * rate)
+            if tokens >= 1:
+                self._buckets[channel_id] = (tokens - 1, now)
+                return
+            self._buckets[channel_id] = (tokens, now)
+            wait = (1 - tokens) / rate
+            if not delayed:
+                delayed = True
+                self.rate_limited += 1
+            self.rate_limit_wait += wait
+            await asyncio.sleep(wait)
+
+    def slash(
+        self, command, user: "FakeMember", channel: "FakeTextChannel", **options
+    ) -> tuple["FakeInteraction", asyncio.Task]:
+        """スラッシュコマンドを実行するタスクを作る"""
+        interaction = FakeInteraction(self, user, channel)
+        task = asyncio.create_task(command.callback(interaction, **options))
+        return interaction, task
+
+    async def click(
+        self,
+        user: "FakeMember",
+        message: "FakeMessage",
+        label: Optional[str] = None,
+        *,
+        values: Optional[list[str]] = None,
+    ) -> "FakeInteraction":
+        """メッセージのボタン（label）またはセレクト（values）を操作する
+
+        discord.pyと同じく、Itemとviewのinteraction_checkを通ったら
+        callbackを呼ぶ。callbackが終わるまで待つ。
+        """
+        view = message.view
+        if view is None:
+            raise LookupError(f"message {message.id} has no components")
+        for item in view.children:
+            if values is not None and isinstance(item, discord.ui.Select):
+                break
+            if label is not None and getattr(item, "label", None) == label:
+                break
+        else:
+            raise LookupError(f"no component {label or 'select'} on {message.id}")
+        if getattr(item, "disabled", False):
+            raise LookupError(f"component {label or 'select'} is disabled")
+        interaction = FakeInteraction(self, user, message.channel, message=message)
+        item._refresh_state(interaction, {"values": values or []})
+        if await item.interaction_check(interaction) and await view.interaction_check(
+            interaction
+        ):
+            await item.callback(interaction)
+        return interaction
+
+    async def submit_modal(
+        self, interaction: "FakeInteraction", values: list[str]
+    ) -> "FakeInteraction":
+        """interactionで表示されたモーダルに入力して送信する"""
+        modal = interaction.response.modal
+        if modal is None:
+            raise LookupError("the interaction did not open a modal")
+        submit = FakeInteraction(
+            self, interaction.user, interaction.channel, message=interaction.message
+        )
+        inputs = [i for i in modal.children if isinstance(i, discord.ui.TextInput)]
+        for text_input, value in zip(inputs, values):
+            text_input._refresh_state(submit, {"value": value})
+        await modal.on_submit(submit)
+        modal.stop()
+        return submit
+
+    async def wait_for(
+        self,
+        channel: "FakeChannel",
+        predicate: Callable[[], object],
+        timeout: float = 30.0,
+    ):
+        """チャンネルで何か起きるたびにpredicateを確かめ、真になったら返す"""
+
+        async def wait():
+            while True:
+                changed = channel._changed
+                result = predicate()
+                if result:
+                    return result
+                await changed.wait()
+
+        return await asyncio.wait_for(wait(), timeout)
+
+
+class FakeAPI:
+    """バックエンドAPIの偽物。呼ばれたメソッドを数え、成功を返す"""
+
+    def __init__(self, question: Optional[dict] = None):
+        self.calls: Counter = Counter()
+        self.question = question or QUESTION
+
+    async def quiz_question_pop(self, guild_id, guild_name):
+        self.calls["quiz_question_pop"] += 1
+        return APIResponse(200, dict(self.question))
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            self.calls[name] += 1
+            return APIResponse(200, {})
+
+        return call
+
+
+class FakeResultBuffer:
+    """ResultWriteBufferの偽物。積まれた加算を数える"""
+
+    def __init__(self):
+        self.added: Counter = Counter()
+
+    def add(self, game, discord_id, username, field, delta=1):
+        self.added[game, field] += delta
+
+
+class FakeClient:
+    """Botのクライアントの偽物（コマンドが使う属性だけを持つ）"""
+
+    def __init__(self, discord_: FakeDiscord):
+        self.discord = discord_
+        self.api = FakeAPI()
+        self.results = FakeResultBuffer()
+        self.quiz_pool = types.SimpleNamespace(wake=lambda: None)
+        self.quiz_generator = types.SimpleNamespace(generate_one=self._generate_one)
+        self.shard_ids = None
+        self.shard_count = None
+        self.channels: dict[int, FakeChannel] = {}
+
+    async def _generate_one(self):
+        return dict(QUESTION)
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+    def add_view(self, view, *, message_id=None):
+        pass
+
+
+class FakeMember:
+    """ギルドのメンバー。IDが同じなら同じメンバーとみなす"""
+
+    def __init__(self, guild: "FakeGuild", user_id: int, name: str, bot: bool = False):
+        self.guild = guild
+        self.id = user_id
+        self.name = self.display_name = self.global_name = name
+        self.bot = bot
+        self.voice: Optional[types.SimpleNamespace] = None
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FakeMember) and other.id == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    async def move_to(self, channel: "FakeVoiceChannel") -> None:
+        await self.guild.discord.call("member.move_to")
+        if self.voice is not None:
+            self.voice.channel.members.remove(self)
+        channel.members.append(self)
+        self.voice = types.SimpleNamespace(channel=channel)
+
+
+class FakeGuild:
+    def __init__(self, discord_: FakeDiscord, guild_id: int, name: str):
+        self.discord = discord_
+        self.id = guild_id
+        self.name = name
+        self.members: list[FakeMember] = []
+        self.channels: list[FakeChannel] = []
+
+    @property
+    def voice_channels(self) -> list["FakeVoiceChannel"]:
+        return [c for c in self.channels if isinstance(c, FakeVoiceChannel)]
+
+    def member(self, name: str, bot: bool = False) -> FakeMember:
+        member = FakeMember(self, self.discord.next_id(), name, bot)
+        self.members.append(member)
+        return member
+
+    def text_channel(self, name: str = "general") -> "FakeTextChannel":
+        return self._add_channel(FakeTextChannel(self, self.discord.next_id(), name))
+
+    def voice_channel(self, name: str = "voice") -> "FakeVoiceChannel":
+        return self._add_channel(FakeVoiceChannel(self, self.discord.next_id(), name))
+
+    def _add_channel(self, channel):
+        self.channels.append(channel)
+        self.discord.client.channels[channel.id] = channel
+        return channel
+
+    def get_channel(self, channel_id: int):
+        return next((c for c in self.channels if c.id == channel_id), None)
+
+
+class FakeChannel:
+    def __init__(self, guild: FakeGuild, channel_id: int, name: str):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self._changed = asyncio.Event()
+
+    def notify(self) -> None:
+        """wait_forで待っている処理を起こす"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class FakeVoiceChannel(FakeChannel):
+    def __init__(self, guild: FakeGuild, channel_id: int, name: str):
+        super().__init__(guild, channel_id, name)
+        self.members: list[FakeMember] = []
+
+    def join(self, member: FakeMember) -> None:
+        self.members.append(member)
+        member.voice = types.SimpleNamespace(channel=self)
+
+
+class FakeTextChannel(FakeChannel):
+    def __init__(self, guild: FakeGuild, channel_id: int, name: str):
+        super().__init__(guild, channel_id, name)
+        # 削除されていないメッセージ（ephemeralも含む）
+        self.messages: dict[int, FakeMessage] = {}
+
+    @property
+    def discord(self) -> FakeDiscord:
+        return self.guild.discord
+
+    def _create(self, route_content: dict, ephemeral_for=None) -> "FakeMessage":
+        message = FakeMessage(self, self.discord.next_id(), ephemeral_for)
+        message._apply(route_content)
+        self.messages[message.id] = message
+        self.notify()
+        return message
+
+    async def send(self, content=None, **kwargs) -> "FakeMessage":
+        await self.discord.call("channel.send", self)
+        return self._create({"content": content, **kwargs})
+
+    def get_partial_message(self, message_id: int) -> "FakeMessage":
+        message = self.messages.get(message_id)
+        if message is None:
+            # 既に削除されたメッセージは編集・削除でNotFoundになる
+            message = FakeMessage(self, message_id)
+            message.deleted = True
+        return message
+
+    def find(self, view_type: type) -> Optional["FakeMessage"]:
+        """view_typeのViewが付いた最新のメッセージ"""
+        for message in reversed(list(self.messages.values())):
+            if isinstance(message.view, view_type):
+                return message
+        return None
+
+
+def _not_found() -> discord.NotFound:
+    return discord.NotFound(
+        types.SimpleNamespace(status=404, reason="Not Found"), "Unknown Message"
+    )
+
+
+class FakeMessage:
+    def __init__(
+        self,
+        channel: FakeTextChannel,
+        message_id: int,
+        ephemeral_for: Optional[FakeMember] = None,
+    ):
+        self.channel = channel
+        self.id = message_id
+        self.ephemeral_for = ephemeral_for
+        self.content: Optional[str] = None
+        self.embeds: list[discord.Embed] = []
+        self.view: Optional[discord.ui.View] = None
+        self.attachments: list = []
+        self.deleted = False
+
+    @property
+    def embed(self) -> Optional[discord.Embed]:
+        return self.embeds[0] if self.embeds else None
+
+    def _apply(self, fields: dict) -> None:
+        if fields.get("content", MISSING) is not MISSING:
+            self.content = fields["content"]
+        if fields.get("embed", MISSING) is not MISSING:
+            self.embeds = [fields["embed"]] if fields["embed"] is not None else []
+        if fields.get("embeds", MISSING) is not MISSING:
+            self.embeds = list(fields["embeds"] or [])
+        if fields.get("view", MISSING) is not MISSING:
+            self.view = fields["view"]
+        if fields.get("attachments", MISSING) is not MISSING:
+            self.attachments = list(fields["attachments"] or [])
+        for key in ("file", "files"):
+            if fields.get(key):
+                files = fields[key] if key == "files" else [fields[key]]
+                self.attachments = list(files)
+
+    def _edited(self, fields: dict) -> "FakeMessage":
+        if self.deleted:
+            raise _not_found()
+        self._apply(fields)
+        self.channel.notify()
+        return self
+
+    async def edit(self, **fields) -> "FakeMessage":
+        # エフェメラルはWebhook経由なのでチャンネルの上限には掛からない
+        channel = self.channel if self.ephemeral_for is None else None
+        await self.channel.discord.call("message.edit", channel)
+        return self._edited(fields)
+
+    async def delete(self, *, delay: Optional[float] = None) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        await self.channel.discord.call("message.delete", self.channel)
+        if self.deleted:
+            raise _not_found()
+        self.deleted = True
+        self.channel.messages.pop(self.id, None)
+        if self.view is not None:
+            self.view.stop()
+        self.channel.notify()
+
+
+class FakeInteraction:
+    """スラッシュコマンド、またはmessageのコンポーネントの操作"""
+
+    def __init__(
+        self,
+        discord_: FakeDiscord,
+        user: FakeMember,
+        channel: FakeTextChannel,
+        message: Optional[FakeMessage] = None,
+    ):
+        self.discord = discord_
+        self.client = discord_.client
+        self.user = user
+        self.channel = channel
+        self.guild = channel.guild
+        self.message = message
+        self.id = discord_.next_id()
+        self.created_at = time.monotonic()
+        self.response = FakeInteractionResponse(self)
+        self.followup = FakeFollowup(self)
+        # 応答（またはdefer後の最初のフォローアップ）で作られたメッセージ
+        self.original: Optional[FakeMessage] = None
+
+    @property
+    def channel_id(self) -> int:
+        return self.channel.id
+
+    @property
+    def guild_id(self) -> int:
+        return self.guild.id
+
+    async def original_response(self) -> FakeMessage:
+        await self.discord.call("interaction.original_response")
+        if self.original is None:
+            raise _not_found()
+        return self.original
+
+    async def edit_original_response(self, **fields) -> FakeMessage:
+        await self.discord.call("interaction.edit_original_response")
+        if self.original is None:
+            raise _not_found()
+        return self.original._edited(fields)
+
+
+class FakeInteractionResponse:
+    def __init__(self, interaction: FakeInteraction):
+        self._parent = interaction
+        self.type: Optional[str] = None
+        self.modal: Optional[discord.ui.Modal] = None
+
+    def is_done(self) -> bool:
+        return self.type is not None
+
+    async def _respond(self, kind: str) -> None:
+        if self.is_done():
+            raise discord.InteractionResponded(self._parent)
+        self.type = kind
+        interaction = self._parent
+        interaction.discord.response_latencies.append(
+            time.monotonic() - interaction.created_at
+        )
+        await interaction.discord.call(f"interaction.{kind}")
+
+    async def defer(self, *, ephemeral: bool = False, thinking: bool = False) -> None:
+        await self._respond("defer")
+
+    async def send_message(self, content=None, *, ephemeral: bool = False, **fields):
+        await self._respond("send_message")
+        interaction = self._parent
+        interaction.original = interaction.channel._create(
+            {"content": content, **fields},
+            ephemeral_for=interaction.user if ephemeral else None,
+        )
+
+    async def edit_message(self, **fields) -> None:
+        if self._parent.message is None:
+            raise discord.ClientException("edit_message needs a component interaction")
+        await self._respond("edit_message")
+        self._parent.message._edited(fields)
+
+    async def send_modal(self, modal: discord.ui.Modal) -> None:
+        await self._respond("send_modal")
+        self.modal = modal
+        self._parent.channel.notify()
+
+
+class FakeFollowup:
+    def __init__(self, interaction: FakeInteraction):
+        self._parent = interaction
+
+    async def send(self, content=None, *, ephemeral: bool = False, **fields):
+        interaction = self._parent
+        await interaction.discord.call("interaction.followup")
+        message = interaction.channel._create(
+            {"content": content, **fields},
+            ephemeral_for=interaction.user if ephemeral else None,
+        )
+        # defer後の最初のフォローアップは「考え中」の応答を置き換える
+        if interaction.original is None and interaction.response.type == "defer":
+            interaction.original = message
+        return message
+
+
+# --- ゲームを最後まで進める台本 ---
+
+
+async def play_quiz(
+    discord_: FakeDiscord, channel: FakeTextChannel, players: list[FakeMember]
+) -> None:
+    """/quiz: 最後の1人以外が間違え、最後の1人が正解する"""
+    _, task = discord_.slash(quiz, players[0], channel)
+    message = await discord_.wait_for(channel, lambda: channel.find(QuizView))
+    view = message.view
+    choices = [item.label for item in view.children]
+    wrong = [c for i, c in enumerate(choices) if i != view.answer_index]
+    for i, player in enumerate(players[:-1]):
+        await discord_.click(player, message, wrong[i % len(wrong)])
+    await discord_.click(players[-1], message, choices[view.answer_index])
+    await task
+
+
+async def play_flash(
+    discord_: FakeDiscord,
+    channel: FakeTextChannel,
+    players: list[FakeMember],
+    count: int = 3,
+    speed: float = 0.2,
+) -> None:
+    """/flash: 設定を変えて3人で遊び、偶数番目の参加者だけ正解する"""
+    owner = players[0]
+    _, task = discord_.slash(flash, owner, channel)
+    message = await discord_.wait_for(channel, lambda: channel.find(SetupAndJoinView))
+    setup = message.view
+    while setup.count > count:
+        await discord_.click(owner, message, "個数－")
+    while setup.speed - speed > 1e-9:
+        await discord_.click(owner, message, "速度－ (速)")
+    await discord_.click(owner, message, "🚀 募集開始")
+    for player in players[: setup.required_players]:
+        await discord_.click(player, message, "参加する！")
+
+    await discord_.wait_for(
+        channel, lambda: isinstance(message.view, AnswerPortalView), timeout=120
+    )
+    portal = message.view
+    for i, player in enumerate(setup.participants):
+        opened = await discord_.click(player, message, "回答を入力する")
+        modal = opened.response.modal
+        assert isinstance(modal, AnswerModal)
+        answer = modal.total if i % 2 == 0 else modal.total + 1
+        await discord_.submit_modal(opened, [str(answer)])
+    assert portal.all_submitted_event.is_set()
+    await task
+
+
+async def play_bluff_number(
+    discord_: FakeDiscord,
+    channel: FakeTextChannel,
+    players: list[FakeMember],
+    rng: Optional[random.Random] = None,
+) -> None:
+    """/bluff_number: 3人で参加し、全員が秘密の数字を見てから宣言かチャレンジする"""
+    rng = rng or random.Random(0)
+    users = {player.id: player for player in players}
+    host = players[0]
+    _, task = discord_.slash(bluff_number, host, channel)
+    await task
+    game = bluff_number_views.active_games[channel.id]
+    lobby = channel.messages[game.lobby_message_id]
+    for player in players[1:3]:
+        await discord_.click(player, lobby, "参加する")
+
+    seen_round = None
+    while bluff_number_views.active_games.get(channel.id) is game:
+        if game.phase != GamePhase.TURN:
+            raise RuntimeError(f"unexpected bluff number phase {game.phase}")
+        if seen_round != game.round_number:
+            seen_round = game.round_number
+            secret = channel.messages[game.secret_message_id]
+            for player in game.players:
+                await discord_.click(users[player.user_id], secret, "秘密の数字を見る")
+        current = users[game.get_current_turn_player().user_id]
+        turn = channel.messages[game.turn_message_id]
+        opened = await discord_.click(current, turn, "アクションする")
+        action = opened.original
+        minimum = game.get_min_declaration()
+        if game.can_challenge() and (
+            minimum > game.get_max_declaration() or rng.random() < 0.4
+        ):
+            await discord_.click(current, action, "チャレンジ！")
+        else:
+            await discord_.click(current, action, values=[str(minimum)])
+
+
+async def play_wakewake(discord_: FakeDiscord, guild: FakeGuild, members: int = 7):
+    """/wakewake: ボイスチャンネルのmembers人を空いているチャンネルに分ける"""
+    source = guild.voice_channel("lobby")
+    for _ in range(members // 3):
+        guild.voice_channel()
+    for i in range(members):
+        source.join(guild.member(f"voice {i}"))
+    _, task = discord_.slash(wake1, source.members[0], guild.text_channel())
+    await task
+
+
+# ゲーム名 -> (遊ぶ人数, 台本)
+GAME_FLOWS: dict[str, tuple[int, Callable[..., Awaitable[None]]]] = {
+    "quiz": (3, play_quiz),
+    "flash": (3, play_flash),
+    "bluff_number": (3, play_bluff_number),
+}
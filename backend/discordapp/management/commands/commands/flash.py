@@ -1,9 +1,17 @@
 import asyncio
+import io
 import random
 
 import discord
 from discord import app_commands
 
+from .flash_frames import FrameScheduler, build_flash_frames
+from .flash_render import flash_gif_duration, get_flash_gif
+from .instrumentation import record_flash_playback
+
+# 表示方法: メッセージの編集で1つずつ表示するか、GIFにまとめて1回で送るか
+DISPLAY_MODES = {"edit": "メッセージ", "gif": "GIF"}
+
 
 # --- 1. 直接入力用フォーム (Modal) ---
 class AnswerModal(discord.ui.Modal):
@@ -78,6 +86,7 @@ class SetupAndJoinView(discord.ui.View):
         self.participants = []
         self.is_recruiting = False
         self.digits, self.count, self.speed = 2, 5, 0.8
+        self.mode = "edit"
 
     def make_embed(self):
         if not self.is_recruiting:
@@ -89,6 +98,9 @@ class SetupAndJoinView(discord.ui.View):
             embed.add_field(
                 name="速度", value=f"**{self.speed:.1f}** 秒間隔", inline=True
             )
+            embed.add_field(
+                name="表示", value=f"**{DISPLAY_MODES[self.mode]}**", inline=True
+            )
             return embed
         else:
             names = (
@@ -138,6 +150,11 @@ class SetupAndJoinView(discord.ui.View):
         self.speed = max(0.2, self.speed - 0.1)
         await it.response.edit_message(embed=self.make_embed())
 
+    @discord.ui.button(label="表示切替", row=3)
+    async def toggle_mode(self, it, b):
+        self.mode = "gif" if self.mode == "edit" else "edit"
+        await it.response.edit_message(embed=self.make_embed())
+
     @discord.ui.button(label="🚀 募集開始", row=3, style=discord.ButtonStyle.success)
     async def start_recruit(self, it, b):
         if it.user != self.owner:
@@ -181,23 +198,34 @@ async def flash(interaction: discord.Interaction):
     ]
     total = sum(numbers)
 
-    # 演出
-    for i in range(3, 0, -1):
-        await msg.edit(content=f"🔥 **READY... {i}**", embed=None, view=None)
-        await asyncio.sleep(1)
-
-    # フラッシュ
-    for num in numbers:
-        await msg.edit(content=f"# 　{num}　")
-        await asyncio.sleep(view.speed)
-        await msg.edit(content="# 　 　")
-        await asyncio.sleep(0.05)
+    if view.mode == "gif":
+        # 演出 & フラッシュをGIFにまとめ、1回のアップロードで表示する
+        data = await asyncio.to_thread(get_flash_gif, numbers, view.speed)
+        await msg.edit(
+            content=None,
+            embed=None,
+            view=None,
+            attachments=[discord.File(io.BytesIO(data), filename="flash.gif")],
+        )
+        await asyncio.sleep(flash_gif_duration(numbers, view.speed))
+    else:
+        # 演出 & フラッシュ（チャンネルの編集上限に合わせて表示間隔を調整する）
+        async def show(content):
+            await msg.edit(content=content, embed=None, view=None)
+
+        report = await FrameScheduler(show).play(
+            build_flash_frames(numbers, view.speed)
+        )
+        record_flash_playback(report)
+        if report.effective_speed > view.speed:
+            game_config += f" (表示 {report.effective_speed:.1f}s)"
 
     # 回答ポータル表示
     portal = AnswerPortalView(participants=view.participants, total=total)
     await msg.edit(
         content="⌛ **全員回答してください！ 下のボタンから入力できます。**",
         view=portal,
+        attachments=[],
     )
 
     try:
@@ -208,8 +236,6 @@ async def flash(interaction: discord.Interaction):
     portal.stop()
 
     # リザルト & API保存
-    from .modules import flash_result_correct_request, flash_result_play_request
-
     results = []
     for user in view.participants:
         ans = portal.user_answers.get(user.id, "未入力")
@@ -217,17 +243,13 @@ async def flash(interaction: discord.Interaction):
         status = "✅ 正解" if is_correct else "❌ 不正解"
         results.append(f"**{user.display_name}**: {status} (回答: `{ans}`)")
         # play_count保存
-        flash_result_play_request(
-            token=interaction.client.token,
-            discord_id=user.id,
-            username=user.display_name,
+        interaction.client.results.add(
+            "flash", user.id, user.display_name, "play_count"
         )
         # correct_count保存（正解者のみ）
         if is_correct:
-            flash_result_correct_request(
-                token=interaction.client.token,
-                discord_id=user.id,
-                username=user.display_name,
+            interaction.client.results.add(
+                "flash", user.id, user.display_name, "correct_count"
             )
 
     res_embed = discord.Embed(title="🏆 対戦結果発表", color=0xF1C40F)
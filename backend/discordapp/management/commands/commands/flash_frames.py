@@ -0,0 +1,164 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from django.conf import settings
+
+# 同じ数字が続くときに、切り替わりが分かるよう挟む空白の表示時間
+BLANK_DURATION = 0.05
+
+# スケジュールが編集の上限に収まるまで、数字の表示間隔をこの刻みで延ばす
+SPEED_STEP = 0.05
+
+
+@dataclass
+class Frame:
+    """メッセージに表示する1コマ（内容と表示し続ける秒数）"""
+
+    content: str
+    duration: float
+    # 数字のコマか（レート制限に合わせて表示間隔を延ばす対象）
+    is_number: bool = False
+
+
+@dataclass
+class PlaybackReport:
+    """実際に表示できたタイミングの記録"""
+
+    speed: float
+    effective_speed: float
+    # コマごとの (実際に表示された時刻 - 予定の時刻) 秒
+    jitter: list[float] = field(default_factory=list)
+
+    @property
+    def max_jitter(self) -> float:
+        return max((abs(j) for j in self.jitter), default=0.0)
+
+
+def build_flash_frames(numbers: list[int], speed: float, countdown: int = 3):
+    """カウントダウンと数字のコマ列を作る
+
+    数字は前の数字から直接書き換え、空白のコマは同じ数字が続くときだけ挟む
+    （以前は数字ごとに2回編集していた）。
+    """
+    frames = [Frame(f"🔥 **READY... {i}**", 1.0) for i in range(countdown, 0, -1)]
+    previous = None
+    for number in numbers:
+        if number == previous:
+            frames.append(Frame("# 　 　", BLANK_DURATION))
+        frames.append(Frame(f"# 　{number}　", speed, is_number=True))
+        previous = number
+    return frames
+
+
+def fits_edit_budget(frames: list[Frame], burst: int, per: float) -> bool:
+    """コマ列を予定通りに表示しても、編集のトークンバケットが尽きないか"""
+    tokens = float(burst)
+    rate = burst / per
+    for previous, frame in zip([None] + frames, frames):
+        if previous is not None:
+            tokens = min(burst, tokens + previous.duration * rate)
+        if tokens < 1:
+            return False
+        tokens -= 1
+    return True
+
+
+def fit_frames_to_budget(
+    frames: list[Frame], burst: int, per: float
+) -> tuple[list[Frame], float]:
+    """編集の上限に収まるよう、数字の表示間隔をそろえて延ばす
+
+    途中で上限に当たると、そのコマだけ表示が遅れてリズムが崩れるため、
+    全ての数字を同じ間隔のまま延ばす。(コマ列, 実際の表示間隔) を返す。
+    """
+    speeds = [frame.duration for frame in frames if frame.is_number]
+    if not speeds:
+        return frames, 0.0
+    speed = speeds[0]
+    while True:
+        fitted = [Frame(f.content, speed, True) if f.is_number else f for f in frames]
+        if fits_edit_budget(fitted, burst, per) or speed >= per:
+            return fitted, speed
+        speed = round(speed + SPEED_STEP, 2)
+
+
+class FrameScheduler:
+    """コマ列を予定の時刻に合わせてメッセージの編集で表示する
+
+    待ち時間は開始時刻からの絶対時刻で決めるので、編集に時間がかかっても
+    ずれが後のコマに積み重ならない。編集にかかる時間の移動平均だけ早めに
+    送り、実際に表示される時刻を予定に近づける。
+
+    discord.pyは成功した編集のレート制限ヘッダーを公開しないため、
+    チャンネルの編集上限（burst回/per秒）をトークンバケットとして持ち、
+    編集が急に遅くなったとき（discord.pyが上限で待たされたとき）は
+    バケットが空になったものとして扱う。
+    """
+
+    def __init__(
+        self,
+        edit: Callable[[str], Awaitable[object]],
+        burst: Optional[int] = None,
+        per: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[object]] = asyncio.sleep,
+    ):
+        self.edit = edit
+        self.burst = burst if burst is not None else settings.FLASH_EDIT_BURST
+        self.per = per if per is not None else settings.FLASH_EDIT_PER
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self.burst)
+        self._refilled_at = clock()
+        self.latency = 0.1
+
+    async def play(self, frames: list[Frame]) -> PlaybackReport:
+        speeds = [frame.duration for frame in frames if frame.is_number]
+        frames, effective_speed = fit_frames_to_budget(frames, self.burst, self.per)
+        report = PlaybackReport(
+            speed=speeds[0] if speeds else 0.0, effective_speed=effective_speed
+        )
+        started = self._clock()
+        offset = 0.0
+        for frame in frames:
+            target = started + offset
+            wait = max(target - self.latency - self._clock(), self._token_wait())
+            if wait > 0:
+                await self._sleep(wait)
+            sent = self._clock()
+            self._take_token(sent)
+            await self.edit(frame.content)
+            shown = self._clock()
+            self._observe_latency(shown - sent)
+            report.jitter.append(shown - target)
+            offset += frame.duration
+        # 最後のコマも予定の時間だけ表示しておく
+        remaining = started + offset - self._clock()
+        if remaining > 0:
+            await self._sleep(remaining)
+        return report
+
+    def _refill(self, now: float) -> None:
+        rate = self.burst / self.per
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _token_wait(self) -> float:
+        self._refill(self._clock())
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) * self.per / self.burst
+
+    def _take_token(self, now: float) -> None:
+        self._refill(now)
+        self._tokens = max(self._tokens - 1, 0.0)
+
+    def _observe_latency(self, elapsed: float) -> None:
+        if elapsed > self.latency * 3 + 0.5:
+            # 上限で待たされた。移動平均には入れず、バケットを空にする
+            self._tokens = 0.0
+            self._refilled_at = self._clock()
+            return
+        self.latency = self.latency * 0.8 + elapsed * 0.2
@@ -0,0 +1,138 @@
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+
+# 描画の内容を変えたら上げる（古いキャッシュを使わないため）
+RENDER_VERSION = 1
+
+WIDTH, HEIGHT = 480, 270
+BACKGROUND = (20, 20, 20)
+FOREGROUND = (255, 255, 255)
+ACCENT = (255, 140, 0)
+# GIFはパレット画像なので、使う3色だけのパレットにする
+PALETTE = [BACKGROUND, FOREGROUND, ACCENT]
+
+# 数字と数字の間に挟む空白の表示時間（GIFは10ミリ秒単位）
+GAP_DURATION = 0.1
+
+# 最後のコマ（答えの入力待ち）の表示時間。ループ再生されても数字が見えないようにする
+FINAL_DURATION = 60.0
+
+
+class FlashRenderCache:
+    """レンダリング済みのGIFを内容のハッシュで保持するLRUキャッシュ。スレッドセーフ"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def set(self, key: str, data: bytes) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+render_cache = FlashRenderCache(settings.FLASH_RENDER_CACHE_SIZE)
+
+
+def flash_render_key(numbers: list[int], speed: float, countdown: int = 3) -> str:
+    """設定と数字の並びから決まるキャッシュのキー"""
+    content = json.dumps(
+        {
+            "version": RENDER_VERSION,
+            "numbers": numbers,
+            "speed": round(speed, 2),
+            "countdown": countdown,
+        }
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _frame(text: str, font, color=FOREGROUND) -> Image.Image:
+    image = Image.new("P", (WIDTH, HEIGHT))
+    image.putpalette([value for rgb in PALETTE for value in rgb])
+    draw = ImageDraw.Draw(image)
+    if text:
+        draw.text(
+            (WIDTH / 2, HEIGHT / 2),
+            text,
+            fill=PALETTE.index(color),
+            font=font,
+            anchor="mm",
+        )
+    return image
+
+
+def render_flash_gif(numbers: list[int], speed: float, countdown: int = 3) -> bytes:
+    """カウントダウンと数字の並びを1枚のアニメーションGIFにする
+
+    数字の表示時間はGIFのコマの長さで決まるので、通信の遅れに関係なく
+    指定した速度で再生される。数字の間には短い空白を挟む。
+    """
+    number_font = ImageFont.load_default(size=140)
+    label_font = ImageFont.load_default(size=72)
+    frames, durations = [], []
+    for i in range(countdown, 0, -1):
+        frames.append(_frame(f"READY {i}", label_font, ACCENT))
+        durations.append(1.0)
+    for number in numbers:
+        frames.append(_frame(str(number), number_font))
+        durations.append(max(speed - GAP_DURATION, GAP_DURATION))
+        frames.append(_frame("", number_font))
+        durations.append(GAP_DURATION)
+    frames.append(_frame("= ?", label_font, ACCENT))
+    durations.append(FINAL_DURATION)
+
+    buffer = io.BytesIO()
+    frames[0].save(
+        buffer,
+        format="GIF",
+        save_all=True,
+        append_images=frames[1:],
+        duration=[round(d * 1000) for d in durations],
+        optimize=False,
+        disposal=1,
+    )
+    return buffer.getvalue()
+
+
+def get_flash_gif(numbers: list[int], speed: float, countdown: int = 3) -> bytes:
+    """キャッシュにあればそれを、無ければレンダリングして返す（スレッドで呼ぶ）"""
+    key = flash_render_key(numbers, speed, countdown)
+    data = render_cache.get(key)
+    if data is None:
+        data = render_flash_gif(numbers, speed, countdown)
+        render_cache.set(key, data)
+    return data
+
+
+def flash_gif_duration(numbers: list[int], speed: float, countdown: int = 3) -> float:
+    """GIFの最後のコマ（答えの入力待ち）が表示されるまでの秒数"""
+    return countdown + len(numbers) * max(speed, 2 * GAP_DURATION)
@@ -0,0 +1,39 @@
+from typing import Optional
+
+import discord
+from django.conf import settings
+
+# プロファイル名 → 受け取るイベントとキャッシュの説明
+INTENT_PROFILES = {
+    "full": "全てのイベントを受け取り、メンバーとメッセージを全てキャッシュする（以前の設定）",
+    "standard": "スラッシュコマンド、メンバーの参加・退出、ボイスの状態だけを受け取る",
+    "minimal": "standardからメンバーの参加・退出（特権インテント）を除く",
+}
+
+
+def client_options(profile: Optional[str] = None) -> dict:
+    """インテントのプロファイルに合わせたdiscord.Clientの引数を返す
+
+    Botが使うのはスラッシュコマンド（guilds）、メンバーの参加・退出
+    （members）、ボイスの状態（voice_states）だけなので、それ以外の
+    イベント（プレゼンス、メッセージなど）は受け取らない。メンバーは
+    /wakewakeが使うボイスチャンネルにいる人だけをキャッシュし、起動時に
+    ギルドの全メンバーを取得（チャンク）しない。メッセージを読むコマンドは
+    無いので、メッセージもキャッシュしない。
+    """
+    profile = profile or settings.DISCORD_INTENTS_PROFILE
+    if profile not in INTENT_PROFILES:
+        raise ValueError(f"unknown intents profile: {profile}")
+    if profile == "full":
+        return {"intents": discord.Intents.all()}
+
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.voice_states = True
+    intents.members = profile == "standard"
+    return {
+        "intents": intents,
+        "member_cache_flags": discord.MemberCacheFlags(voice=True, joined=False),
+        "chunk_guilds_at_startup": False,
+        "max_messages": None,
+    }
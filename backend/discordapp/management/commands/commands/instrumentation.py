@@ -0,0 +1,356 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+from typing import Optional
+
+import discord
+from aiohttp import web
+from discord import app_commands
+from django.conf import settings
+
+from discordapp.metrics import CONTENT_TYPE, LATENCY_BUCKETS, MetricsRegistry
+
+from .resilience import CircuitBreaker
+
+# イベントループの遅延のバケット（秒）
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+# Botのプロセスのメトリクス（バックエンドの/api/metricsと同じ形式で出力する）
+registry = MetricsRegistry()
+
+commands_total = registry.counter(
+    "discordapp_bot_commands_total",
+    "Slash command invocations by command and outcome.",
+    ("command", "outcome"),
+)
+command_first_response = registry.histogram(
+    "discordapp_bot_command_first_response_seconds",
+    "Time from receiving a slash command to its first interaction response.",
+    ("command",),
+)
+command_duration = registry.histogram(
+    "discordapp_bot_command_duration_seconds",
+    "Total time spent running a slash command.",
+    ("command",),
+)
+command_backend = registry.histogram(
+    "discordapp_bot_command_backend_seconds",
+    "Time a slash command spent waiting on the backend API.",
+    ("command",),
+    buckets=LATENCY_BUCKETS,
+)
+loop_lag = registry.histogram(
+    "discordapp_bot_event_loop_lag_seconds",
+    "Delay of the event loop, sampled periodically.",
+    buckets=LOOP_LAG_BUCKETS,
+)
+loop_blocked = registry.counter(
+    "discordapp_bot_event_loop_blocked_total",
+    "Times the event loop was blocked for longer than the threshold.",
+)
+backend_calls = registry.counter(
+    "discordapp_bot_backend_calls_total",
+    "Backend API attempts, retries, failures, short-circuited calls and "
+    "circuit openings.",
+    ("event",),
+)
+backend_circuit_state = registry.gauge(
+    "discordapp_bot_backend_circuit_state",
+    "1 for the current state of the backend API circuit breaker, 0 otherwise.",
+    ("state",),
+)
+quiz_generation_calls = registry.counter(
+    "discordapp_bot_quiz_generation_total",
+    "Quiz generation model calls, failures, timeouts, generated questions and "
+    "requests that were coalesced into a shared call.",
+    ("event",),
+)
+quiz_generation_tokens = registry.counter(
+    "discordapp_bot_quiz_generation_tokens_total",
+    "Tokens used by quiz generation model calls.",
+    ("kind",),
+)
+quiz_generation_seconds = registry.counter(
+    "discordapp_bot_quiz_generation_seconds_total",
+    "Total time spent waiting on quiz generation model calls.",
+)
+quiz_generation_max_seconds = registry.gauge(
+    "discordapp_bot_quiz_generation_max_seconds",
+    "Slowest quiz generation model call since the bot started.",
+)
+flash_playbacks = registry.counter(
+    "discordapp_bot_flash_playbacks_total",
+    "Flash games shown by editing messages, by whether the display speed had "
+    "to be slowed to fit the edit rate limit.",
+    ("outcome",),
+)
+flash_frame_jitter = registry.histogram(
+    "discordapp_bot_flash_frame_jitter_seconds",
+    "Difference between the scheduled and actual display time of flash frames.",
+    buckets=LOOP_LAG_BUCKETS,
+)
+
+# ResilientCaller.metrics()のうち、回数として出す項目
+BACKEND_CALL_EVENTS = (
+    "attempts",
+    "retries",
+    "failures",
+    "short_circuited",
+    "circuit_opened",
+)
+CIRCUIT_STATES = (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)
+
+
+def watch_api_client(api) -> None:
+    """APIClientの再試行とサーキットブレーカーの統計をメトリクスに出す"""
+    for event in BACKEND_CALL_EVENTS:
+        backend_calls.set_function(lambda event=event: api.metrics()[event], event)
+    for state in CIRCUIT_STATES:
+        backend_circuit_state.set_function(
+            lambda state=state: int(api.metrics()["state"] == state), state
+        )
+
+
+# QuizGenerator.metrics()のうち、回数として出す項目
+QUIZ_GENERATION_EVENTS = (
+    "calls",
+    "failures",
+    "timeouts",
+    "questions",
+    "coalesced_requests",
+)
+
+
+def watch_quiz_generator(generator) -> None:
+    """QuizGeneratorの呼び出し回数、トークン数、待ち時間をメトリクスに出す"""
+    for event in QUIZ_GENERATION_EVENTS:
+        quiz_generation_calls.set_function(
+            lambda event=event: generator.metrics()[event], event
+        )
+    for kind in ("prompt", "output"):
+        quiz_generation_tokens.set_function(
+            lambda kind=kind: generator.metrics()[f"{kind}_tokens"], kind
+        )
+    quiz_generation_seconds.set_function(lambda: generator.latency_total)
+    quiz_generation_max_seconds.set_function(lambda: generator.metrics()["latency_max"])
+
+
+def record_flash_playback(report) -> None:
+    """FrameScheduler.play()の結果（PlaybackReport）をメトリクスに記録する"""
+    slowed = report.effective_speed > report.speed
+    flash_playbacks.inc("slowed" if slowed else "on_time")
+    for jitter in report.jitter:
+        flash_frame_jitter.observe(abs(jitter))
+
+
+class CommandTiming:
+    """実行中のスラッシュコマンドの開始時刻と、バックエンドを待った時間"""
+
+    __slots__ = ("started", "backend_seconds", "watcher", "finished")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.backend_seconds = 0.0
+        self.watcher: Optional[asyncio.Task] = None
+        self.finished = False
+
+
+# 実行中のコマンド（コマンドから作ったタスクにも引き継がれる）
+_current_command: ContextVar[Optional[CommandTiming]] = ContextVar(
+    "discordapp_bot_command", default=None
+)
+
+
+def record_backend_wait(seconds: float) -> None:
+    """APIClientから呼ばれ、実行中のコマンドのバックエンド待ち時間に足す"""
+    timing = _current_command.get()
+    if timing is not None:
+        timing.backend_seconds += seconds
+
+
+# 最初の応答を確認する間隔（秒）。応答の期限の3秒に比べて十分に短くする
+FIRST_RESPONSE_POLL_INTERVAL = 0.01
+# 最初の応答の期限（秒）。過ぎたらDiscord側で失敗になるので見張るのをやめる
+FIRST_RESPONSE_DEADLINE = 3.0
+
+
+def command_name(interaction: discord.Interaction) -> str:
+    command = interaction.command
+    return command.qualified_name if command is not None else "unknown"
+
+
+async def watch_first_response(interaction: discord.Interaction, started: float):
+    """interactionが最初に応答するまで待ち、その時間を記録する"""
+    while not interaction.response.is_done():
+        if time.perf_counter() - started > FIRST_RESPONSE_DEADLINE:
+            return
+        await asyncio.sleep(FIRST_RESPONSE_POLL_INTERVAL)
+    command_first_response.observe(
+        time.perf_counter() - started, command_name(interaction)
+    )
+
+
+def start_command(interaction: discord.Interaction) -> None:
+    """スラッシュコマンドの計測を始める
+
+    discord.pyはインタラクションごとにタスクを作ってコマンドを実行するので、
+    ContextVarはそのタスクと、そこから送られるイベントのタスクにだけ見える。
+    """
+    timing = CommandTiming()
+    _current_command.set(timing)
+    # 応答はコマンドの途中で返るので、別のタスクでis_done()を見張る
+    timing.watcher = asyncio.create_task(
+        watch_first_response(interaction, timing.started)
+    )
+
+
+def finish_command(interaction: discord.Interaction, outcome: str) -> None:
+    """start_command()で始めたスラッシュコマンドの結果と時間を記録する"""
+    timing = _current_command.get()
+    if timing is None or timing.finished:
+        return
+    timing.finished = True
+    elapsed = time.perf_counter() - timing.started
+    name = command_name(interaction)
+    if not timing.watcher.done():
+        timing.watcher.cancel()
+        if interaction.response.is_done():
+            # 見張りが気付く前にコマンドが終わった
+            command_first_response.observe(elapsed, name)
+    commands_total.inc(name, outcome)
+    command_duration.observe(elapsed, name)
+    command_backend.observe(timing.backend_seconds, name)
+
+
+class InstrumentedCommandTree(app_commands.CommandTree):
+    """スラッシュコマンドごとの時間を記録するCommandTree
+
+    最初の応答までの時間（3秒以内に応答しないと失敗する）、全体の時間、
+    バックエンドのAPIを待った時間をコマンドごとに記録する。
+    計測はinteraction_checkで始め、失敗はon_errorで記録する。成功は
+    クライアントのon_app_command_completionからfinish_command()を呼んで記録する。
+    """
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.type is discord.InteractionType.application_command:
+            start_command(interaction)
+        return True
+
+    async def on_error(
+        self, interaction: discord.Interaction, error: app_commands.AppCommandError
+    ) -> None:
+        finish_command(interaction, "error")
+        await super().on_error(interaction, error)
+
+
+class LoopLagMonitor:
+    """イベントループの遅延を測り、ループを止めている処理のスタックを出力する
+
+    ループ上のタスクがinterval秒ごとに起き、予定より遅れた時間を記録する。
+    ループが止まっている間はタスクも動けないので、別スレッドの見張りが
+    threshold秒以上タスクが起きていないことを見つけたら、そのときの
+    ループのスレッドのスタック（同期的な処理を呼んでいるコルーチン）を出力する。
+    """
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        threshold: Optional[float] = None,
+    ):
+        self.interval = (
+            interval if interval is not None else settings.BOT_LOOP_LAG_INTERVAL
+        )
+        self.threshold = (
+            threshold
+            if threshold is not None
+            else settings.BOT_LOOP_BLOCK_THRESHOLD_MS / 1000
+        )
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        # ループのタスクが最後に起きた時刻と、それを報告済みか
+        self._beat = time.monotonic()
+        self._reported_beat: Optional[float] = None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-lag-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    async def close(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _sample(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._beat = now = time.monotonic()
+            loop_lag.observe(max(0.0, now - expected))
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked >= self.threshold and self._reported_beat != beat:
+                # 同じ停止は1回だけ報告する
+                self._reported_beat = beat
+                self.report(blocked)
+
+    def report(self, blocked: float) -> None:
+        loop_blocked.inc()
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        print(
+            f"Event loop blocked for {blocked * 1000:.0f}ms or more:\n{stack}",
+            end="",
+        )
+
+
+class MetricsServer:
+    """Botのメトリクスをhttp://host:port/metrics で公開する"""
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None):
+        self.host = host if host is not None else settings.BOT_METRICS_HOST
+        self.port = port if port is not None else settings.BOT_METRICS_PORT
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            # メトリクスが出せなくてもBotは動かす
+            print(f"Could not serve bot metrics on {self.host}:{self.port}: {e!r}")
+            await self.close()
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=registry.render().encode(),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
@@ -0,0 +1,109 @@
+import asyncio
+from typing import Optional
+
+import aiohttp
+import discord
+from django.conf import settings
+
+from .api_client import APIAuthError
+from .resilience import CircuitOpenError
+
+
+class GuildMemberSyncer:
+    """ギルドの全メンバーをバックエンドのDiscordGuild.membersに同期する
+
+    Botが止まっている間に参加・退出したメンバーも反映するため、
+    ギルドが使えるようになったとき（起動時と参加時）にGatewayから
+    全メンバーを取得し（キャッシュはしない）、IDの昇順にchunk_size人ずつ
+    送る。区切りごとにバックエンドで差分を取って追加・削除するので、
+    1万人のギルドでも10回ほどのリクエストで済む。
+    同期は同時にconcurrency件まで、同じギルドは1つずつ行う。
+    """
+
+    def __init__(
+        self,
+        api,
+        chunk_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+    ):
+        self.api = api
+        self.chunk_size = (
+            chunk_size
+            if chunk_size is not None
+            else settings.GUILD_MEMBER_SYNC_CHUNK_SIZE
+        )
+        self._semaphore = asyncio.Semaphore(
+            concurrency
+            if concurrency is not None
+            else settings.GUILD_MEMBER_SYNC_CONCURRENCY
+        )
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def schedule(self, guild: discord.Guild) -> None:
+        """バックグラウンドでギルドを同期する（同期中なら何もしない）"""
+        if guild.id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(guild))
+        self._tasks[guild.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(guild.id, None))
+
+    async def close(self) -> None:
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    async def sync(self, guild: discord.Guild) -> tuple[int, int]:
+        """ギルドの全メンバーを同期し、(追加した数, 削除した数) を返す"""
+        members = await guild.chunk(cache=False)
+        return await self.sync_members(
+            guild.id, guild.name, [(m.id, m.display_name) for m in members]
+        )
+
+    async def sync_members(
+        self, guild_id: int, guild_name: str, members: list[tuple[int, str]]
+    ) -> tuple[int, int]:
+        """(ID, 名前) のメンバー一覧をIDの昇順に区切って送る"""
+        members = sorted(members)
+        chunks = [
+            members[i : i + self.chunk_size]
+            for i in range(0, len(members), self.chunk_size)
+        ] or [[]]
+        added = removed = 0
+        after = ""
+        for index, chunk in enumerate(chunks):
+            res = await self.api.sync_guild_members(
+                guild_id=guild_id,
+                guild_name=guild_name,
+                members=[
+                    {"discord_id": str(member_id), "username": name}
+                    for member_id, name in chunk
+                ],
+                after=after,
+                final=index == len(chunks) - 1,
+            )
+            if res.status_code != 200:
+                # 送れた区切りまでは正しく反映されている
+                raise RuntimeError(f"member sync failed with status {res.status_code}")
+            added += res.data["added"]
+            removed += res.data["removed"]
+            if chunk:
+                after = str(chunk[-1][0])
+        return added, removed
+
+    async def _run(self, guild: discord.Guild) -> None:
+        async with self._semaphore:
+            try:
+                added, removed = await self.sync(guild)
+            except (
+                APIAuthError,
+                CircuitOpenError,
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                discord.ClientException,
+                RuntimeError,
+            ) as e:
+                print(f"Member sync for guild {guild.id} failed: {e!r}")
+                return
+        if added or removed:
+            print(f"Synced guild {guild.id} members: +{added} -{removed}")
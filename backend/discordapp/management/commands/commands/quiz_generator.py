@@ -0,0 +1,163 @@
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+
+from .quiz_parser import parse_quizzes
+
+
+class QuizGenerationError(Exception):
+    """モデルからクイズを生成できなかった"""
+
+
+def build_quiz_prompt(count: int) -> str:
+    return (
+        f"あなたはクイズマスターです。3択クイズを{count}問出題してください。"
+        "問題はそれぞれ異なるジャンルから選び、同じ問題を繰り返さないでください。"
+        "クイズは以下のJSONフォーマットの配列で出力してください。"
+        "\n[\n  {\n"
+        '    "question": "クイズの問題文",\n'
+        '    "choices": ["選択肢1", "選択肢2", "選択肢3"],\n'
+        '    "answer": 正解の選択肢の番号（0, 1, 2のいずれか）\n'
+        "  }\n]\n"
+        "\n例:\n"
+        '[\n  {"question": "日本の首都はどこですか？", '
+        '"choices": ["大阪", "東京", "京都"], "answer": 1}\n]'
+    )
+
+
+def _default_client_factory():
+    # google-genaiは使うときまで読み込まない（認証と接続の準備は1回だけ行う）
+    from google import genai
+
+    return genai.Client()
+
+
+class QuizGenerator:
+    """プロセスで共有するクイズ生成クライアント
+
+    genai.Clientは最初に使うときに1つだけ作り、以降は使い回す。
+    モデルへの同時呼び出しはconcurrency件までに抑え、1回の呼び出しは
+    timeout秒で打ち切る。呼び出し待ちの間に届いた生成依頼は、
+    1回のプロンプト（最大max_batch問）にまとめて生成する。
+    """
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_batch: Optional[int] = None,
+        client_factory: Callable[[], Any] = _default_client_factory,
+    ):
+        self.model = model or settings.QUIZ_GENAI_MODEL
+        self.concurrency = (
+            concurrency if concurrency is not None else settings.QUIZ_GENAI_CONCURRENCY
+        )
+        self.timeout = timeout if timeout is not None else settings.QUIZ_GENAI_TIMEOUT
+        self.max_batch = (
+            max_batch if max_batch is not None else settings.QUIZ_GENAI_MAX_BATCH
+        )
+        self._client_factory = client_factory
+        self._client = None
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._waiters: list[asyncio.Future] = []
+        self._tasks: set[asyncio.Task] = set()
+        self.counters: Counter[str] = Counter()
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    async def generate_one(self) -> dict:
+        """クイズを1問生成する。同時に来た依頼とまとめて生成されることがある"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        task = asyncio.create_task(self._drain())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return await waiter
+
+    async def generate(self, count: int) -> list[dict]:
+        """クイズをまとめてcount問（最大max_batch問）生成する"""
+        async with self._semaphore:
+            return await self._call(min(count, self.max_batch))
+
+    def metrics(self) -> dict:
+        calls = self.counters["calls"]
+        return {
+            "calls": calls,
+            "failures": self.counters["failures"],
+            "timeouts": self.counters["timeouts"],
+            "questions": self.counters["questions"],
+            "coalesced_requests": self.counters["coalesced_requests"],
+            "prompt_tokens": self.counters["prompt_tokens"],
+            "output_tokens": self.counters["output_tokens"],
+            "latency_avg": self.latency_total / calls if calls else 0.0,
+            "latency_max": self.latency_max,
+        }
+
+    async def _drain(self) -> None:
+        async with self._semaphore:
+            # 待っている間に積まれた依頼をまとめて取り出す（他の呼び出しが
+            # 既に取り出していれば何もしない）
+            batch = self._waiters[: self.max_batch]
+            del self._waiters[: len(batch)]
+            if not batch:
+                return
+            if len(batch) > 1:
+                self.counters["coalesced_requests"] += len(batch)
+            try:
+                questions = await self._call(len(batch))
+            except Exception as e:
+                for waiter in batch:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                return
+        for waiter in batch:
+            if waiter.done():
+                continue
+            if questions:
+                waiter.set_result(questions.pop())
+            else:
+                waiter.set_exception(
+                    QuizGenerationError("model returned too few questions")
+                )
+
+    async def _call(self, count: int) -> list[dict]:
+        self.counters["calls"] += 1
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                self.client.aio.models.generate_content(
+                    model=self.model,
+                    contents=build_quiz_prompt(count),
+                    config={"response_mime_type": "application/json"},
+                ),
+                timeout=self.timeout,
+            )
+        except asyncio.TimeoutError as e:
+            self.counters["timeouts"] += 1
+            self.counters["failures"] += 1
+            raise QuizGenerationError("quiz generation timed out") from e
+        except Exception:
+            self.counters["failures"] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.counters["prompt_tokens"] += usage.prompt_token_count or 0
+            self.counters["output_tokens"] += usage.candidates_token_count or 0
+        content = response.text if hasattr(response, "text") else str(response)
+        questions = parse_quizzes(content or "")[:count]
+        self.counters["questions"] += len(questions)
+        return questions
@@ -0,0 +1,102 @@
+import json
+import re
+from typing import Any, Iterator, Optional
+
+_decoder = json.JSONDecoder()
+
+# JSONの値が始まり得る位置（オブジェクトか配列）
+_JSON_START = re.compile(r"[{\[]")
+
+# クイズの配列を包んでいることがあるキー
+_WRAPPER_KEYS = ("quizzes", "questions", "quiz", "items", "data")
+
+
+def iter_json_values(text: str) -> Iterator[Any]:
+    """文章に埋め込まれたJSONのオブジェクト・配列を先頭から順に取り出す
+
+    json.JSONDecoder.raw_decodeで括弧の対応と文字列中の括弧を正しく扱い、
+    1つ読み終えたらその直後から次を探す。途中で切れた配列のように
+    読めない値は、その内側の読める値を拾い直す。
+    """
+    pos = 0
+    while True:
+        match = _JSON_START.search(text, pos)
+        if match is None:
+            return
+        try:
+            value, end = _decoder.raw_decode(text, match.start())
+        except ValueError:
+            pos = match.start() + 1
+            continue
+        yield value
+        pos = end
+
+
+def normalize_quiz(value: Any) -> Optional[dict]:
+    """クイズ1問を {question, choices, answer} に整えて返す。形式が違えばNone
+
+    answerは選択肢の番号（0〜2）とし、"1" のような数字の文字列や
+    選択肢そのものの文字列で返ってきた場合も番号に直す。
+    """
+    if not isinstance(value, dict):
+        return None
+    question = value.get("question")
+    choices = value.get("choices")
+    answer = value.get("answer")
+    if not isinstance(question, str) or not question.strip():
+        return None
+    if not isinstance(choices, list) or len(choices) != 3:
+        return None
+    if not all(isinstance(c, str) and c.strip() for c in choices):
+        return None
+    choices = [c.strip() for c in choices]
+    if len(set(choices)) != 3:
+        return None
+    if isinstance(answer, str):
+        answer = answer.strip()
+        if answer in choices:
+            answer = choices.index(answer)
+        elif answer.isdigit():
+            answer = int(answer)
+    if not isinstance(answer, int) or isinstance(answer, bool):
+        return None
+    if not 0 <= answer <= 2:
+        return None
+    return {"question": question.strip(), "choices": choices, "answer": answer}
+
+
+def is_valid_quiz(value: Any) -> bool:
+    """そのまま使える {question, choices(3つ), answer(0〜2)} になっているか"""
+    quiz = normalize_quiz(value)
+    return quiz is not None and all(quiz[key] == value[key] for key in quiz)
+
+
+def _candidates(value: Any) -> Iterator[Any]:
+    if isinstance(value, list):
+        for item in value:
+            yield from _candidates(item)
+    elif isinstance(value, dict):
+        if "question" in value:
+            yield value
+            return
+        for key in _WRAPPER_KEYS:
+            if isinstance(value.get(key), (list, dict)):
+                yield from _candidates(value[key])
+                return
+
+
+def parse_quizzes(text: str) -> list[dict]:
+    """モデルの出力からクイズをすべて取り出す（形式が正しいものだけ）
+
+    コードブロックや前後の説明文が付いていても、配列でも1問ずつの
+    オブジェクトでも読める。同じ問題文は1度だけ返す。
+    """
+    quizzes = []
+    seen = set()
+    for value in iter_json_values(text):
+        for candidate in _candidates(value):
+            quiz = normalize_quiz(candidate)
+            if quiz is not None and quiz["question"] not in seen:
+                seen.add(quiz["question"])
+                quizzes.append(quiz)
+    return quizzes
@@ -0,0 +1,97 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+import aiohttp
+from django.conf import settings
+
+from .api_client import APIAuthError
+from .quiz_parser import normalize_quiz
+from .resilience import CircuitOpenError, backoff_delay
+
+
+class QuizPoolRefiller:
+    """バックエンドの問題プールに、常にtarget問の未出題の問題を用意しておく
+
+    バックグラウンドのタスクとしてinterval秒ごと、またはwake()で起こされたときに
+    プールの残数を確認し、足りない分を生成して補充する。generate(count)で
+    まとめて生成し、1回の補充はbatch_size問までにする。
+    """
+
+    def __init__(
+        self,
+        api,
+        generate: Callable[[int], Awaitable[list[dict]]],
+        target: Optional[int] = None,
+        interval: Optional[float] = None,
+        batch_size: Optional[int] = None,
+    ):
+        self.api = api
+        self.generate = generate
+        self.target = target if target is not None else settings.QUIZ_POOL_TARGET
+        self.interval = (
+            interval if interval is not None else settings.QUIZ_POOL_REFILL_INTERVAL
+        )
+        self.batch_size = (
+            batch_size if batch_size is not None else settings.QUIZ_POOL_BATCH_SIZE
+        )
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None and self.target > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self) -> None:
+        """問題を出題した直後などに、次の確認を待たずに補充させる"""
+        self._wake.set()
+
+    async def refill_once(self) -> int:
+        """足りない分を生成して補充し、追加できた問題数を返す"""
+        res = await self.api.quiz_question_pool()
+        if res.status_code != 200:
+            return 0
+        missing = min(self.target - res.data["fresh"], self.batch_size)
+        if missing <= 0:
+            return 0
+        try:
+            generated = await self.generate(missing)
+        except Exception as e:
+            print(f"Quiz generation failed: {e!r}")
+            return 0
+        questions = [q for q in map(normalize_quiz, generated) if q is not None]
+        if not questions:
+            return 0
+        res = await self.api.quiz_question_add(questions)
+        return res.data.get("created", 0) if res.status_code == 200 else 0
+
+    async def _run(self) -> None:
+        failures = 0
+        while True:
+            delay = self.interval
+            try:
+                await self.refill_once()
+                failures = 0
+            except (
+                APIAuthError,
+                CircuitOpenError,
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+            ) as e:
+                # バックエンドが落ちている間は間隔を空けて確認する
+                print(f"Quiz pool refill failed: {e!r}")
+                delay = max(delay, backoff_delay(failures, self.interval, 600))
+                failures += 1
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
@@ -1,18 +1,16 @@
 import asyncio
-import json
-import re
 from typing import List, Optional
 
 import discord
 from discord import app_commands
-from google import genai
 
-from .modules import (
-    quiz_result_list_request,
-    quiz_result_minus_request,
-    quiz_result_plus_request,
-    quiz_result_retrieve_request,
-)
+from .quiz_parser import is_valid_quiz
+
+# クイズ結果一覧に表示する人数（Embedのフィールド上限は25）
+QUIZ_LEADERBOARD_LIMIT = 10
+
+# 正解者が出なかったときに結果を表示するまでの秒数
+QUIZ_TIMEOUT_SECONDS = 60
 
 QUESTION = {
     "question": "APIからクイズが取得できませんでした。日本の首都は？",
@@ -21,29 +19,23 @@ QUESTION = {
 }
 
 
-def generate_quiz_request() -> dict:
-    client = genai.Client()
-    prompt = (
-        "あなたはクイズマスターです。3択クイズを出題してください。"
-        "クイズは以下のJSONフォーマットで出力してください。"
-        "\n{\n"
-        '  "question": "クイズの問題文",\n'
-        '  "choices": ["選択肢1", "選択肢2", "選択肢3"],\n'
-        '  "answer": 正解の選択肢の番号（0, 1, 2のいずれか）\n'
-        "}\n"
-        "\n例:\n"
-        '{\n  "question": "日本の首都はどこですか？",\n  "choices": ["大阪", "東京", "京都"],\n  "answer": 1\n}'
-    )
-    response = client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
-    content = response.text if hasattr(response, "text") else str(response)
-    # 最初に現れる { ... } のJSON部分のみ抽出
-    match = re.search(r"({[\s\S]*?})", content)
-    if match:
-        try:
-            return json.loads(match.group(1))
-        except Exception as e:
-            print(f"JSON parse error: {e}")
-    return {}
+async def pop_pooled_quiz(interaction: discord.Interaction) -> Optional[dict]:
+    """事前に生成しておいた問題をプールから取り出す。無ければNone"""
+    if interaction.guild is None:
+        return None
+    try:
+        res = await interaction.client.api.quiz_question_pop(
+            guild_id=interaction.guild.id, guild_name=interaction.guild.name
+        )
+    except Exception as e:
+        print(f"Quiz pool unavailable: {e!r}")
+        return None
+    finally:
+        # 取り出した分をすぐに補充させる
+        interaction.client.quiz_pool.wake()
+    if res.status_code != 200 or not is_valid_quiz(res.data):
+        return None
+    return res.data
 
 
 class QuizView(discord.ui.View):
@@ -60,6 +52,7 @@ class QuizView(discord.ui.View):
         for item in self.children:
             item.disabled = True
         self.stopped = True
+        self.stop()
         result_embed = discord.Embed(
             title="⏰ クイズ終了！",
             description=f"**正解:** `{answer_label}`",
@@ -69,10 +62,11 @@ class QuizView(discord.ui.View):
             result_embed.add_field(
                 name="正解者", value=self.correct_user.mention, inline=False
             )
-            quiz_result_plus_request(
-                token=interaction.client.token,
-                discord_id=self.correct_user.id,
-                username=self.correct_user.display_name,
+            interaction.client.results.add(
+                "quiz",
+                self.correct_user.id,
+                self.correct_user.display_name,
+                "correct_count",
             )
         else:
             result_embed.add_field(name="正解者", value="該当者なし", inline=False)
@@ -110,10 +104,11 @@ class QuizButton(discord.ui.Button):
                 embed=discord.Embed(description="❌ 不正解です。", color=0xFF0000),
                 ephemeral=True,
             )
-            quiz_result_minus_request(
-                token=interaction.client.token,
-                discord_id=interaction.user.id,
-                username=interaction.user.display_name,
+            interaction.client.results.add(
+                "quiz",
+                interaction.user.id,
+                interaction.user.display_name,
+                "failed_count",
             )
 
 
@@ -121,12 +116,15 @@ class QuizButton(discord.ui.Button):
 async def quiz(interaction: discord.Interaction):
     """3択クイズを出題し、60秒後に結果を表示"""
     await interaction.response.defer()
-    try:
-        q = await asyncio.to_thread(generate_quiz_request)
-        if not q or not all(k in q for k in ("question", "choices", "answer")):
+    q = await pop_pooled_quiz(interaction)
+    if q is None:
+        # プールが空のときだけ、その場で生成する
+        try:
+            q = await interaction.client.quiz_generator.generate_one()
+            if not is_valid_quiz(q):
+                q = QUESTION
+        except Exception:
             q = QUESTION
-    except Exception:
-        q = QUESTION
     embed = discord.Embed(
         title="🧠 3択クイズ",
         description=f"**{q['question']}**",
@@ -137,8 +135,11 @@ async def quiz(interaction: discord.Interaction):
     embed.set_footer(text="60秒以内に回答してください！")
     view = QuizView(q["choices"], q["answer"])
     await interaction.followup.send(embed=embed, view=view)
-    # 60秒経過時にまだ正解者がいなければ自動で終了
-    await asyncio.sleep(60)
+    # 60秒経過時にまだ正解者がいなければ自動で終了（正解者が出たらすぐ戻る）
+    try:
+        await asyncio.wait_for(view.wait(), timeout=QUIZ_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        pass
     if not view.stopped:
         await view.show_result(interaction, q["choices"][q["answer"]])
 
@@ -147,11 +148,14 @@ async def quiz(interaction: discord.Interaction):
     name="quiz-result-list", description="サーバー内のクイズ結果を表示します"
 )
 async def quiz_result_list(interaction: discord.Interaction):
-    """サーバー内のクイズ結果を表示"""
-    res = quiz_result_list_request(
-        token=interaction.client.token,
+    """サーバー内のクイズ結果を正解数の多い順に表示"""
+    res = await interaction.client.api.leaderboard(
+        game="quiz",
         guild_id=interaction.guild.id,
         guild_name=interaction.guild.name,
+        order_by="correct_count",
+        limit=QUIZ_LEADERBOARD_LIMIT,
+        discord_id=interaction.user.id,
     )
     if res.status_code == 200:
         data = res.json()
@@ -160,15 +164,17 @@ async def quiz_result_list(interaction: discord.Interaction):
             description=f"**{interaction.guild.name}** サーバーのクイズ結果",
             color=0x2ECC71,
         )
-        for result in data:
+        for i, result in enumerate(data["results"], 1):
             username = result.get("username", "不明なユーザー")
             correct = result.get("correct_count", 0)
-            incorrect = result.get("incorrect_count", 0)
+            incorrect = result.get("failed_count", 0)
             embed.add_field(
-                name=username,
+                name=f"{i}. {username}",
                 value=f"正解: {correct} / 不正解: {incorrect}",
                 inline=False,
             )
+        if data["me"]:
+            embed.set_footer(text=f"あなたの順位: {data['me']['rank']}位")
         await interaction.response.send_message(embed=embed)
     else:
         await interaction.response.send_message(
@@ -179,15 +185,14 @@ async def quiz_result_list(interaction: discord.Interaction):
 @app_commands.command(name="quiz-result", description="3択クイズの結果を表示します")
 async def quiz_result(interaction: discord.Interaction):
     """ユーザーのクイズ結果を表示"""
-    res = quiz_result_retrieve_request(
-        token=interaction.client.token,
+    res = await interaction.client.api.quiz_result_retrieve(
         discord_id=interaction.user.id,
         username=interaction.user.display_name,
     )
     if res.status_code == 200:
         data = res.json()
         correct = data.get("correct_count", 0)
-        incorrect = data.get("incorrect_count", 0)
+        incorrect = data.get("failed_count", 0)
         embed = discord.Embed(
             title="📊 クイズ結果",
             description=f"**{interaction.user.display_name}** さんのクイズ結果",
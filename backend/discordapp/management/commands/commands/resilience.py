@@ -0,0 +1,202 @@
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Optional, Protocol
+
+import aiohttp
+
+# 冪等でない呼び出し（カウンタの加算など）でも再試行してよいステータス
+# 503はサーバーが処理を始める前に断っているので、二重に加算されることはない
+RETRY_ALWAYS_STATUSES = frozenset({429, 503})
+
+# 冪等な呼び出しに限って再試行するステータス
+RETRY_IDEMPOTENT_STATUSES = frozenset({500, 502, 504})
+
+
+class CircuitOpenError(Exception):
+    """サーキットが開いているため、バックエンドを呼ばずに失敗した"""
+
+
+class Response(Protocol):
+    status_code: int
+    retry_after: Optional[float]
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """attempt回目（0始まり）の再試行までの待ち時間
+
+    指数バックオフにフルジッターを掛け、同時に失敗した呼び出しの再試行を散らす。
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class RetryPolicy:
+    """どの失敗を何回、どれだけ待って再試行するかを決める"""
+
+    def __init__(self, attempts: int, backoff: float, backoff_max: float):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+    def should_retry_status(self, status: int, idempotent: bool) -> bool:
+        """4xxは何度送っても成功しないので、429以外は再試行しない"""
+        if status in RETRY_ALWAYS_STATUSES:
+            return True
+        return idempotent and status in RETRY_IDEMPOTENT_STATUSES
+
+    def should_retry_error(self, error: BaseException, idempotent: bool) -> bool:
+        """接続できなかった場合は、リクエストが届いていないので常に再試行してよい
+
+        送信後のタイムアウトや切断は、サーバーが処理したかどうか分からないため
+        冪等な呼び出しに限る。
+        """
+        if isinstance(error, aiohttp.ClientConnectorError):
+            return True
+        return idempotent and isinstance(
+            error, (aiohttp.ClientError, asyncio.TimeoutError)
+        )
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return backoff_delay(attempt, self.backoff, self.backoff_max)
+
+
+class CircuitBreaker:
+    """連続した失敗でサーキットを開き、しばらくの間は呼び出しを即座に失敗させる
+
+    reset_timeout秒が経つと半開状態になり、1件だけ試しに通す。
+    成功すれば閉じ、失敗すればまた開く。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if (
+            self._state == self.OPEN
+            and self._clock() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self) -> None:
+        """結果が分からないまま終わった試行の枠を空け、次の呼び出しに試させる"""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        self._state = self.CLOSED
+        self._failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> bool:
+        """失敗を記録し、これでサーキットが開いた場合はTrueを返す"""
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            opened = self._state != self.OPEN
+            self._state = self.OPEN
+            self._opened_at = self._clock()
+            self._trial_in_flight = False
+            return opened
+        return False
+
+
+class ResilientCaller:
+    """再試行ポリシーとサーキットブレーカーを組み合わせて呼び出しを実行する
+
+    send は1回分のリクエストを送るコルーチン関数で、status_code と
+    retry_after を持つレスポンスを返す。APIの各エンドポイントはこれを通して呼ぶ。
+    """
+
+    def __init__(self, policy: RetryPolicy, breaker: CircuitBreaker):
+        self.policy = policy
+        self.breaker = breaker
+        self.counters: Counter[str] = Counter()
+
+    async def call(
+        self, send: Callable[[], Awaitable[Response]], idempotent: bool
+    ) -> Response:
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.counters["short_circuited"] += 1
+                raise CircuitOpenError("backend API circuit is open")
+            self.counters["attempts"] += 1
+            try:
+                response = await send()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._record_failure()
+                attempt += 1
+                if attempt >= self.policy.attempts or not (
+                    self.policy.should_retry_error(e, idempotent)
+                ):
+                    self.counters["failures"] += 1
+                    raise
+                await self._sleep(attempt - 1)
+                continue
+            except asyncio.CancelledError:
+                # キャンセルはバックエンドの障害ではないので、試行の枠だけ返す
+                self.breaker.release_trial()
+                raise
+            except BaseException:
+                # 想定外の例外でも半開状態の試行を使い切ったままにしない
+                self._record_failure()
+                self.counters["failures"] += 1
+                raise
+            if response.status_code >= 500:
+                self._record_failure()
+            else:
+                # 4xxはバックエンドが正常に応答しているので、障害には数えない
+                self.breaker.record_success()
+            if not self.policy.should_retry_status(response.status_code, idempotent):
+                return response
+            attempt += 1
+            if attempt >= self.policy.attempts:
+                self.counters["failures"] += 1
+                return response
+            await self._sleep(attempt - 1, response.retry_after)
+
+    def metrics(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "attempts": self.counters["attempts"],
+            "retries": self.counters["retries"],
+            "failures": self.counters["failures"],
+            "short_circuited": self.counters["short_circuited"],
+            "circuit_opened": self.counters["circuit_opened"],
+        }
+
+    def _record_failure(self) -> None:
+        if self.breaker.record_failure():
+            self.counters["circuit_opened"] += 1
+
+    async def _sleep(self, attempt: int, retry_after: Optional[float] = None) -> None:
+        self.counters["retries"] += 1
+        await asyncio.sleep(self.policy.delay(attempt, retry_after))
@@ -0,0 +1,228 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+from django.conf import settings
+
+from .api_client import APIAuthError
+from .resilience import CircuitOpenError
+
+
+class ResultWriteBuffer:
+    """ゲーム結果の加算をまとめてから送るライトビハインドバッファ
+
+    加算は (game, discord_id, field) ごとに合算してメモリに貯め、
+    flush_interval秒ごと、または貯まったキーがmax_pendingに達したときに
+    results/batch/ へ1回のリクエストで送る。
+
+    加算はジャーナルファイルにも1行ずつ追記するので、送る前にプロセスが
+    落ちても、次の起動時にstart()で読み戻して送り直せる。ファイルへの書き込みは
+    イベントループを止めないよう、溜まった行をまとめて別スレッドで行う。
+    送信に成功したらジャーナルをまだ送っていない分だけに書き直す。
+    送信の結果が分からない失敗（タイムアウトなど）も送り直すため、
+    加算は少なくとも1回適用される。
+    """
+
+    def __init__(
+        self,
+        api,
+        journal_path: Optional[str] = None,
+        flush_interval: Optional[float] = None,
+        max_pending: Optional[int] = None,
+    ):
+        self.api = api
+        journal_path = (
+            journal_path if journal_path is not None else settings.RESULT_BUFFER_JOURNAL
+        )
+        self.journal_path = Path(journal_path) if journal_path else None
+        self.flush_interval = (
+            flush_interval
+            if flush_interval is not None
+            else settings.RESULT_BUFFER_FLUSH_INTERVAL
+        )
+        self.max_pending = (
+            max_pending
+            if max_pending is not None
+            else settings.RESULT_BUFFER_MAX_PENDING
+        )
+        # (game, discord_id, field) -> [username, delta]
+        self._pending: dict[tuple[str, str, str], list] = {}
+        self._journal = None
+        # ジャーナルにまだ書いていない行
+        self._unwritten: list[str] = []
+        self._journal_lock = asyncio.Lock()
+        self._journal_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._size_flush: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """まだ送っていない (game, discord_id, field) の数"""
+        return len(self._pending)
+
+    async def start(self) -> None:
+        """ジャーナルに残っている加算を読み戻し、定期送信を始める"""
+        if self.journal_path is not None:
+            self._replay_journal()
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_periodically())
+
+    async def close(self) -> None:
+        """定期送信を止め、残りを送ってからジャーナルを閉じる"""
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+        await self.flush()
+        await self._write_journal()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def add(
+        self, game: str, discord_id, username: str, field: str, delta: int = 1
+    ) -> None:
+        """加算を1件積む。送信は後でまとめて行う"""
+        event = {
+            "game": game,
+            "discord_id": str(discord_id),
+            "username": username,
+            "field": field,
+            "delta": delta,
+        }
+        self._merge(event)
+        if self._journal is not None:
+            self._unwritten.append(json.dumps(event, ensure_ascii=False) + "\n")
+            if self._journal_task is None or self._journal_task.done():
+                self._journal_task = asyncio.create_task(self._write_journal())
+        if len(self._pending) >= self.max_pending and (
+            self._size_flush is None or self._size_flush.done()
+        ):
+            self._size_flush = asyncio.create_task(self._flush_in_background())
+
+    async def flush(self) -> bool:
+        """貯まっている加算を1回のリクエストで送る。送れなかった分は戻す"""
+        async with self._flush_lock:
+            if not self._pending:
+                return True
+            events = self._events()
+            self._pending = {}
+            try:
+                res = await self.api.result_batch(events)
+            except (
+                APIAuthError,
+                CircuitOpenError,
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+            ) as e:
+                print(f"Failed to flush {len(events)} result events: {e!r}")
+                self._restore(events)
+                return False
+            except BaseException:
+                # キャンセルや想定外の例外でも、送れたか分からない加算は捨てない
+                self._restore(events)
+                raise
+            if res.status_code >= 500 or res.status_code in (401, 429):
+                print(f"Failed to flush result events: status {res.status_code}")
+                self._restore(events)
+                return False
+            if res.status_code != 200:
+                # 不正なイベントは何度送っても通らないので捨てる
+                print(f"Dropped {len(events)} result events: {res.data}")
+            await self._compact_journal()
+            return True
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush_in_background()
+
+    async def _flush_in_background(self) -> None:
+        """タスクから送る。想定外の例外でも定期送信を止めず、次の機会に送り直す"""
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Failed to flush result events: {e!r}")
+
+    def _events(self) -> list[dict]:
+        return [
+            {
+                "game": game,
+                "discord_id": discord_id,
+                "username": username,
+                "field": field,
+                "delta": delta,
+            }
+            for (game, discord_id, field), (username, delta) in self._pending.items()
+        ]
+
+    def _merge(self, event: dict) -> None:
+        key = (event["game"], event["discord_id"], event["field"])
+        entry = self._pending.get(key)
+        if entry is None:
+            self._pending[key] = [event["username"], event["delta"]]
+        else:
+            # 名前は最後に見たものを使う
+            entry[0] = event["username"]
+            entry[1] += event["delta"]
+
+    def _restore(self, events: list[dict]) -> None:
+        """送れなかった加算を、送信中に積まれた加算と合わせて戻す"""
+        newer = self._events()
+        self._pending = {}
+        for event in events + newer:
+            self._merge(event)
+
+    def _replay_journal(self) -> None:
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                self._merge(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                # 書き込み途中で落ちた最後の行などは読み飛ばす
+                continue
+
+    async def _write_journal(self) -> None:
+        """溜まった行をまとめてジャーナルに追記する"""
+        async with self._journal_lock:
+            while self._unwritten and self._journal is not None:
+                lines, self._unwritten = self._unwritten, []
+                await asyncio.to_thread(self._append_journal, lines)
+
+    def _append_journal(self, lines: list[str]) -> None:
+        self._journal.writelines(lines)
+        self._journal.flush()
+
+    async def _compact_journal(self) -> None:
+        """ジャーナルを未送信の加算だけに書き直す"""
+        async with self._journal_lock:
+            if self._journal is None:
+                return
+            # まだ書いていない行の加算も_pendingに含まれているので、書き直しに任せる
+            self._unwritten = []
+            lines = [
+                json.dumps(event, ensure_ascii=False) + "\n" for event in self._events()
+            ]
+            await asyncio.to_thread(self._rewrite_journal, lines)
+
+    def _rewrite_journal(self, lines: list[str]) -> None:
+        tmp_path = self.journal_path.with_name(self.journal_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal.close()
+        os.replace(tmp_path, self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
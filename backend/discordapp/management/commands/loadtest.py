@@ -0,0 +1,457 @@
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Optional
+
+import aiohttp
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from .commands.api_client import APIAuthError, APIClient
+from .commands.member_sync import GuildMemberSyncer
+from .commands.resilience import CircuitOpenError
+
+# シナリオ名 -> 既定の重み
+DEFAULT_MIX = {"quiz": 4, "flash": 2, "join": 1, "leaderboard": 3}
+
+# スノーフレークに似たID（桁数を本物に合わせる）
+GUILD_ID_BASE = 800_000_000_000_000_000
+USER_ID_BASE = 900_000_000_000_000_000
+
+# 加算したフィールド -> それを加算したエンドポイント（増分が失われていないかの確認用）
+INCREMENT_ENDPOINTS = {
+    ("quiz", "correct_count"): "quiz-result/plus",
+    ("quiz", "failed_count"): "quiz-result/minus",
+    ("flash", "play_count"): "results/batch",
+    ("flash", "correct_count"): "results/batch",
+}
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    """ "quiz=4,flash=2" の形式のシナリオの重みを読む（省略したものは0）"""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise CommandError(f"unknown scenario: {name}")
+        try:
+            mix[name] = int(weight)
+        except ValueError:
+            raise CommandError(f"invalid weight for {name}: {weight}")
+    if not any(mix.values()):
+        raise CommandError("at least one scenario needs a positive weight")
+    return mix
+
+
+def percentile(values: list[float], p: float) -> float:
+    """ソート済みのvaluesのp%点（最近傍順位法）"""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+class EndpointStats:
+    """エンドポイントごとの応答時間とエラー数"""
+
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.errors = 0
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies)
+
+
+class TrafficSimulator:
+    """複数のBotがバックエンドAPIに送るトラフィックを再現する
+
+    各Botは自分のAPIClient（接続プールとトークン）を持ち、重みに従って
+    シナリオ（クイズの正解・不正解の連続、/flash終了時のまとめ書き込み、
+    メンバーの参加、リーダーボードの表示）を休まずに繰り返す。
+    成功した加算を覚えておき、最後にAPIから読み直して失われた増分を数える。
+    """
+
+    def __init__(
+        self,
+        api_factory: Callable[[], APIClient],
+        bots: int = 20,
+        guilds: int = 10,
+        members: int = 50,
+        mix: Optional[dict[str, int]] = None,
+        seed: int = 0,
+    ):
+        self.api_factory = api_factory
+        self.bots = bots
+        self.guilds = [
+            (str(GUILD_ID_BASE + g), f"loadtest guild {g}") for g in range(guilds)
+        ]
+        self.members = {
+            guild_id: [
+                (str(USER_ID_BASE + g * 1_000_000 + i), f"user {g}-{i}")
+                for i in range(members)
+            ]
+            for g, (guild_id, _) in enumerate(self.guilds)
+        }
+        self.usernames = {
+            discord_id: name
+            for members in self.members.values()
+            for discord_id, name in members
+        }
+        self.mix = mix or DEFAULT_MIX
+        self.seed = seed
+        self.stats: dict[str, EndpointStats] = {}
+        # (ゲーム, フィールド, discord_id) -> 成功した加算の合計
+        self.expected: Counter = Counter()
+        self._joined = 0
+
+    async def run(self, seconds: float) -> float:
+        """seconds秒間トラフィックを流し、かかった時間を返す"""
+        apis = [self.api_factory() for _ in range(self.bots)]
+        try:
+            for api in apis:
+                await api.start()
+            # ログインは計測に含めない
+            await asyncio.gather(*(api.tokens.get() for api in apis))
+            await self._setup(apis[0])
+            deadline = time.perf_counter() + seconds
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(self._bot(i, api, deadline) for i, api in enumerate(apis))
+            )
+            return time.perf_counter() - started
+        finally:
+            for api in apis:
+                await api.close()
+
+    async def _setup(self, api: APIClient) -> None:
+        """起動時の同期と同じように、ギルドのメンバーを登録しておく"""
+        syncer = GuildMemberSyncer(api)
+        for guild_id, guild_name in self.guilds:
+            await syncer.sync_members(
+                int(guild_id),
+                guild_name,
+                [
+                    (int(discord_id), name)
+                    for discord_id, name in self.members[guild_id]
+                ],
+            )
+
+    async def _bot(self, index: int, api: APIClient, deadline: float) -> None:
+        rng = random.Random(self.seed * 100_003 + index)
+        names = [name for name, weight in self.mix.items() if weight > 0]
+        weights = [self.mix[name] for name in names]
+        while time.perf_counter() < deadline:
+            scenario = rng.choices(names, weights)[0]
+            await getattr(self, f"_{scenario}")(api, rng)
+
+    async def _call(
+        self,
+        endpoint: str,
+        request: Awaitable,
+        increments: tuple = (),
+    ) -> None:
+        stats = self.stats.setdefault(endpoint, EndpointStats())
+        started = time.perf_counter()
+        try:
+            res = await request
+            ok = 200 <= res.status_code < 300
+        except (
+            APIAuthError,
+            CircuitOpenError,
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+        ):
+            ok = False
+        stats.latencies.append(time.perf_counter() - started)
+        if not ok:
+            stats.errors += 1
+            return
+        for key in increments:
+            self.expected[key] += 1
+
+    async def _quiz(self, api: APIClient, rng: random.Random) -> None:
+        """1問の回答: 参加者全員の正解・不正解が同時に届く"""
+        guild_id, _ = rng.choice(self.guilds)
+        players = rng.sample(self.members[guild_id], rng.randint(2, 8))
+        requests = []
+        for discord_id, name in players:
+            if rng.random() < 0.6:
+                requests.append(
+                    self._call(
+                        "quiz-result/plus",
+                        api.quiz_result_plus(discord_id, name),
+                        (("quiz", "correct_count", discord_id),),
+                    )
+                )
+            else:
+                requests.append(
+                    self._call(
+                        "quiz-result/minus",
+                        api.quiz_result_minus(discord_id, name),
+                        (("quiz", "failed_count", discord_id),),
+                    )
+                )
+        await asyncio.gather(*requests)
+
+    async def _flash(self, api: APIClient, rng: random.Random) -> None:
+        """/flashの終了: 参加者の結果を1回のリクエストでまとめて送る"""
+        guild_id, _ = rng.choice(self.guilds)
+        players = rng.sample(self.members[guild_id], rng.randint(1, 6))
+        events, increments = [], []
+        for discord_id, name in players:
+            fields = ["play_count"]
+            if rng.random() < 0.5:
+                fields.append("correct_count")
+            for field in fields:
+                events.append(
+                    {
+                        "game": "flash",
+                        "discord_id": discord_id,
+                        "username": name,
+                        "field": field,
+                        "delta": 1,
+                    }
+                )
+                increments.append(("flash", field, discord_id))
+        await self._call("results/batch", api.result_batch(events), tuple(increments))
+
+    async def _join(self, api: APIClient, rng: random.Random) -> None:
+        """新しいメンバーがギルドに参加する"""
+        guild_id, guild_name = rng.choice(self.guilds)
+        self._joined += 1
+        discord_id = str(USER_ID_BASE + 999_000_000 + self._joined)
+        await self._call(
+            "guild/add-member",
+            api.add_member_to_guild(
+                guild_id, guild_name, discord_id, f"joined {self._joined}"
+            ),
+        )
+
+    async def _leaderboard(self, api: APIClient, rng: random.Random) -> None:
+        guild_id, guild_name = rng.choice(self.guilds)
+        game = rng.choice(("quiz", "flash"))
+        await self._call(
+            f"leaderboard/{game}",
+            api.leaderboard(game, guild_id, guild_name, limit=10),
+        )
+
+    async def lost_increments(self, concurrency: int = 20) -> Counter:
+        """エンドポイントごとの、成功したのに保存されていない増分の数"""
+        api = self.api_factory()
+        await api.start()
+        semaphore = asyncio.Semaphore(concurrency)
+        users = {(game, discord_id) for game, _, discord_id in self.expected.keys()}
+        stored = {}
+
+        async def fetch(game: str, discord_id: str) -> None:
+            retrieve = (
+                api.quiz_result_retrieve
+                if game == "quiz"
+                else api.flash_result_retrieve
+            )
+            async with semaphore:
+                res = await retrieve(discord_id, self.usernames[discord_id])
+            if res.status_code != 200:
+                raise CommandError(f"could not read back {game} result of {discord_id}")
+            stored[game, discord_id] = res.data
+
+        try:
+            await asyncio.gather(*(fetch(game, user) for game, user in users))
+        finally:
+            await api.close()
+        lost = Counter()
+        for (game, field, discord_id), count in self.expected.items():
+            endpoint = INCREMENT_ENDPOINTS[game, field]
+            lost[endpoint] += count - stored[game, discord_id][field]
+        return lost
+
+
+class Command(BaseCommand):
+    help = (
+        "replays simulated bot traffic against the results API and reports "
+        "latency percentiles, throughput and lost increments per endpoint "
+        "(starts the API on a scratch database unless --url is given)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bots", type=int, default=20)
+        parser.add_argument("--seconds", type=float, default=20.0)
+        parser.add_argument("--guilds", type=int, default=10)
+        parser.add_argument("--members", type=int, default=50)
+        parser.add_argument(
+            "--mix",
+            type=parse_mix,
+            default=DEFAULT_MIX,
+            help="scenario weights, e.g. quiz=4,flash=2,join=1,leaderboard=3",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--url",
+            help="test an already running API (e.g. http://127.0.0.1:8000/api) "
+            "instead of starting one; its data will be modified",
+        )
+        parser.add_argument(
+            "--database-url",
+            help="scratch database for the started API (default: a new SQLite file); "
+            "it is migrated and written to",
+        )
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--port", type=int, default=8765)
+
+    def handle(self, *args, **options):
+        if options["url"]:
+            return self.run(options["url"], options)
+        scratch = tempfile.mkdtemp(prefix="loadtest-")
+        server = None
+        try:
+            server, url = self.start_server(scratch, options)
+            self.run(url, options)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def start_server(self, scratch: str, options: dict):
+        """スクラッチのDBを用意してAPIをuvicornで起動する"""
+        database_url = (
+            options["database_url"] or f"sqlite:///{scratch}/loadtest.sqlite3"
+        )
+        env = {
+            **os.environ,
+            "DATABASE_URL": database_url,
+            # DEBUGにすると全クエリを記録して遅くなるので、ホストを許可する
+            "DEBUG": "False",
+            "ALLOWED_HOSTS": "127.0.0.1",
+            "ADMIN_USERNAME": settings.ADMIN_USERNAME,
+            "ADMIN_PASSWORD": settings.ADMIN_PASSWORD,
+            "DJANGO_SUPERUSER_PASSWORD": settings.ADMIN_PASSWORD,
+        }
+        manage_py = str(settings.BASE_DIR / "manage.py")
+        self.stdout.write(f"Preparing scratch database {database_url}")
+        for command in (
+            ["migrate", "--noinput"],
+            [
+                "createsuperuser",
+                "--noinput",
+                f"--username={settings.ADMIN_USERNAME}",
+                "--email=loadtest@example.com",
+            ],
+        ):
+            done = subprocess.run(
+                [sys.executable, manage_py, *command],
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            if done.returncode != 0:
+                raise CommandError(f"{command[0]} failed:\n{done.stderr}")
+
+        url = f"http://127.0.0.1:{options['port']}/api"
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "backend.asgi:application",
+                "--host=127.0.0.1",
+                f"--port={options['port']}",
+                f"--workers={options['workers']}",
+                "--log-level=warning",
+                "--no-access-log",
+            ],
+            cwd=settings.BASE_DIR,
+            env=env,
+        )
+        try:
+            asyncio.run(self.wait_until_ready(url, server))
+        except BaseException:
+            server.terminate()
+            server.wait()
+            raise
+        return server, url
+
+    async def wait_until_ready(
+        self, url: str, server: subprocess.Popen, timeout: float = 30.0
+    ) -> None:
+        """ログインして/metricsが読めるまで待つ（/metricsはトークンが必要）"""
+        deadline = time.monotonic() + timeout
+        credentials = {
+            "username": settings.ADMIN_USERNAME,
+            "password": settings.ADMIN_PASSWORD,
+        }
+        token = ""
+        async with aiohttp.ClientSession() as session:
+            while time.monotonic() < deadline:
+                if server.poll() is not None:
+                    raise CommandError("the API server exited while starting")
+                try:
+                    if not token:
+                        async with session.post(
+                            f"{url}/login/", json=credentials
+                        ) as res:
+                            if res.status == 200:
+                                token = (await res.json()).get("token", "")
+                    if token:
+                        async with session.get(
+                            f"{url}/metrics",
+                            headers={"Authorization": f"Token {token}"},
+                        ) as res:
+                            if res.status == 200:
+                                return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise CommandError("the API server did not start in time")
+
+    def run(self, url: str, options: dict) -> None:
+        simulator = TrafficSimulator(
+            # トークンのキャッシュファイルは使わない（Botごとにログインする）
+            lambda: APIClient(base_url=url, token_cache_path=""),
+            bots=options["bots"],
+            guilds=options["guilds"],
+            members=options["members"],
+            mix=options["mix"],
+            seed=options["seed"],
+        )
+        self.stdout.write(
+            f"{options['bots']} bots, {options['guilds']} guilds x "
+            f"{options['members']} members, {options['seconds']:g}s against {url}"
+        )
+        elapsed = asyncio.run(simulator.run(options["seconds"]))
+        lost = asyncio.run(simulator.lost_increments())
+        self.report(simulator.stats, lost, elapsed)
+
+    def report(self, stats: dict, lost: Counter, elapsed: float) -> None:
+        self.stdout.write(
+            f"{'endpoint':<20} {'requests':>8} {'errors':>7} {'req/s':>8} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'lost':>6}"
+        )
+        for endpoint in sorted(stats):
+            s = stats[endpoint]
+            latencies = sorted(s.latencies)
+            lost_count = (
+                str(lost[endpoint]) if endpoint in INCREMENT_ENDPOINTS.values() else "-"
+            )
+            self.stdout.write(
+                f"{endpoint:<20} {s.requests:>8} {s.errors:>7} "
+                f"{s.requests / elapsed:>8.1f} "
+                f"{percentile(latencies, 50) * 1000:>8.1f} "
+                f"{percentile(latencies, 95) * 1000:>8.1f} "
+                f"{percentile(latencies, 99) * 1000:>8.1f} "
+                f"{lost_count:>6}"
+            )
+        total = sum(s.requests for s in stats.values())
+        self.stdout.write(
+            f"total: {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s), "
+            f"{sum(s.errors for s in stats.values())} errors, "
+            f"{sum(lost.values())} lost increments"
+        )
@@ -1,51 +1,165 @@
+import signal
+import subprocess
+import sys
+import time
+from typing import Optional
+
 import discord
-from discord import app_commands
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
-from .commands import modules, quizcmd
+from .commands import quizcmd
+from .commands.api_client import APIClient
 from .commands.bluff_number.bluff_number import bluff_number
+from .commands.bluff_number.bluff_number_views import rehydrate_games
 from .commands.flash import flash
+from .commands.gateway import INTENT_PROFILES, client_options
+from .commands.instrumentation import (
+    InstrumentedCommandTree,
+    LoopLagMonitor,
+    MetricsServer,
+    finish_command,
+    watch_api_client,
+    watch_quiz_generator,
+)
+from .commands.member_sync import GuildMemberSyncer
 from .commands.nyaagenesis import nyaagenesis
+from .commands.quiz_generator import QuizGenerator
+from .commands.quiz_pool import QuizPoolRefiller
+from .commands.write_buffer import ResultWriteBuffer
 from .commands.wakewake import wake1
 
 CustomUser = get_user_model()
 
+# 別々のプロセスのシャードを続けて接続するときの間隔
+# （IDENTIFYは5秒に1回までに制限されている）
+IDENTIFY_INTERVAL = 5.0
+
+
+def parse_shard_ids(value: str) -> list[int]:
+    """ "0,2,4" の形式のシャードIDの一覧を読む"""
+    try:
+        return sorted({int(v) for v in value.split(",") if v.strip()})
+    except ValueError:
+        raise CommandError(f"invalid shard ids: {value}")
+
+
+def split_shards(shard_count: int, processes: int) -> list[list[int]]:
+    """シャードをプロセスごとのグループに順番に振り分ける"""
+    return [list(range(i, shard_count, processes)) for i in range(processes)]
+
+
+def shard_journal_path(shard_ids: Optional[list[int]]) -> str:
+    """結果のジャーナルはプロセスごとに別のファイルにする"""
+    journal = settings.RESULT_BUFFER_JOURNAL
+    if not journal or shard_ids is None:
+        return journal
+    return f"{journal}.shards-{'-'.join(map(str, shard_ids))}"
+
+
+def metrics_port(shard_ids: Optional[list[int]]) -> int:
+    """メトリクスのポートはプロセスごとにずらす（0なら公開しない）
 
-class MyClient(discord.Client):
+    シャードは順番に振り分けるので、最小のシャードIDはプロセスごとに異なる。
+    """
+    port = settings.BOT_METRICS_PORT
+    if not port or shard_ids is None:
+        return port
+    return port + min(shard_ids)
+
+
+class MyClient(discord.AutoShardedClient):
+    """シャードに対応したBot
+
+    shard_idsを指定すると、そのシャードだけをこのプロセスで動かす。
+    プロセスごとの状態（結果のジャーナル、再開するゲーム）は
+    受け持つシャードで分け、クイズの問題プールの補充はシャード0を
+    受け持つプロセスだけが行う。
+    """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.tree = app_commands.CommandTree(self)
-        self.token = self.get_token()
-
-    def get_token(self) -> str:
-        res = modules.login_request()
-        return res.json().get("token", "")
+        self.tree = InstrumentedCommandTree(self)
+        self.api = APIClient()
+        watch_api_client(self.api)
+        self.results = ResultWriteBuffer(
+            self.api, journal_path=shard_journal_path(self.shard_ids)
+        )
+        self.quiz_generator = QuizGenerator()
+        watch_quiz_generator(self.quiz_generator)
+        self.quiz_pool = QuizPoolRefiller(self.api, self.quiz_generator.generate)
+        self.member_sync = GuildMemberSyncer(self.api)
+        self.loop_monitor = LoopLagMonitor()
+        self.metrics_server = MetricsServer(port=metrics_port(self.shard_ids))
 
     async def setup_hook(self):
+        self.loop_monitor.start()
+        if self.metrics_server.port:
+            await self.metrics_server.start()
+        # トークンは最初のAPI呼び出し時に取得するので、ここではログインしない
+        await self.api.start()
+        await self.results.start()
+        if self.shard_ids is None or 0 in self.shard_ids:
+            self.quiz_pool.start()
+        # 再起動前に進行中だったブラフナンバーを続きから再開する
+        resumed = await rehydrate_games(self)
+        if resumed:
+            print(f"Resumed {resumed} bluff number game(s)")
         await self.tree.sync()
 
+    async def close(self):
+        await self.member_sync.close()
+        await self.quiz_pool.close()
+        # 貯まっている結果を送り切ってから接続を閉じる
+        await self.results.close()
+        await self.api.close()
+        await self.metrics_server.close()
+        await self.loop_monitor.close()
+        await super().close()
+
     async def on_ready(self):
-        print(f"We have logged in as {self.user}")
+        print(f"We have logged in as {self.user} (shards: {self.shard_ids or 'all'})")
+
+    async def on_app_command_completion(self, interaction, command):
+        finish_command(interaction, "ok")
+
+    async def on_shard_ready(self, shard_id):
+        print(f"Shard {shard_id}/{self.shard_count} is ready")
+
+    async def on_guild_available(self, guild):
+        """起動時などにギルドが使えるようになったら、メンバーをまとめて同期する"""
+        if self.intents.members:
+            self.member_sync.schedule(guild)
+
+    async def on_guild_join(self, guild):
+        """Botがギルドに追加されたら、メンバーをまとめて同期する"""
+        if self.intents.members:
+            self.member_sync.schedule(guild)
 
     async def on_member_join(self, member):
         """メンバーがサーバーに参加したときのイベント"""
-        res = modules.add_member_to_guild_request(
+        await self.api.add_member_to_guild(
             guild_id=member.guild.id,
             guild_name=member.guild.name,
             discord_id=str(member.id),
             username=member.display_name,
         )
 
-    async def on_member_remove(self, member):
-        """メンバーがサーバーから退出したときのイベント"""
-        res = modules.remove_member_from_guild_request(
-            guild_id=member.guild.id,
-            guild_name=member.guild.name,
-            discord_id=str(member.id),
-            username=member.display_name,
+    async def on_raw_member_remove(self, payload):
+        """メンバーがサーバーから退出したときのイベント
+
+        メンバーを全てはキャッシュしないので、キャッシュに無いメンバーでも
+        届くrawイベントを使う。
+        """
+        guild = self.get_guild(payload.guild_id)
+        if guild is None:
+            return
+        await self.api.remove_member_from_guild(
+            guild_id=guild.id,
+            guild_name=guild.name,
+            discord_id=str(payload.user.id),
+            username=payload.user.display_name,
         )
 
     async def on_voice_state_update(self, member, before, after):
@@ -56,18 +170,109 @@ class MyClient(discord.Client):
             )
 
 
-client = MyClient(intents=discord.Intents.all())
-client.tree.add_command(quizcmd.quiz)
-client.tree.add_command(quizcmd.quiz_result_list)
-client.tree.add_command(quizcmd.quiz_result)
-client.tree.add_command(wake1)
-client.tree.add_command(flash)
-client.tree.add_command(bluff_number)
-client.tree.add_command(nyaagenesis)
+def create_client(
+    shard_count: Optional[int] = None,
+    shard_ids: Optional[list[int]] = None,
+    intents_profile: Optional[str] = None,
+) -> MyClient:
+    client = MyClient(
+        **client_options(intents_profile),
+        shard_count=shard_count,
+        shard_ids=shard_ids,
+    )
+    client.tree.add_command(quizcmd.quiz)
+    client.tree.add_command(quizcmd.quiz_result_list)
+    client.tree.add_command(quizcmd.quiz_result)
+    client.tree.add_command(wake1)
+    client.tree.add_command(flash)
+    client.tree.add_command(bluff_number)
+    client.tree.add_command(nyaagenesis)
+    return client
 
 
 class Command(BaseCommand):
     help = "runs the discord bot"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shards",
+            type=int,
+            help="total number of shards (default: Discord's recommendation)",
+        )
+        parser.add_argument(
+            "--shard-ids",
+            type=parse_shard_ids,
+            help="comma separated shard ids to run in this process",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="split the shards over this many bot processes",
+        )
+        parser.add_argument(
+            "--intents",
+            choices=INTENT_PROFILES,
+            help="gateway intents profile (default: DISCORD_INTENTS_PROFILE)",
+        )
+
     def handle(self, *args, **options):
+        shard_count = options["shards"]
+        shard_ids = options["shard_ids"]
+        processes = options["processes"]
+        if shard_count is not None and shard_count < 1:
+            raise CommandError("--shards must be at least 1")
+        if shard_ids is not None:
+            if shard_count is None:
+                raise CommandError("--shard-ids requires --shards")
+            if not shard_ids or not all(0 <= i < shard_count for i in shard_ids):
+                raise CommandError(f"shard ids must be between 0 and {shard_count - 1}")
+        if processes > 1:
+            if shard_count is None or shard_ids is not None:
+                raise CommandError("--processes requires --shards and no --shard-ids")
+            if processes > shard_count:
+                raise CommandError("--processes must not exceed --shards")
+            return self.launch(shard_count, processes, options["intents"])
+
+        client = create_client(
+            shard_count=shard_count,
+            shard_ids=shard_ids,
+            intents_profile=options["intents"],
+        )
         client.run(settings.DISCORD_BOT_TOKEN)
+
+    def launch(self, shard_count: int, processes: int, intents: Optional[str]):
+        """シャードのグループごとにBotのプロセスを起動し、終わるまで見守る
+
+        どれか1つのプロセスが終了したら、残りも止めて終了する
+        （再起動はsystemdなどのプロセス管理に任せる）。
+        """
+        manage_py = str(settings.BASE_DIR / "manage.py")
+        children: list[subprocess.Popen] = []
+        try:
+            for group in split_shards(shard_count, processes):
+                if children:
+                    time.sleep(IDENTIFY_INTERVAL)
+                ids = ",".join(map(str, group))
+                self.stdout.write(f"Starting shards {ids} of {shard_count}")
+                command = [
+                    sys.executable,
+                    manage_py,
+                    "runbot",
+                    f"--shards={shard_count}",
+                    f"--shard-ids={ids}",
+                ]
+                if intents:
+                    command.append(f"--intents={intents}")
+                children.append(subprocess.Popen(command))
+            while all(child.poll() is None for child in children):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # SIGINTで止めると、各プロセスは貯まった結果を送ってから終了する
+            for child in children:
+                if child.poll() is None:
+                    child.send_signal(signal.SIGINT)
+            for child in children:
+                child.wait()
@@ -0,0 +1,353 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+# Prometheusのテキスト形式（exposition format 0.0.4）
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# レスポンス時間・DB時間のバケット（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 1リクエストあたりのクエリ数のバケット
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# ラベルの種類が際限なく増えないよう、これ以外のメソッドは "other" にまとめる
+KNOWN_METHODS = frozenset(
+    {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "TRACE"}
+)
+# URLにマッチしなかったリクエスト（404など）のrouteラベル
+UNMATCHED_ROUTE = "unmatched"
+
+
+class MetricsRegistry:
+    """カウンターとヒストグラムを保持し、Prometheusのテキスト形式で出力する
+
+    値はスレッドごとの辞書（シャード）に書き込む。シャードに書き込むのは
+    そのスレッドだけなので、記録するときにロックは取らない。ロックを取るのは
+    スレッドが最初に記録するとき（シャードの登録）と、出力するときに
+    シャードの一覧をコピーするときだけ。出力時に全シャードを合計する。
+    """
+
+    def __init__(self):
+        # 名前 -> メトリクス（登録順に出力する）
+        self._metrics: dict[str, "Metric"] = {}
+        self._shards: list[dict] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> "Counter":
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> "Gauge":
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS
+    ) -> "Histogram":
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def shard(self) -> dict:
+        """このスレッドのシャード（(名前, ラベル値) -> 値）"""
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append(values)
+            return values
+
+    def collect(self) -> dict:
+        """全シャードを合計した (名前, ラベル値) -> 値"""
+        with self._lock:
+            shards = list(self._shards)
+        totals = {}
+        for shard in shards:
+            # dict.copyはGILを持ったまま行われるので、書き込み中でも壊れない
+            for key, value in shard.copy().items():
+                total = totals.get(key)
+                if isinstance(value, list):
+                    if total is None:
+                        totals[key] = list(value)
+                    else:
+                        for i, v in enumerate(value):
+                            total[i] += v
+                else:
+                    totals[key] = value if total is None else total + value
+        for metric in self._metrics.values():
+            for labels, value in metric.function_values().items():
+                key = (metric.name, labels)
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self) -> str:
+        totals = self.collect()
+        by_name: dict[str, list] = {}
+        for (name, labels), value in totals.items():
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(by_name.get(name, ())):
+                lines.extend(metric.samples(labels, value))
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        """全ての値を0に戻す（テスト用）"""
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, registry: MetricsRegistry, name, documentation, labelnames):
+        self._registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, labels: tuple, extra: str = "") -> str:
+        pairs = [
+            f'{name}="{_escape_label(str(value))}"'
+            for name, value in zip(self.labelnames, labels)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def function_values(self) -> dict:
+        """出力するときに関数から読む値（ラベル値 -> 値）"""
+        return {}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, registry, name, documentation, labelnames):
+        super().__init__(registry, name, documentation, labelnames)
+        self._functions: dict[tuple, Callable[[], float]] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        shard = self._registry.shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def set_function(self, function: Callable[[], float], *labels) -> None:
+        """出力するたびにfunction()を呼び、その値をlabelsの値として出す
+
+        他のオブジェクトが自分で数えている統計を、記録し直さずに出力するのに使う。
+        """
+        self._functions[labels] = function
+
+    def function_values(self) -> dict:
+        return {labels: function() for labels, function in self._functions.items()}
+
+    def samples(self, labels: tuple, value) -> list[str]:
+        return [f"{self.name}{self._labels(labels)} {_format_value(value)}"]
+
+
+class Gauge(Counter):
+    """増えも減りもする値（現在の状態など）"""
+
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames, buckets):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels) -> None:
+        shard = self._registry.shard()
+        key = (self.name, labels)
+        values = shard.get(key)
+        if values is None:
+            # バケットごとの数（最後は+Inf）と合計
+            values = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def samples(self, labels: tuple, value: list) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), value):
+            cumulative += count
+            le = f'le="{_format_bound(bound)}"'
+            lines.append(f"{self.name}_bucket{self._labels(labels, le)} {cumulative}")
+        lines.append(
+            f"{self.name}_sum{self._labels(labels)} {_format_value(value[-1])}"
+        )
+        lines.append(f"{self.name}_count{self._labels(labels)} {cumulative}")
+        return lines
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(text: str) -> str:
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def _format_value(value) -> str:
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "discordapp_http_requests_total",
+    "Total HTTP requests by route, method and status code.",
+    ("route", "method", "status"),
+)
+http_exceptions = registry.counter(
+    "discordapp_http_exceptions_total",
+    "Unhandled exceptions raised by views.",
+    ("route", "method", "exception"),
+)
+http_duration = registry.histogram(
+    "discordapp_http_request_duration_seconds",
+    "Time spent handling a request, including middleware.",
+    ("route", "method"),
+)
+db_queries = registry.histogram(
+    "discordapp_http_request_db_queries",
+    "Number of database queries executed per request.",
+    ("route", "method"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+db_duration = registry.histogram(
+    "discordapp_http_request_db_duration_seconds",
+    "Time spent in database queries per request.",
+    ("route", "method"),
+)
+
+
+class RequestStats:
+    """1リクエストの間に実行したクエリの数と時間"""
+
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# 処理中のリクエストの集計先（sync_to_asyncで実行したクエリにも引き継がれる）
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar(
+    "discordapp_metrics_request", default=None
+)
+
+
+def record_query(execute, sql, params, many, context):
+    """connection.execute_wrappersに入れて、リクエスト中のクエリを数える"""
+    stats = _current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def install_query_recorder(connection) -> None:
+    """DB接続にrecord_queryを入れる（接続し直しても重複しない）"""
+    if record_query not in connection.execute_wrappers:
+        # connection.execute_wrapper()は最後の要素をpopするので先頭に入れる
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def _labels(request) -> tuple[str, str]:
+    match = request.resolver_match
+    route = (match.route if match is not None else "") or UNMATCHED_ROUTE
+    method = request.method if request.method in KNOWN_METHODS else "other"
+    return route, method
+
+
+def record_request(request, response, seconds: float, stats: RequestStats) -> None:
+    route, method = _labels(request)
+    http_requests.inc(route, method, str(response.status_code))
+    http_duration.observe(seconds, route, method)
+    db_queries.observe(stats.queries, route, method)
+    db_duration.observe(stats.db_seconds, route, method)
+
+
+class MetricsMiddleware:
+    """リクエストごとのレスポンス時間、クエリの数と時間、エラーを記録する
+
+    MIDDLEWAREの先頭に置き、他のミドルウェアの時間も含めて測る。
+    同期・非同期どちらのビューでも、リクエストを同期に変換せずに動く。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        record_request(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        record_request(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def process_exception(self, request, exception):
+        # レスポンス（500）への変換はDjangoに任せ、例外の種類だけ数える
+        route, method = _labels(request)
+        http_exceptions.inc(route, method, type(exception).__name__)
+        return None
+
+
+class MetricsView(APIView):
+    """Prometheusがスクレイプするメトリクス
+
+    ルートごとの件数やエラー率が見えるので、他のAPIと同じくトークンで認証する。
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
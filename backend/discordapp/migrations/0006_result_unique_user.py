@@ -0,0 +1,62 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:25
+
+from django.db import migrations, models
+from django.db.models import Count
+
+RESULT_MODELS = {
+    "quizresult": ["correct_count", "failed_count"],
+    "oversleptresult": ["overslept_count"],
+    "predictionresult": ["correct_count", "failed_count"],
+    "bluffnumberresult": ["play_count", "win_count"],
+    "flashresult": ["play_count", "correct_count"],
+}
+
+
+def merge_duplicate_results(apps, schema_editor):
+    """ユーザーごとに重複した結果行を1行に集約する"""
+    for model_name, counter_fields in RESULT_MODELS.items():
+        model = apps.get_model("discordapp", model_name)
+        duplicated_users = (
+            model.objects.values("user")
+            .annotate(rows=Count("id"))
+            .filter(rows__gt=1)
+            .values_list("user", flat=True)
+        )
+        for user_id in duplicated_users:
+            keep, *others = model.objects.filter(user_id=user_id)
+            for other in others:
+                for name in counter_fields:
+                    setattr(keep, name, getattr(keep, name) + getattr(other, name))
+                other.delete()
+            keep.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discordapp', '0005_flashresult'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_results, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bluffnumberresult',
+            constraint=models.UniqueConstraint(fields=('user',), name='unique_bluffnumberresult_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='flashresult',
+            constraint=models.UniqueConstraint(fields=('user',), name='unique_flashresult_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='oversleptresult',
+            constraint=models.UniqueConstraint(fields=('user',), name='unique_oversleptresult_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='predictionresult',
+            constraint=models.UniqueConstraint(fields=('user',), name='unique_predictionresult_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='quizresult',
+            constraint=models.UniqueConstraint(fields=('user',), name='unique_quizresult_user'),
+        ),
+    ]
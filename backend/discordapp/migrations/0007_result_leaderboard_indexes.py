@@ -0,0 +1,49 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discordapp', '0006_result_unique_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bluffnumberresult',
+            index=models.Index(fields=['-play_count', 'id'], name='bluff_play_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bluffnumberresult',
+            index=models.Index(fields=['-win_count', 'id'], name='bluff_win_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flashresult',
+            index=models.Index(fields=['-play_count', 'id'], name='flash_play_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flashresult',
+            index=models.Index(fields=['-correct_count', 'id'], name='flash_correct_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='oversleptresult',
+            index=models.Index(fields=['-overslept_count', 'id'], name='overslept_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='predictionresult',
+            index=models.Index(fields=['-correct_count', 'id'], name='prediction_correct_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='predictionresult',
+            index=models.Index(fields=['-failed_count', 'id'], name='prediction_failed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizresult',
+            index=models.Index(fields=['-correct_count', 'id'], name='quiz_correct_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizresult',
+            index=models.Index(fields=['-failed_count', 'id'], name='quiz_failed_idx'),
+        ),
+    ]
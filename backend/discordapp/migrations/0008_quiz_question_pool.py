@@ -0,0 +1,85 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:39
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("discordapp", "0007_result_leaderboard_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QuizQuestion",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("question", models.TextField()),
+                ("choices", models.JSONField()),
+                ("answer", models.IntegerField()),
+                ("question_hash", models.CharField(max_length=64, unique=True)),
+                ("ask_count", models.IntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "クイズ問題",
+                "verbose_name_plural": "クイズ問題一覧",
+                "indexes": [
+                    models.Index(
+                        fields=["ask_count", "created_at"],
+                        name="quiz_question_pool_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="QuizAsk",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("asked_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "guild",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="quiz_asks",
+                        to="discordapp.discordguild",
+                    ),
+                ),
+                (
+                    "question",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="asks",
+                        to="discordapp.quizquestion",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "クイズ出題履歴",
+                "verbose_name_plural": "クイズ出題履歴一覧",
+                "indexes": [
+                    models.Index(
+                        fields=["guild", "-asked_at"], name="quiz_ask_recent_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:48
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("discordapp", "0008_quiz_question_pool"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BluffNumberGameState",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("channel_id", models.CharField(max_length=255, unique=True)),
+                ("snapshot", models.JSONField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "ブラフナンバー進行状態",
+                "verbose_name_plural": "ブラフナンバー進行状態一覧",
+            },
+        ),
+    ]
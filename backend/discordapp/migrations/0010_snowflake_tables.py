@@ -0,0 +1,333 @@
+# Generated by Django 6.0.2 on 2026-10-18 21:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# スノーフレークを主キーにした新しいテーブルを作る（0011でデータを移し、
+# 0012で古いテーブルを消して名前を付け替える）。名前付きのインデックスと
+# 制約は新しいテーブルで同じ名前を使うため、先に古いテーブルから外す。
+# 作成日時などは移行元の値をそのまま入れられるよう、0012まではauto_now系にしない。
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("discordapp", "0009_bluff_number_game_state"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="quizresult",
+            name="quiz_correct_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="quizresult",
+            name="quiz_failed_idx",
+        ),
+        migrations.RemoveConstraint(
+            model_name="quizresult",
+            name="unique_quizresult_user",
+        ),
+        migrations.RemoveIndex(
+            model_name="oversleptresult",
+            name="overslept_count_idx",
+        ),
+        migrations.RemoveConstraint(
+            model_name="oversleptresult",
+            name="unique_oversleptresult_user",
+        ),
+        migrations.RemoveIndex(
+            model_name="predictionresult",
+            name="prediction_correct_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="predictionresult",
+            name="prediction_failed_idx",
+        ),
+        migrations.RemoveConstraint(
+            model_name="predictionresult",
+            name="unique_predictionresult_user",
+        ),
+        migrations.RemoveIndex(
+            model_name="bluffnumberresult",
+            name="bluff_play_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="bluffnumberresult",
+            name="bluff_win_idx",
+        ),
+        migrations.RemoveConstraint(
+            model_name="bluffnumberresult",
+            name="unique_bluffnumberresult_user",
+        ),
+        migrations.RemoveIndex(
+            model_name="flashresult",
+            name="flash_play_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="flashresult",
+            name="flash_correct_idx",
+        ),
+        migrations.RemoveConstraint(
+            model_name="flashresult",
+            name="unique_flashresult_user",
+        ),
+        migrations.RemoveIndex(
+            model_name="quizquestion",
+            name="quiz_question_pool_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="quizask",
+            name="quiz_ask_recent_idx",
+        ),
+        migrations.CreateModel(
+            name="NewDiscordUser",
+            fields=[
+                (
+                    "discord_id",
+                    models.BigIntegerField(primary_key=True, serialize=False),
+                ),
+                ("username", models.CharField(max_length=255)),
+            ],
+            options={
+                "verbose_name": "Discordユーザー",
+                "verbose_name_plural": "Discordユーザー一覧",
+            },
+        ),
+        migrations.CreateModel(
+            name="NewDiscordGuild",
+            fields=[
+                ("guild_id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("name", models.CharField(max_length=255)),
+                (
+                    "members",
+                    models.ManyToManyField(
+                        related_name="guilds", to="discordapp.newdiscorduser"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Discordギルド",
+                "verbose_name_plural": "Discordギルド一覧",
+            },
+        ),
+        migrations.CreateModel(
+            name="NewQuizResult",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("correct_count", models.IntegerField(default=0)),
+                ("failed_count", models.IntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="discordapp.newdiscorduser",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "クイズ結果",
+                "verbose_name_plural": "クイズ結果一覧",
+                "indexes": [
+                    models.Index(
+                        fields=["-correct_count", "id"], name="quiz_correct_idx"
+                    ),
+                    models.Index(
+                        fields=["-failed_count", "id"], name="quiz_failed_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user",), name="unique_quizresult_user"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="NewOverSleptResult",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("overslept_count", models.IntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="discordapp.newdiscorduser",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "寝坊結果",
+                "verbose_name_plural": "寝坊結果一覧",
+                "indexes": [
+                    models.Index(
+                        fields=["-overslept_count", "id"], name="overslept_count_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user",), name="unique_oversleptresult_user"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="NewPredictionResult",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("correct_count", models.IntegerField(default=0)),
+                ("failed_count", models.IntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="discordapp.newdiscorduser",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "予測結果",
+                "verbose_name_plural": "予測結果一覧",
+                "indexes": [
+                    models.Index(
+                        fields=["-correct_count", "id"], name="prediction_correct_idx"
+                    ),
+                    models.Index(
+                        fields=["-failed_count", "id"], name="prediction_failed_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user",), name="unique_predictionresult_user"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="NewBluffNumberResult",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("play_count", models.IntegerField(default=0)),
+                ("win_count", models.IntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="discordapp.newdiscorduser",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "ブラフナンバー結果",
+                "verbose_name_plural": "ブラフナンバー結果一覧",
+                "indexes": [
+                    models.Index(fields=["-play_count", "id"], name="bluff_play_idx"),
+                    models.Index(fields=["-win_count", "id"], name="bluff_win_idx"),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user",), name="unique_bluffnumberresult_user"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="NewFlashResult",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("play_count", models.IntegerField(default=0)),
+                ("correct_count", models.IntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="discordapp.newdiscorduser",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "フラッシュ結果",
+                "verbose_name_plural": "フラッシュ結果一覧",
+                "indexes": [
+                    models.Index(fields=["-play_count", "id"], name="flash_play_idx"),
+                    models.Index(
+                        fields=["-correct_count", "id"], name="flash_correct_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user",), name="unique_flashresult_user"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="NewQuizQuestion",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("question", models.TextField()),
+                ("choices", models.JSONField()),
+                ("answer", models.IntegerField()),
+                ("question_hash", models.CharField(max_length=64, unique=True)),
+                ("ask_count", models.IntegerField(default=0)),
+                ("created_at", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name": "クイズ問題",
+                "verbose_name_plural": "クイズ問題一覧",
+                "indexes": [
+                    models.Index(
+                        fields=["ask_count", "created_at"],
+                        name="quiz_question_pool_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="NewQuizAsk",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("asked_at", models.DateTimeField()),
+                (
+                    "guild",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="quiz_asks",
+                        to="discordapp.newdiscordguild",
+                    ),
+                ),
+                (
+                    "question",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="asks",
+                        to="discordapp.newquizquestion",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "クイズ出題履歴",
+                "verbose_name_plural": "クイズ出題履歴一覧",
+                "indexes": [
+                    models.Index(
+                        fields=["guild", "-asked_at"], name="quiz_ask_recent_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="NewBluffNumberGameState",
+            fields=[
+                (
+                    "channel_id",
+                    models.BigIntegerField(primary_key=True, serialize=False),
+                ),
+                ("snapshot", models.JSONField()),
+                ("updated_at", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name": "ブラフナンバー進行状態",
+                "verbose_name_plural": "ブラフナンバー進行状態一覧",
+            },
+        ),
+    ]
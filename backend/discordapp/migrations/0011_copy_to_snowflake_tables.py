@@ -0,0 +1,302 @@
+# Generated by Django 6.0.2 on 2026-10-18 21:10
+
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+# 1回のINSERTにまとめる行数
+BATCH_SIZE = 2000
+
+RESULT_MODELS = {
+    "quizresult": ["correct_count", "failed_count"],
+    "oversleptresult": ["overslept_count"],
+    "predictionresult": ["correct_count", "failed_count"],
+    "bluffnumberresult": ["play_count", "win_count"],
+    "flashresult": ["play_count", "correct_count"],
+}
+
+# スノーフレークに直せなければならない (モデル, 項目)
+SNOWFLAKE_COLUMNS = [
+    ("DiscordUser", "discord_id"),
+    ("DiscordGuild", "guild_id"),
+    ("BluffNumberGameState", "channel_id"),
+]
+
+# エラーに載せる不正なIDの数
+MAX_REPORTED = 20
+
+
+def parse_snowflake(value):
+    """文字列で保存していたIDを整数に直す。スノーフレークでなければNone"""
+    value = str(value).strip()
+    if not (value.isascii() and value.isdigit()):
+        return None
+    snowflake = int(value)
+    return snowflake if 0 < snowflake < 2**63 else None
+
+
+def find_invalid_ids(model, field) -> list[str]:
+    """スノーフレークとして読めないIDと、他の行と同じ数になるIDを返す"""
+    seen = set()
+    invalid = []
+    for value in model.objects.values_list(field, flat=True).iterator(BATCH_SIZE):
+        snowflake = parse_snowflake(value)
+        if snowflake is None or snowflake in seen:
+            invalid.append(value)
+        seen.add(snowflake)
+    return invalid
+
+
+def check_snowflakes(apps) -> None:
+    """移せない行があれば、何も書き換える前に止める
+
+    行を黙って捨てると、そのユーザーの成績も一緒に失われる。
+    不正なIDの行は、直すか消すかしてからもう一度migrateする。
+    """
+    problems = []
+    for model_name, field in SNOWFLAKE_COLUMNS:
+        invalid = find_invalid_ids(apps.get_model("discordapp", model_name), field)
+        if invalid:
+            shown = ", ".join(repr(value) for value in invalid[:MAX_REPORTED])
+            problems.append(f"{model_name}.{field}: {len(invalid)} rows ({shown})")
+    if problems:
+        raise ValueError(
+            "Cannot convert these IDs to Discord snowflakes (not a positive 64-bit "
+            "integer, or the same number as another row). Fix or delete these "
+            "rows and run migrate again:\n  " + "\n  ".join(problems)
+        )
+
+
+def copy_rows(rows, build, model) -> int:
+    """rowsをbuildで新しいモデルに変換して挿入し、挿入した行数を返す"""
+    copied = 0
+    batch = []
+    for row in rows:
+        batch.append(build(*row))
+        if len(batch) >= BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            copied += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+        copied += len(batch)
+    return copied
+
+
+def keep_timestamps(model) -> None:
+    """auto_now/auto_now_addで元の日時が上書きされないようにする
+
+    この移行の中だけで使う過去のモデルなので、書き換えても他に影響しない。
+    """
+    for field in model._meta.fields:
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+            field.auto_now = field.auto_now_add = False
+
+
+def copy_to_snowflake_tables(apps, schema_editor):
+    """文字列のIDとUUIDの主キーの行を、スノーフレークを主キーにした表へ移す"""
+    check_snowflakes(apps)
+    old_user = apps.get_model("discordapp", "DiscordUser")
+    new_user = apps.get_model("discordapp", "NewDiscordUser")
+    old_guild = apps.get_model("discordapp", "DiscordGuild")
+    new_guild = apps.get_model("discordapp", "NewDiscordGuild")
+    copied = {}
+
+    copied["users"] = copy_rows(
+        old_user.objects.values_list("discord_id", "username").iterator(BATCH_SIZE),
+        lambda discord_id, username: new_user(
+            discord_id=parse_snowflake(discord_id), username=username
+        ),
+        new_user,
+    )
+    copied["guilds"] = copy_rows(
+        old_guild.objects.values_list("guild_id", "name").iterator(BATCH_SIZE),
+        lambda guild_id, name: new_guild(guild_id=parse_snowflake(guild_id), name=name),
+        new_guild,
+    )
+    new_membership = new_guild.members.through
+    copied["guild members"] = copy_rows(
+        old_guild.members.through.objects.values_list(
+            "discordguild__guild_id", "discorduser__discord_id"
+        ).iterator(BATCH_SIZE),
+        lambda guild_id, discord_id: new_membership(
+            newdiscordguild_id=parse_snowflake(guild_id),
+            newdiscorduser_id=parse_snowflake(discord_id),
+        ),
+        new_membership,
+    )
+
+    for model_name, counter_fields in RESULT_MODELS.items():
+        old_model = apps.get_model("discordapp", model_name)
+        new_model = apps.get_model("discordapp", f"new{model_name}")
+        copied[model_name] = copy_rows(
+            old_model.objects.order_by("user__discord_id")
+            .values_list("user__discord_id", *counter_fields)
+            .iterator(BATCH_SIZE),
+            lambda discord_id, *counts, new_model=new_model, fields=counter_fields: (
+                new_model(
+                    user_id=parse_snowflake(discord_id), **dict(zip(fields, counts))
+                )
+            ),
+            new_model,
+        )
+
+    # 問題は新しいPKが必要なので、ハッシュを手がかりに出題履歴を付け替える
+    old_question = apps.get_model("discordapp", "QuizQuestion")
+    new_question = apps.get_model("discordapp", "NewQuizQuestion")
+    copied["quiz questions"] = copy_question_rows(old_question, new_question)
+    new_question_ids = dict(new_question.objects.values_list("question_hash", "id"))
+
+    old_ask = apps.get_model("discordapp", "QuizAsk")
+    new_ask = apps.get_model("discordapp", "NewQuizAsk")
+    copied["quiz asks"] = copy_rows(
+        old_ask.objects.order_by("asked_at")
+        .values_list("guild__guild_id", "question__question_hash", "asked_at")
+        .iterator(BATCH_SIZE),
+        lambda guild_id, question_hash, asked_at: new_ask(
+            guild_id=parse_snowflake(guild_id),
+            question_id=new_question_ids[question_hash],
+            asked_at=asked_at,
+        ),
+        new_ask,
+    )
+
+    old_state = apps.get_model("discordapp", "BluffNumberGameState")
+    new_state = apps.get_model("discordapp", "NewBluffNumberGameState")
+    copied["bluff number games"] = copy_rows(
+        old_state.objects.values_list("channel_id", "snapshot", "updated_at").iterator(
+            BATCH_SIZE
+        ),
+        lambda channel_id, snapshot, updated_at: new_state(
+            channel_id=parse_snowflake(channel_id),
+            snapshot=snapshot,
+            updated_at=updated_at,
+        ),
+        new_state,
+    )
+    log_copied(copied)
+
+
+def copy_question_rows(from_model, to_model) -> int:
+    return copy_rows(
+        from_model.objects.order_by("created_at")
+        .values_list(
+            "question", "choices", "answer", "question_hash", "ask_count", "created_at"
+        )
+        .iterator(BATCH_SIZE),
+        lambda question, choices, answer, question_hash, ask_count, created_at: (
+            to_model(
+                question=question,
+                choices=choices,
+                answer=answer,
+                question_hash=question_hash,
+                ask_count=ask_count,
+                created_at=created_at,
+            )
+        ),
+        to_model,
+    )
+
+
+def copy_from_snowflake_tables(apps, schema_editor):
+    """スノーフレークの表の行を、文字列のIDとUUIDの主キーの表へ戻す"""
+    old_user = apps.get_model("discordapp", "DiscordUser")
+    new_user = apps.get_model("discordapp", "NewDiscordUser")
+    old_guild = apps.get_model("discordapp", "DiscordGuild")
+    new_guild = apps.get_model("discordapp", "NewDiscordGuild")
+    copied = {}
+
+    copied["users"] = copy_rows(
+        new_user.objects.values_list("discord_id", "username").iterator(BATCH_SIZE),
+        lambda discord_id, username: old_user(
+            discord_id=str(discord_id), username=username
+        ),
+        old_user,
+    )
+    user_ids = dict(old_user.objects.values_list("discord_id", "id"))
+    copied["guilds"] = copy_rows(
+        new_guild.objects.values_list("guild_id", "name").iterator(BATCH_SIZE),
+        lambda guild_id, name: old_guild(guild_id=str(guild_id), name=name),
+        old_guild,
+    )
+    guild_ids = dict(old_guild.objects.values_list("guild_id", "id"))
+    old_membership = old_guild.members.through
+    copied["guild members"] = copy_rows(
+        new_guild.members.through.objects.values_list(
+            "newdiscordguild_id", "newdiscorduser_id"
+        ).iterator(BATCH_SIZE),
+        lambda guild_id, discord_id: old_membership(
+            discordguild_id=guild_ids[str(guild_id)],
+            discorduser_id=user_ids[str(discord_id)],
+        ),
+        old_membership,
+    )
+
+    for model_name, counter_fields in RESULT_MODELS.items():
+        old_model = apps.get_model("discordapp", model_name)
+        new_model = apps.get_model("discordapp", f"new{model_name}")
+        copied[model_name] = copy_rows(
+            new_model.objects.values_list("user_id", *counter_fields).iterator(
+                BATCH_SIZE
+            ),
+            lambda discord_id, *counts, old_model=old_model, fields=counter_fields: (
+                old_model(
+                    user_id=user_ids[str(discord_id)], **dict(zip(fields, counts))
+                )
+            ),
+            old_model,
+        )
+
+    old_question = apps.get_model("discordapp", "QuizQuestion")
+    new_question = apps.get_model("discordapp", "NewQuizQuestion")
+    keep_timestamps(old_question)
+    copied["quiz questions"] = copy_question_rows(new_question, old_question)
+    question_ids = dict(old_question.objects.values_list("question_hash", "id"))
+
+    old_ask = apps.get_model("discordapp", "QuizAsk")
+    new_ask = apps.get_model("discordapp", "NewQuizAsk")
+    keep_timestamps(old_ask)
+    copied["quiz asks"] = copy_rows(
+        new_ask.objects.order_by("asked_at")
+        .values_list("guild_id", "question__question_hash", "asked_at")
+        .iterator(BATCH_SIZE),
+        lambda guild_id, question_hash, asked_at: old_ask(
+            guild_id=guild_ids[str(guild_id)],
+            question_id=question_ids[question_hash],
+            asked_at=asked_at,
+        ),
+        old_ask,
+    )
+
+    old_state = apps.get_model("discordapp", "BluffNumberGameState")
+    new_state = apps.get_model("discordapp", "NewBluffNumberGameState")
+    keep_timestamps(old_state)
+    copied["bluff number games"] = copy_rows(
+        new_state.objects.values_list("channel_id", "snapshot", "updated_at").iterator(
+            BATCH_SIZE
+        ),
+        lambda channel_id, snapshot, updated_at: old_state(
+            channel_id=str(channel_id), snapshot=snapshot, updated_at=updated_at
+        ),
+        old_state,
+    )
+    log_copied(copied)
+
+
+def log_copied(copied: dict) -> None:
+    counts = ", ".join(f"{count} {name}" for name, count in copied.items() if count)
+    if counts:
+        logger.info("Copied rows: %s", counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("discordapp", "0010_snowflake_tables"),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_to_snowflake_tables, copy_from_snowflake_tables),
+    ]
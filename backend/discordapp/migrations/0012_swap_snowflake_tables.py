@@ -0,0 +1,50 @@
+# Generated by Django 6.0.2 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+# 古い表を消し、0010で作った表を元のモデル名に付け替える
+MODELS = [
+    "QuizAsk",
+    "QuizResult",
+    "OverSleptResult",
+    "PredictionResult",
+    "BluffNumberResult",
+    "FlashResult",
+    "BluffNumberGameState",
+    "QuizQuestion",
+    "DiscordGuild",
+    "DiscordUser",
+]
+# 戻すときはこの逆順になる。DiscordUserを先に戻すと、まだ付け替えていない
+# DiscordGuildの多対多を辿れずに失敗するので、DiscordGuildを先に付け替える
+RENAME_ORDER = ["DiscordGuild", "DiscordUser", *MODELS[-3::-1]]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("discordapp", "0011_copy_to_snowflake_tables"),
+    ]
+
+    operations = [
+        *(migrations.DeleteModel(name=name) for name in MODELS),
+        *(
+            migrations.RenameModel(old_name=f"New{name}", new_name=name)
+            for name in RENAME_ORDER
+        ),
+        migrations.AlterField(
+            model_name="quizquestion",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name="quizask",
+            name="asked_at",
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name="bluffnumbergamestate",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
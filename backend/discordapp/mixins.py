@@ -1,3 +1,20 @@
+import base64
+import hashlib
+import json
+import unicodedata
+
+from asgiref.sync import sync_to_async
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    IntegrityError,
+    connection,
+    models,
+    transaction,
+)
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+
+from .cache import guild_cache, user_cache
 from .models import (
     BluffNumberResult,
     DiscordGuild,
@@ -5,12 +22,51 @@ from .models import (
     FlashResult,
     OverSleptResult,
     PredictionResult,
+    QuizAsk,
+    QuizQuestion,
     QuizResult,
 )
 
+# ゲーム名 -> 結果モデル
+RESULT_MODELS = {
+    "quiz": QuizResult,
+    "overslept": OverSleptResult,
+    "prediction": PredictionResult,
+    "bluff_number": BluffNumberResult,
+    "flash": FlashResult,
+}
+
+# ギルドで直近に出題した問題を、この件数までは繰り返さない
+QUIZ_RECENT_WINDOW = 50
+
+# 他のリクエストと同じ問題を選んでしまったときに、選び直す回数
+QUIZ_POP_ATTEMPTS = 5
+
+# 1文のアップサートにまとめる最大行数（SQLiteのプレースホルダ上限対策）
+UPSERT_BATCH_SIZE = 200
 
-def create_or_update_discord_user(discord_id: str, username: str) -> DiscordUser:
-    """DiscordUserを作成または更新する"""
+
+def _cache_on_commit(cache, key: int, pk, name: str) -> None:
+    """トランザクションが確定してからキャッシュに載せる（ロールバック対策）"""
+    transaction.on_commit(lambda: cache.set(key, pk, name))
+
+
+def create_or_update_discord_user(discord_id: int | str, username: str) -> DiscordUser:
+    """DiscordUserを作成または更新する
+
+    名前が変わっていなければキャッシュからDiscordUserを組み立て、クエリを発行しない。
+    """
+    discord_id = int(discord_id)
+    cached = user_cache.get(discord_id)
+    if cached is not None:
+        if cached[1] == username:
+            return DiscordUser.from_db(
+                DEFAULT_DB_ALIAS,
+                ["discord_id", "username"],
+                [discord_id, username],
+            )
+        # 名前の変更を検知したらキャッシュを捨ててDBを更新する
+        user_cache.invalidate(discord_id)
     try:
         user = DiscordUser.objects.get(discord_id=discord_id)
         if user.username != username:
@@ -18,11 +74,23 @@ def create_or_update_discord_user(discord_id: str, username: str) -> DiscordUser
             user.save()
     except DiscordUser.DoesNotExist:
         user = DiscordUser.objects.create(discord_id=discord_id, username=username)
+    _cache_on_commit(user_cache, discord_id, user.pk, user.username)
     return user
 
 
-def create_or_update_discord_guild(guild_id: str, name: str) -> DiscordGuild:
-    """DiscordGuildを作成または更新する"""
+def create_or_update_discord_guild(guild_id: int | str, name: str) -> DiscordGuild:
+    """DiscordGuildを作成または更新する
+
+    名前が変わっていなければキャッシュからDiscordGuildを組み立て、クエリを発行しない。
+    """
+    guild_id = int(guild_id)
+    cached = guild_cache.get(guild_id)
+    if cached is not None:
+        if cached[1] == name:
+            return DiscordGuild.from_db(
+                DEFAULT_DB_ALIAS, ["guild_id", "name"], [guild_id, name]
+            )
+        guild_cache.invalidate(guild_id)
     try:
         guild = DiscordGuild.objects.get(guild_id=guild_id)
         if guild.name != name:
@@ -30,6 +98,60 @@ def create_or_update_discord_guild(guild_id: str, name: str) -> DiscordGuild:
             guild.save()
     except DiscordGuild.DoesNotExist:
         guild = DiscordGuild.objects.create(guild_id=guild_id, name=name)
+    _cache_on_commit(guild_cache, guild_id, guild.pk, guild.name)
+    return guild
+
+
+async def acreate_or_update_discord_user(
+    discord_id: int | str, username: str
+) -> DiscordUser:
+    """create_or_update_discord_userの非同期版"""
+    discord_id = int(discord_id)
+    cached = user_cache.get(discord_id)
+    if cached is not None:
+        if cached[1] == username:
+            return DiscordUser.from_db(
+                DEFAULT_DB_ALIAS,
+                ["discord_id", "username"],
+                [discord_id, username],
+            )
+        user_cache.invalidate(discord_id)
+    try:
+        user = await DiscordUser.objects.aget(discord_id=discord_id)
+        if user.username != username:
+            user.username = username
+            await user.asave(update_fields=["username"])
+    except DiscordUser.DoesNotExist:
+        user = await DiscordUser.objects.acreate(
+            discord_id=discord_id, username=username
+        )
+    # ORMのクエリと同じスレッドの接続で、コミット後にキャッシュへ載せる
+    await sync_to_async(_cache_on_commit)(
+        user_cache, discord_id, user.pk, user.username
+    )
+    return user
+
+
+async def acreate_or_update_discord_guild(
+    guild_id: int | str, name: str
+) -> DiscordGuild:
+    """create_or_update_discord_guildの非同期版"""
+    guild_id = int(guild_id)
+    cached = guild_cache.get(guild_id)
+    if cached is not None:
+        if cached[1] == name:
+            return DiscordGuild.from_db(
+                DEFAULT_DB_ALIAS, ["guild_id", "name"], [guild_id, name]
+            )
+        guild_cache.invalidate(guild_id)
+    try:
+        guild = await DiscordGuild.objects.aget(guild_id=guild_id)
+        if guild.name != name:
+            guild.name = name
+            await guild.asave(update_fields=["name"])
+    except DiscordGuild.DoesNotExist:
+        guild = await DiscordGuild.objects.acreate(guild_id=guild_id, name=name)
+    await sync_to_async(_cache_on_commit)(guild_cache, guild_id, guild.pk, guild.name)
     return guild
 
 
@@ -84,3 +206,435 @@ def create_flash_result(user: DiscordUser) -> FlashResult:
             user=user, play_count=0, correct_count=0
         )
     return flash_result
+
+
+def get_counter_fields(model: type[models.Model]) -> list[str]:
+    """結果モデルのカウンタ列名の一覧を返す"""
+    return [
+        field.attname
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.IntegerField) and not field.primary_key
+    ]
+
+
+def get_guild_results(model: type[models.Model], guild: DiscordGuild) -> list:
+    """ギルドメンバー全員の結果を1クエリで取得する
+
+    メンバーと結果をLEFT JOINし、結果行が無いメンバーは0件の結果として補う。
+    補った結果は保存しない。
+    """
+    counter_fields = get_counter_fields(model)
+    related_name = model._meta.get_field("user").related_query_name()
+    rows = guild.members.annotate(
+        **{
+            f"result_{name}": Coalesce(F(f"{related_name}__{name}"), 0)
+            for name in counter_fields
+        }
+    ).values("discord_id", "username", *(f"result_{n}" for n in counter_fields))
+    return [
+        model(
+            user=DiscordUser(discord_id=row["discord_id"], username=row["username"]),
+            **{name: row[f"result_{name}"] for name in counter_fields},
+        )
+        for row in rows
+    ]
+
+
+def encode_leaderboard_cursor(result: models.Model, order_by: str) -> str:
+    """リーダーボードの次ページ用カーソル（最後の行の値とPK）を作る"""
+    payload = {"value": getattr(result, order_by), "pk": result.pk}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_leaderboard_cursor(cursor: str) -> tuple[int, int]:
+    """カーソルを (値, PK) に戻す。不正な場合はValueErrorを送出する"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(payload["value"]), int(payload["pk"])
+    except (AttributeError, TypeError, KeyError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _leaderboard_queryset(model, guild, order_by: str, cursor: str):
+    queryset = (
+        model.objects.filter(user__guilds=guild)
+        .select_related("user")
+        .order_by(f"-{order_by}", "pk")
+    )
+    if cursor:
+        value, pk = decode_leaderboard_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f"{order_by}__lt": value}) | Q(**{order_by: value, "pk__gt": pk})
+        )
+    return queryset
+
+
+def _leaderboard_page(results: list, limit: int, order_by: str) -> tuple[list, str]:
+    # limit + 1 件取得しておき、あふれた分で次ページの有無を判定する
+    if len(results) > limit:
+        results = results[:limit]
+        return results, encode_leaderboard_cursor(results[-1], order_by)
+    return results, ""
+
+
+def get_leaderboard(
+    model: type[models.Model],
+    guild: DiscordGuild,
+    order_by: str,
+    limit: int,
+    cursor: str = "",
+) -> tuple[list, str]:
+    """ギルド内の結果を order_by の降順で limit 件取得する
+
+    (値の降順, PKの昇順) でキーセットページングし、
+    取得した行と次ページのカーソル（無ければ空文字）を返す。
+    """
+    queryset = _leaderboard_queryset(model, guild, order_by, cursor)
+    return _leaderboard_page(list(queryset[: limit + 1]), limit, order_by)
+
+
+async def aget_leaderboard(
+    model: type[models.Model],
+    guild: DiscordGuild,
+    order_by: str,
+    limit: int,
+    cursor: str = "",
+) -> tuple[list, str]:
+    """get_leaderboardの非同期版"""
+    queryset = _leaderboard_queryset(model, guild, order_by, cursor)
+    results = [result async for result in queryset[: limit + 1]]
+    return _leaderboard_page(results, limit, order_by)
+
+
+def get_leaderboard_rank(
+    model: type[models.Model], guild: DiscordGuild, discord_id: int, order_by: str
+):
+    """ギルド内での自分の結果と順位（同値は同順位）を返す。結果が無ければNone"""
+    result = (
+        model.objects.filter(user__guilds=guild, user__discord_id=discord_id)
+        .select_related("user")
+        .first()
+    )
+    if result is None:
+        return None
+    higher = model.objects.filter(
+        user__guilds=guild, **{f"{order_by}__gt": getattr(result, order_by)}
+    ).count()
+    return result, higher + 1
+
+
+async def aget_leaderboard_rank(
+    model: type[models.Model], guild: DiscordGuild, discord_id: int, order_by: str
+):
+    """get_leaderboard_rankの非同期版"""
+    result = await (
+        model.objects.filter(user__guilds=guild, user__discord_id=discord_id)
+        .select_related("user")
+        .afirst()
+    )
+    if result is None:
+        return None
+    higher = await model.objects.filter(
+        user__guilds=guild, **{f"{order_by}__gt": getattr(result, order_by)}
+    ).acount()
+    return result, higher + 1
+
+
+def increment_result(model: type[models.Model], user: DiscordUser, **deltas: int):
+    """結果のカウンタをアトミックに加算し、加算後のインスタンスを返す
+
+    行が存在しない場合は作成する。SQLite/PostgreSQLでは
+    INSERT ... ON CONFLICT DO UPDATE ... RETURNING の1文で完結させ、
+    （加算後の値もRETURNINGで受け取るため再SELECTしない）、
+    それ以外のDBではF式によるUPDATEにフォールバックする。
+    """
+    return increment_results(model, {user: deltas})[user.pk]
+
+
+async def aincrement_result(
+    model: type[models.Model], user: DiscordUser, **deltas: int
+):
+    """increment_resultの非同期版
+
+    アップサートは生SQLで、Djangoの非同期ORMに相当するAPIが無いため、
+    非同期ORMと同じくsync_to_asyncでスレッドに渡して実行する。
+    """
+    return await sync_to_async(increment_result)(model, user, **deltas)
+
+
+def increment_results(
+    model: type[models.Model], deltas_by_user: dict[DiscordUser, dict[str, int]]
+) -> dict:
+    """複数ユーザーの結果のカウンタをまとめて加算する
+
+    ユーザーのPKをキーに、加算後のインスタンスを返す。
+    """
+    counter_fields = get_counter_fields(model)
+    for deltas in deltas_by_user.values():
+        unknown = set(deltas) - set(counter_fields)
+        if unknown:
+            raise ValueError(f"Unknown counter fields: {sorted(unknown)}")
+    # 同時に走るバッチ同士がデッドロックしないよう、常にPK順で行をロックする
+    users = sorted(deltas_by_user, key=lambda user: user.pk)
+    results = {}
+    if connection.vendor in ("sqlite", "postgresql"):
+        for start in range(0, len(users), UPSERT_BATCH_SIZE):
+            chunk = users[start : start + UPSERT_BATCH_SIZE]
+            results.update(
+                _upsert_increments(model, chunk, counter_fields, deltas_by_user)
+            )
+    else:
+        for user in users:
+            results[user.pk] = _update_increment(
+                model, user, counter_fields, deltas_by_user[user]
+            )
+    return results
+
+
+def _upsert_increments(model, users, counter_fields, deltas_by_user):
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    pk_field = model._meta.pk
+    user_field = model._meta.get_field("user")
+    # PKは自動採番に任せる
+    insert_columns = [user_field.column, *counter_fields]
+    updated_fields = sorted({name for user in users for name in deltas_by_user[user]})
+    params = []
+    for user in users:
+        params += [
+            user_field.get_db_prep_value(user.pk, connection),
+            *(deltas_by_user[user].get(name, 0) for name in counter_fields),
+        ]
+    row_placeholder = f"({', '.join(['%s'] * len(insert_columns))})"
+    if updated_fields:
+        conflict_action = "DO UPDATE SET " + ", ".join(
+            f"{qn(name)} = {table}.{qn(name)} + EXCLUDED.{qn(name)}"
+            for name in updated_fields
+        )
+    else:
+        # 加算する列が無くても既存行を返せるよう、同じ値で更新する
+        conflict_action = (
+            f"DO UPDATE SET {qn(user_field.column)} = EXCLUDED.{qn(user_field.column)}"
+        )
+    returning = ", ".join(
+        qn(name) for name in [pk_field.column, user_field.column, *counter_fields]
+    )
+    sql = (
+        f"INSERT INTO {table} ({', '.join(qn(c) for c in insert_columns)}) "
+        f"VALUES {', '.join([row_placeholder] * len(users))} "
+        f"ON CONFLICT ({qn(user_field.column)}) {conflict_action} "
+        f"RETURNING {returning}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    users_by_pk = {user.pk: user for user in users}
+    results = {}
+    for pk, user_pk, *counts in rows:
+        user = users_by_pk[user_field.target_field.to_python(user_pk)]
+        results[user.pk] = model(
+            pk=pk_field.to_python(pk), user=user, **dict(zip(counter_fields, counts))
+        )
+    return results
+
+
+def _update_increment(model, user, counter_fields, deltas):
+    expressions = {name: F(name) + delta for name, delta in deltas.items()}
+    with transaction.atomic():
+        if not model.objects.filter(user=user).update(**expressions):
+            try:
+                with transaction.atomic():
+                    model.objects.create(user=user, **deltas)
+            except IntegrityError:
+                model.objects.filter(user=user).update(**expressions)
+        values = model.objects.filter(user=user).values("pk", *counter_fields).get()
+    return model(user=user, **values)
+
+
+def bulk_upsert_discord_users(
+    usernames: dict[int | str, str],
+) -> dict[int, DiscordUser]:
+    """discord_id -> username の対応からDiscordUserをまとめて作成・更新する
+
+    discord_idをキーに、保存済みのDiscordUserを返す。
+    キャッシュと名前が一致するユーザーはDBに問い合わせない。
+    """
+    users = {}
+    missing = {}
+    for discord_id, username in usernames.items():
+        discord_id = int(discord_id)
+        cached = user_cache.get(discord_id)
+        if cached is not None and cached[1] == username:
+            users[discord_id] = DiscordUser.from_db(
+                DEFAULT_DB_ALIAS,
+                ["discord_id", "username"],
+                [discord_id, username],
+            )
+        else:
+            missing[discord_id] = username
+    if missing:
+        # PKがdiscord_idなので、作成後に読み直さなくてよい
+        created = DiscordUser.objects.bulk_create(
+            [
+                DiscordUser(discord_id=discord_id, username=username)
+                for discord_id, username in missing.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["discord_id"],
+            update_fields=["username"],
+        )
+        for user in created:
+            _cache_on_commit(user_cache, user.discord_id, user.pk, user.username)
+            users[user.discord_id] = user
+    return users
+
+
+def sync_guild_members(
+    guild_id: int | str,
+    guild_name: str,
+    usernames: dict[int | str, str],
+    after: int | str = "",
+    final: bool = True,
+) -> tuple[int, int]:
+    """ギルドのメンバー一覧の一部（IDの範囲）をDBのメンバーと同じにする
+
+    usernamesはdiscord_id -> usernameで、IDの昇順に区切ったメンバー一覧の
+    1区切り分。この区切りが受け持つIDの範囲（afterより大きく、最後の
+    区切りでなければ含まれる最大のIDまで）だけを比較し、足りないメンバーを
+    追加、いないメンバーを削除する。区切りごとに完結するので、同じ区切りを
+    送り直しても結果は変わらない。(追加した数, 削除した数) を返す。
+    """
+    through = DiscordGuild.members.through
+    with transaction.atomic():
+        guild = create_or_update_discord_guild(guild_id, guild_name)
+        users = bulk_upsert_discord_users(usernames)
+        # 中間テーブルのdiscorduser_idがそのままスノーフレーク
+        current = through.objects.filter(discordguild_id=guild.pk)
+        if after:
+            current = current.filter(discorduser_id__gt=int(after))
+        if not final:
+            if not usernames:
+                return 0, 0
+            current = current.filter(discorduser_id__lte=max(users))
+        current_pks = set(current.values_list("discorduser_id", flat=True))
+        wanted_pks = {user.pk for user in users.values()}
+        through.objects.bulk_create(
+            [
+                through(discordguild_id=guild.pk, discorduser_id=pk)
+                for pk in wanted_pks - current_pks
+            ],
+            ignore_conflicts=True,
+        )
+        removed = len(current_pks - wanted_pks)
+        if removed:
+            current.exclude(discorduser_id__in=wanted_pks).delete()
+    return len(wanted_pks - current_pks), removed
+
+
+def apply_result_events(events: list[dict]) -> int:
+    """{game, discord_id, username, field, delta} のイベント列を1トランザクションで適用する
+
+    同じ (game, ユーザー, field) のイベントは合算してから書き込むため、
+    ゲームごとに1回のバルクアップサートで済む。適用したイベント数を返す。
+    """
+    usernames = {int(event["discord_id"]): event["username"] for event in events}
+    deltas_by_game: dict[str, dict[int, dict[str, int]]] = {}
+    for event in events:
+        deltas = deltas_by_game.setdefault(event["game"], {}).setdefault(
+            int(event["discord_id"]), {}
+        )
+        deltas[event["field"]] = deltas.get(event["field"], 0) + event["delta"]
+    with transaction.atomic():
+        users = bulk_upsert_discord_users(usernames)
+        for game, deltas_by_discord_id in deltas_by_game.items():
+            increment_results(
+                RESULT_MODELS[game],
+                {
+                    users[discord_id]: deltas
+                    for discord_id, deltas in deltas_by_discord_id.items()
+                },
+            )
+    return len(events)
+
+
+def compute_question_hash(question: str) -> str:
+    """表記ゆれ（全角/半角、大文字/小文字、空白）を除いた問題文のハッシュ"""
+    normalized = "".join(unicodedata.normalize("NFKC", question).lower().split())
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def add_quiz_questions(questions: list[dict]) -> int:
+    """{question, choices, answer} の問題をまとめてプールに追加する
+
+    既にある問題（同じハッシュ）は無視する。追加した件数を返す。
+    """
+    candidates = {}
+    for q in questions:
+        candidates.setdefault(compute_question_hash(q["question"]), q)
+    existing = set(
+        QuizQuestion.objects.filter(question_hash__in=list(candidates)).values_list(
+            "question_hash", flat=True
+        )
+    )
+    QuizQuestion.objects.bulk_create(
+        [
+            QuizQuestion(
+                question=q["question"],
+                choices=q["choices"],
+                answer=q["answer"],
+                question_hash=question_hash,
+            )
+            for question_hash, q in candidates.items()
+            if question_hash not in existing
+        ],
+        ignore_conflicts=True,
+    )
+    return len(candidates) - len(existing)
+
+
+def count_fresh_quiz_questions() -> int:
+    """まだどのギルドでも出題していない問題の数"""
+    return QuizQuestion.objects.filter(ask_count=0).count()
+
+
+def _next_quiz_question(guild: DiscordGuild):
+    """ギルドに次に出題する問題を選ぶ（出題の記録はしない）"""
+    recent = QuizAsk.objects.filter(guild=guild).order_by("-asked_at")[
+        :QUIZ_RECENT_WINDOW
+    ]
+    return (
+        QuizQuestion.objects.exclude(
+            pk__in=models.Subquery(recent.values("question_id"))
+        )
+        .order_by("ask_count", "created_at")
+        .first()
+    )
+
+
+def pop_quiz_question(guild: DiscordGuild):
+    """ギルドに出題する問題を1問取り出し、出題を記録する
+
+    そのギルドで直近QUIZ_RECENT_WINDOW回に出題した問題は除き、
+    出題回数が少なく古い問題を選ぶ。出せる問題が無ければNoneを返す。
+
+    選んだ問題は、選んだときのask_countのままの場合だけ加算して確保する。
+    同時に取り出した他のリクエストが先に確保していれば、選び直す。
+    """
+    with transaction.atomic():
+        for _ in range(QUIZ_POP_ATTEMPTS):
+            question = _next_quiz_question(guild)
+            if question is None:
+                return None
+            claimed = QuizQuestion.objects.filter(
+                pk=question.pk, ask_count=question.ask_count
+            ).update(ask_count=F("ask_count") + 1)
+            if claimed:
+                question.ask_count += 1
+                QuizAsk.objects.create(guild=guild, question=question)
+                return question
+    return None
+
+
+async def apop_quiz_question(guild: DiscordGuild):
+    """pop_quiz_questionの非同期版（トランザクションを使うためスレッドで実行する）"""
+    return await sync_to_async(pop_quiz_question)(guild)
@@ -1,13 +1,11 @@
-import uuid
-
 from django.db import models
 
 
 class DiscordUser(models.Model):
     """DiscordUserモデル"""
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    discord_id = models.CharField(max_length=255, unique=True)
+    # Discordのスノーフレーク（64bit整数）をそのまま主キーにする
+    discord_id = models.BigIntegerField(primary_key=True)
     username = models.CharField(max_length=255)
 
     class Meta:
@@ -21,8 +19,7 @@ class DiscordUser(models.Model):
 class DiscordGuild(models.Model):
     """DiscordGuildモデル"""
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    guild_id = models.CharField(max_length=255, unique=True)
+    guild_id = models.BigIntegerField(primary_key=True)
     name = models.CharField(max_length=255)
     members = models.ManyToManyField(DiscordUser, related_name="guilds")
 
@@ -37,7 +34,7 @@ class DiscordGuild(models.Model):
 class QuizResult(models.Model):
     """QuizResultモデル"""
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.BigAutoField(primary_key=True)
     user = models.ForeignKey(DiscordUser, on_delete=models.CASCADE)
     correct_count = models.IntegerField(default=0)
     failed_count = models.IntegerField(default=0)
@@ -45,6 +42,14 @@ class QuizResult(models.Model):
     class Meta:
         verbose_name = "クイズ結果"
         verbose_name_plural = "クイズ結果一覧"
+        constraints = [
+            models.UniqueConstraint(fields=["user"], name="unique_quizresult_user"),
+        ]
+        # リーダーボード（値の降順、PKの昇順）用
+        indexes = [
+            models.Index(fields=["-correct_count", "id"], name="quiz_correct_idx"),
+            models.Index(fields=["-failed_count", "id"], name="quiz_failed_idx"),
+        ]
 
     def __str__(self):
         return self.user.username
@@ -53,13 +58,22 @@ class QuizResult(models.Model):
 class OverSleptResult(models.Model):
     """OverSleptResultモデル"""
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.BigAutoField(primary_key=True)
     user = models.ForeignKey(DiscordUser, on_delete=models.CASCADE)
     overslept_count = models.IntegerField(default=0)
 
     class Meta:
         verbose_name = "寝坊結果"
         verbose_name_plural = "寝坊結果一覧"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user"], name="unique_oversleptresult_user"
+            ),
+        ]
+        # リーダーボード（値の降順、PKの昇順）用
+        indexes = [
+            models.Index(fields=["-overslept_count", "id"], name="overslept_count_idx"),
+        ]
 
     def __str__(self):
         return self.user.username
@@ -68,7 +82,7 @@ class OverSleptResult(models.Model):
 class PredictionResult(models.Model):
     """PredictionResultモデル"""
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.BigAutoField(primary_key=True)
     user = models.ForeignKey(DiscordUser, on_delete=models.CASCADE)
     correct_count = models.IntegerField(default=0)
     failed_count = models.IntegerField(default=0)
@@ -76,6 +90,18 @@ class PredictionResult(models.Model):
     class Meta:
         verbose_name = "予測結果"
         verbose_name_plural = "予測結果一覧"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user"], name="unique_predictionresult_user"
+            ),
+        ]
+        # リーダーボード（値の降順、PKの昇順）用
+        indexes = [
+            models.Index(
+                fields=["-correct_count", "id"], name="prediction_correct_idx"
+            ),
+            models.Index(fields=["-failed_count", "id"], name="prediction_failed_idx"),
+        ]
 
     def __str__(self):
         return self.user.username
@@ -84,7 +110,7 @@ class PredictionResult(models.Model):
 class BluffNumberResult(models.Model):
     """BluffNumberResultモデル"""
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.BigAutoField(primary_key=True)
     user = models.ForeignKey(DiscordUser, on_delete=models.CASCADE)
     play_count = models.IntegerField(default=0)
     win_count = models.IntegerField(default=0)
@@ -92,6 +118,16 @@ class BluffNumberResult(models.Model):
     class Meta:
         verbose_name = "ブラフナンバー結果"
         verbose_name_plural = "ブラフナンバー結果一覧"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user"], name="unique_bluffnumberresult_user"
+            ),
+        ]
+        # リーダーボード（値の降順、PKの昇順）用
+        indexes = [
+            models.Index(fields=["-play_count", "id"], name="bluff_play_idx"),
+            models.Index(fields=["-win_count", "id"], name="bluff_win_idx"),
+        ]
 
     def __str__(self):
         return self.user.username
@@ -100,7 +136,7 @@ class BluffNumberResult(models.Model):
 class FlashResult(models.Model):
     """FlashResultモデル"""
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.BigAutoField(primary_key=True)
     user = models.ForeignKey(DiscordUser, on_delete=models.CASCADE)
     play_count = models.IntegerField(default=0)
     correct_count = models.IntegerField(default=0)
@@ -108,6 +144,79 @@ class FlashResult(models.Model):
     class Meta:
         verbose_name = "フラッシュ結果"
         verbose_name_plural = "フラッシュ結果一覧"
+        constraints = [
+            models.UniqueConstraint(fields=["user"], name="unique_flashresult_user"),
+        ]
+        # リーダーボード（値の降順、PKの昇順）用
+        indexes = [
+            models.Index(fields=["-play_count", "id"], name="flash_play_idx"),
+            models.Index(fields=["-correct_count", "id"], name="flash_correct_idx"),
+        ]
 
     def __str__(self):
         return self.user.username
+
+
+class QuizQuestion(models.Model):
+    """事前に生成しておくクイズの問題"""
+
+    id = models.BigAutoField(primary_key=True)
+    question = models.TextField()
+    choices = models.JSONField()
+    answer = models.IntegerField()
+    # 正規化した問題文のSHA-256（同じ問題を重複して貯めないため）
+    question_hash = models.CharField(max_length=64, unique=True)
+    ask_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "クイズ問題"
+        verbose_name_plural = "クイズ問題一覧"
+        # 出題回数の少ない、古い問題から出す
+        indexes = [
+            models.Index(
+                fields=["ask_count", "created_at"], name="quiz_question_pool_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return self.question
+
+
+class QuizAsk(models.Model):
+    """ギルドでクイズの問題を出題した記録"""
+
+    id = models.BigAutoField(primary_key=True)
+    guild = models.ForeignKey(
+        DiscordGuild, on_delete=models.CASCADE, related_name="quiz_asks"
+    )
+    question = models.ForeignKey(
+        QuizQuestion, on_delete=models.CASCADE, related_name="asks"
+    )
+    asked_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "クイズ出題履歴"
+        verbose_name_plural = "クイズ出題履歴一覧"
+        indexes = [
+            models.Index(fields=["guild", "-asked_at"], name="quiz_ask_recent_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.guild} - {self.question}"
+
+
+class BluffNumberGameState(models.Model):
+    """進行中のブラフナンバーの状態（Botの再起動後に再開するため）"""
+
+    channel_id = models.BigIntegerField(primary_key=True)
+    # BluffNumberGame.to_snapshot()の内容
+    snapshot = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "ブラフナンバー進行状態"
+        verbose_name_plural = "ブラフナンバー進行状態一覧"
+
+    def __str__(self):
+        return str(self.channel_id)
@@ -1,7 +1,37 @@
 from rest_framework import serializers
 
+from .mixins import RESULT_MODELS, get_counter_fields
 from .models import DiscordUser, OverSleptResult, PredictionResult, QuizResult
 
+# メンバー同期の1リクエストで受け付ける最大人数
+GUILD_MEMBER_SYNC_MAX_CHUNK = 1000
+
+# 結果イベント1件で加算できる最大値（Botが送る前に合算した値でも十分に収まる）
+RESULT_EVENT_MAX_DELTA = 1_000_000
+
+
+def is_snowflake(value) -> bool:
+    """数字の文字列または整数で、BigIntegerFieldに収まるか"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return False
+    value = str(value)
+    return value.isascii() and value.isdigit() and 0 < int(value) < 2**63
+
+
+class SnowflakeField(serializers.CharField):
+    """数字の文字列で受け取るDiscordのスノーフレーク
+
+    BigIntegerFieldに収まらない値は、保存するときではなくここで弾く。
+    """
+
+    default_error_messages = {"invalid": "Enter a Discord ID."}
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if not is_snowflake(value):
+            self.fail("invalid")
+        return value
+
 
 class LoginSerializer(serializers.Serializer):
     """ログイン用のシリアライザ"""
@@ -13,9 +43,43 @@ class LoginSerializer(serializers.Serializer):
         fields = ["username", "password"]
 
 
+class DiscordUserRequestSerializer(serializers.Serializer):
+    """リクエストで指定するDiscordユーザーのシリアライザ"""
+
+    discord_id = SnowflakeField()
+    username = serializers.CharField()
+
+    class Meta:
+        fields = ["discord_id", "username"]
+
+
+class DiscordGuildRequestSerializer(serializers.Serializer):
+    """リクエストで指定するDiscordギルドのシリアライザ"""
+
+    guild_id = SnowflakeField()
+    guild_name = serializers.CharField(allow_blank=True, default="")
+
+    class Meta:
+        fields = ["guild_id", "guild_name"]
+
+
+class LeaderboardRequestSerializer(serializers.Serializer):
+    """リーダーボードの並べ替えとページ指定のシリアライザ"""
+
+    order_by = serializers.CharField(allow_blank=True, default="")
+    limit = serializers.IntegerField(required=False)
+    cursor = serializers.CharField(allow_blank=True, default="")
+
+    class Meta:
+        fields = ["order_by", "limit", "cursor"]
+
+
 class DiscordUserSerializer(serializers.ModelSerializer):
     """ "DiscordUserモデルのシリアライザ"""
 
+    # スノーフレークはJavaScriptの数値に収まらないので文字列で返す
+    discord_id = serializers.CharField(read_only=True)
+
     class Meta:
         model = DiscordUser
         fields = ["discord_id", "username"]
@@ -76,3 +140,78 @@ class FlashResultSerializer(serializers.Serializer):
 
     class Meta:
         fields = ["discord_id", "username", "play_count", "correct_count"]
+
+
+class ResultEventSerializer(serializers.Serializer):
+    """結果イベント（カウンタの加算）のシリアライザ"""
+
+    game = serializers.ChoiceField(choices=list(RESULT_MODELS))
+    discord_id = SnowflakeField()
+    username = serializers.CharField()
+    field = serializers.CharField()
+    delta = serializers.IntegerField(
+        default=1, min_value=1, max_value=RESULT_EVENT_MAX_DELTA
+    )
+
+    class Meta:
+        fields = ["game", "discord_id", "username", "field", "delta"]
+
+    def validate(self, attrs):
+        counter_fields = get_counter_fields(RESULT_MODELS[attrs["game"]])
+        if attrs["field"] not in counter_fields:
+            raise serializers.ValidationError(
+                {"field": f"{attrs['game']} has no counter '{attrs['field']}'"}
+            )
+        return attrs
+
+
+class QuizQuestionSerializer(serializers.Serializer):
+    """クイズの問題（3択）のシリアライザ"""
+
+    question = serializers.CharField()
+    choices = serializers.ListField(
+        child=serializers.CharField(), min_length=3, max_length=3
+    )
+    answer = serializers.IntegerField(min_value=0, max_value=2)
+
+    class Meta:
+        fields = ["question", "choices", "answer"]
+
+    def validate_choices(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError("choices must be distinct")
+        return value
+
+
+class GuildMemberSerializer(serializers.Serializer):
+    """ギルドメンバー（同期用）のシリアライザ"""
+
+    discord_id = SnowflakeField()
+    username = serializers.CharField()
+
+    class Meta:
+        fields = ["discord_id", "username"]
+
+
+class GuildMemberSyncSerializer(serializers.Serializer):
+    """ギルドのメンバー一覧（IDの昇順に区切った1区切り）のシリアライザ"""
+
+    guild_id = SnowflakeField()
+    guild_name = serializers.CharField(allow_blank=True, default="")
+    members = GuildMemberSerializer(many=True, max_length=GUILD_MEMBER_SYNC_MAX_CHUNK)
+    # 前の区切りの最後のID（最初の区切りでは空）
+    after = SnowflakeField(allow_blank=True, default="")
+    # 最後の区切りか（afterより後のIDを全て受け持つ）
+    final = serializers.BooleanField(default=True)
+
+    class Meta:
+        fields = ["guild_id", "guild_name", "members", "after", "final"]
+
+    def validate(self, attrs):
+        if attrs["after"] and any(
+            int(m["discord_id"]) <= int(attrs["after"]) for m in attrs["members"]
+        ):
+            raise serializers.ValidationError(
+                {"members": "member ids must be greater than 'after'"}
+            )
+        return attrs
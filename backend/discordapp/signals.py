@@ -0,0 +1,25 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .cache import guild_cache, user_cache
+from .metrics import install_query_recorder
+from .models import DiscordGuild, DiscordUser
+
+
+@receiver(post_delete, sender=DiscordUser)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """削除されたDiscordUserをキャッシュから外す"""
+    user_cache.invalidate(instance.discord_id)
+
+
+@receiver(post_delete, sender=DiscordGuild)
+def invalidate_guild_cache(sender, instance, **kwargs):
+    """削除されたDiscordGuildをキャッシュから外す"""
+    guild_cache.invalidate(instance.guild_id)
+
+
+@receiver(connection_created)
+def record_query_metrics(sender, connection, **kwargs):
+    """新しいDB接続のクエリをメトリクスに記録する"""
+    install_query_recorder(connection)
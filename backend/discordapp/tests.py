@@ -1,3 +1,1892 @@
-from django.test import TestCase
+import asyncio
+import functools
+import importlib
+import io
+import json
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+import types
+from collections import Counter
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import discord
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import mixins
+from .cache import SnowflakeCache, user_cache
+from .management.commands.commands.api_client import (
+    APIAuthError,
+    APIResponse,
+    TokenManager,
+)
+from .management.commands.commands.bluff_number import bluff_number_views
+from .management.commands.commands.bluff_number.bluff_number_game import (
+    BluffNumberGame,
+    GamePhase,
+)
+from .management.commands.commands.bluff_number.bluff_number_store import (
+    DatabaseGameStore,
+    MemoryGameStore,
+)
+from .management.commands.bench_bot_memory import fake_guild
+from .management.commands.commands.flash_frames import (
+    FrameScheduler,
+    PlaybackReport,
+    build_flash_frames,
+    fit_frames_to_budget,
+)
+from .management.commands.commands.flash_render import (
+    flash_render_key,
+    get_flash_gif,
+    render_cache,
+)
+from .management.commands.commands import fake_discord, flash, instrumentation
+from .management.commands.commands.gateway import client_options
+from .management.commands.commands.member_sync import GuildMemberSyncer
+from .management.commands.commands.quiz_generator import (
+    QuizGenerationError,
+    QuizGenerator,
+)
+from .management.commands.commands.quiz_parser import parse_quizzes
+from .management.commands.commands.quiz_pool import QuizPoolRefiller
+from .management.commands.commands.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientCaller,
+    RetryPolicy,
+)
+from .management.commands.commands.write_buffer import ResultWriteBuffer
+from .management.commands.loadtest import (
+    TrafficSimulator,
+    parse_mix,
+    percentile,
+)
+from .management.commands.runbot import (
+    metrics_port,
+    parse_shard_ids,
+    shard_journal_path,
+    split_shards,
+)
+from .metrics import MetricsRegistry, registry
+from .mixins import (
+    create_or_update_discord_guild,
+    create_or_update_discord_user,
+    decode_leaderboard_cursor,
+    increment_result,
+)
+from .models import (
+    BluffNumberGameState,
+    DiscordGuild,
+    DiscordUser,
+    FlashResult,
+    QuizAsk,
+    QuizResult,
+)
+
+
+class SnowflakeCacheTests(TestCase):
+    """SnowflakeCacheのテスト"""
+
+    def setUp(self):
+        self.now = 0.0
+        self.cache = SnowflakeCache(maxsize=2, ttl=10, clock=lambda: self.now)
+
+    def test_lru_eviction(self):
+        self.cache.set(1, 1, "a")
+        self.cache.set(2, 2, "b")
+        self.cache.get(1)
+        self.cache.set(3, 3, "c")
+        self.assertIsNone(self.cache.get(2))
+        self.assertEqual(self.cache.get(1), (1, "a"))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_ttl(self):
+        self.cache.set(1, 1, "a")
+        self.now = 10
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+
+class DiscordUserCacheTests(TestCase):
+    """create_or_update_discord_userのキャッシュ利用のテスト"""
+
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+
+    def test_cached_user_skips_queries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            created = create_or_update_discord_user("1", "alice")
+        with self.assertNumQueries(0):
+            user = create_or_update_discord_user("1", "alice")
+        self.assertEqual(user.pk, created.pk)
+        with self.assertNumQueries(1):
+            increment_result(QuizResult, user, correct_count=1)
+
+    def test_rename_invalidates_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_or_update_discord_user("1", "alice")
+        invalidations = user_cache.stats()["invalidations"]
+        with self.captureOnCommitCallbacks(execute=True):
+            create_or_update_discord_user("1", "alice2")
+        self.assertEqual(DiscordUser.objects.get(discord_id="1").username, "alice2")
+        self.assertEqual(user_cache.get(1)[1], "alice2")
+        self.assertEqual(user_cache.stats()["invalidations"], invalidations + 1)
+
+    def test_deleted_user_is_invalidated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = create_or_update_discord_user("1", "alice")
+        user.delete()
+        self.assertIsNone(user_cache.get(1))
+
+
+class IncrementResultTests(TestCase):
+    """increment_resultのテスト"""
+
+    def setUp(self):
+        self.user = create_or_update_discord_user("1", "alice")
+
+    def test_creates_row_on_first_increment(self):
+        result = increment_result(QuizResult, self.user, correct_count=1)
+        self.assertEqual((result.correct_count, result.failed_count), (1, 0))
+        self.assertEqual(QuizResult.objects.get(user=self.user).correct_count, 1)
+
+    def test_increments_existing_row(self):
+        QuizResult.objects.create(user=self.user, correct_count=2, failed_count=5)
+        result = increment_result(QuizResult, self.user, failed_count=1)
+        self.assertEqual((result.correct_count, result.failed_count), (2, 6))
+        self.assertEqual(QuizResult.objects.count(), 1)
+
+    def test_single_query(self):
+        increment_result(FlashResult, self.user, play_count=1)
+        with self.assertNumQueries(1):
+            result = increment_result(FlashResult, self.user, play_count=1)
+        self.assertEqual(result.play_count, 2)
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            increment_result(QuizResult, self.user, win_count=1)
+
+
+class IncrementAPIViewTests(TestCase):
+    """加算系APIビューのテスト"""
+
+    def setUp(self):
+        self.client = APIClient()
+        token = Token.objects.create(
+            user=get_user_model().objects.create_user("admin", password="password")
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def test_flash_correct(self):
+        payload = {"discord_id": "1", "username": "alice"}
+        self.client.post(reverse("discordapp:flash-play"), payload, format="json")
+        res = self.client.post(
+            reverse("discordapp:flash-correct"), payload, format="json"
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res.json(),
+            {
+                "discord_id": "1",
+                "username": "alice",
+                "play_count": 1,
+                "correct_count": 1,
+            },
+        )
+
+
+class AsyncGuildMemberViewTests(TestCase):
+    """ギルドメンバー追加・削除の非同期APIビューのテスト"""
+
+    def setUp(self):
+        self.client = APIClient()
+        token = Token.objects.create(
+            user=get_user_model().objects.create_user("admin", password="password")
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.payload = {
+            "guild_id": "1000",
+            "guild_name": "guild",
+            "discord_id": "1",
+            "username": "alice",
+        }
+
+    def test_add_and_remove_member(self):
+        res = self.client.post(
+            reverse("discordapp:add-member-to-guild"), self.payload, format="json"
+        )
+        self.assertEqual(res.status_code, 200)
+        guild = create_or_update_discord_guild("1000", "guild")
+        self.assertEqual(list(guild.members.values_list("discord_id", flat=True)), [1])
+        res = self.client.post(
+            reverse("discordapp:remove-member-from-guild"), self.payload, format="json"
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(guild.members.exists())
+
+    def test_requires_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Token invalid")
+        res = self.client.post(
+            reverse("discordapp:add-member-to-guild"), self.payload, format="json"
+        )
+        self.assertEqual(res.status_code, 401)
+        self.assertFalse(DiscordUser.objects.exists())
+
+    def test_rejects_ids_that_are_not_snowflakes(self):
+        for discord_id in ("alice", "-1", str(2**63), 1.5):
+            res = self.client.post(
+                reverse("discordapp:add-member-to-guild"),
+                {**self.payload, "discord_id": discord_id},
+                format="json",
+            )
+            self.assertEqual(res.status_code, 400, discord_id)
+        self.assertFalse(DiscordUser.objects.exists())
+
+    def test_rejects_malformed_body(self):
+        for url, missing in [
+            ("discordapp:add-member-to-guild", "guild_id"),
+            ("discordapp:add-member-to-guild", "username"),
+            ("discordapp:remove-member-from-guild", "discord_id"),
+            ("discordapp:quiz-result-plus", "discord_id"),
+            ("discordapp:flash-play", "username"),
+        ]:
+            with self.subTest(url=url, missing=missing):
+                payload = {k: v for k, v in self.payload.items() if k != missing}
+                res = self.client.post(reverse(url), payload, format="json")
+                self.assertEqual(res.status_code, 400)
+                self.assertIn(missing, res.json())
+        self.assertFalse(DiscordUser.objects.exists())
+
+
+class GuildMemberSyncAPIViewTests(TestCase):
+    """メンバー一覧の同期APIのテスト"""
+
+    def setUp(self):
+        self.client = APIClient()
+        token = Token.objects.create(
+            user=get_user_model().objects.create_user("admin", password="password")
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.url = reverse("discordapp:sync-guild-members")
+        self.guild = create_or_update_discord_guild("1000", "guild")
+        for discord_id in ("5", "9", "100"):
+            self.guild.members.add(create_or_update_discord_user(discord_id, "old"))
+
+    def sync(self, ids, after="", final=True):
+        members = [{"discord_id": i, "username": f"user{i}"} for i in ids]
+        return self.client.post(
+            self.url,
+            {
+                "guild_id": "1000",
+                "guild_name": "guild",
+                "members": members,
+                "after": after,
+                "final": final,
+            },
+            format="json",
+        )
+
+    def test_chunks_apply_diff_per_id_range(self):
+        # 1〜5の範囲: 1を追加し、5はそのまま（9以降はこの区切りでは触らない）
+        res = self.sync(["1", "5"], final=False)
+        self.assertEqual((res.data["added"], res.data["removed"]), (1, 0))
+        # 5より後の範囲: 9と100は抜けたので削除し、10と20を追加
+        res = self.sync(["10", "20"], after="5")
+        self.assertEqual((res.data["added"], res.data["removed"]), (2, 2))
+        self.assertEqual(
+            sorted(self.guild.members.values_list("discord_id", flat=True)),
+            [1, 5, 10, 20],
+        )
+        self.assertEqual(DiscordUser.objects.get(discord_id="5").username, "user5")
+        # 同じ区切りを送り直しても変わらない
+        res = self.sync(["10", "20"], after="5")
+        self.assertEqual((res.data["added"], res.data["removed"]), (0, 0))
+
+    def test_rejects_ids_before_range(self):
+        res = self.sync(["3"], after="5")
+        self.assertEqual(res.status_code, 400)
+
+    def test_rejects_ids_that_overflow(self):
+        too_large = str(2**63)
+        self.assertEqual(self.sync([too_large]).status_code, 400)
+        self.assertEqual(self.sync(["1"], after=too_large).status_code, 400)
+        res = self.client.post(
+            self.url,
+            {"guild_id": too_large, "members": [], "final": True},
+            format="json",
+        )
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            sorted(self.guild.members.values_list("discord_id", flat=True)),
+            [5, 9, 100],
+        )
+
+
+class FakeMemberSyncAPI:
+    def __init__(self):
+        self.requests = []
+
+    async def sync_guild_members(self, **payload):
+        self.requests.append(payload)
+        return APIResponse(200, {"added": len(payload["members"]), "removed": 0})
+
+
+class GuildMemberSyncerTests(TestCase):
+    def test_members_are_sent_in_sorted_chunks(self):
+        api = FakeMemberSyncAPI()
+        syncer = GuildMemberSyncer(api, chunk_size=2, concurrency=1)
+        members = [(100, "c"), (5, "a"), (20, "b"), (7, "d"), (300, "e")]
+        added, removed = asyncio.run(syncer.sync_members(1, "guild", members))
+        self.assertEqual((added, removed), (5, 0))
+        self.assertEqual(
+            [
+                ([m["discord_id"] for m in r["members"]], r["after"], r["final"])
+                for r in api.requests
+            ],
+            [
+                (["5", "7"], "", False),
+                (["20", "100"], "7", False),
+                (["300"], "100", True),
+            ],
+        )
+
+    def test_empty_guild_clears_members(self):
+        api = FakeMemberSyncAPI()
+        asyncio.run(GuildMemberSyncer(api, chunk_size=2).sync_members(1, "g", []))
+        self.assertEqual(api.requests[0]["members"], [])
+        self.assertTrue(api.requests[0]["final"])
+
+
+class ResultBatchAPIViewTests(TestCase):
+    """結果イベントのまとめて適用APIのテスト"""
+
+    def setUp(self):
+        self.client = APIClient()
+        token = Token.objects.create(
+            user=get_user_model().objects.create_user("admin", password="password")
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.url = reverse("discordapp:result-batch")
+
+    def test_applies_events_in_bulk(self):
+        FlashResult.objects.create(
+            user=create_or_update_discord_user("1", "old name"), play_count=3
+        )
+        events = [
+            {
+                "game": "flash",
+                "discord_id": "1",
+                "username": "alice",
+                "field": "play_count",
+                "delta": 1,
+            },
+            {
+                "game": "flash",
+                "discord_id": "1",
+                "username": "alice",
+                "field": "correct_count",
+                "delta": 1,
+            },
+            {
+                "game": "flash",
+                "discord_id": "2",
+                "username": "bob",
+                "field": "play_count",
+                "delta": 1,
+            },
+            {
+                "game": "quiz",
+                "discord_id": "2",
+                "username": "bob",
+                "field": "failed_count",
+                "delta": 2,
+            },
+        ]
+        res = self.client.post(self.url, events, format="json")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["applied"], 4)
+        alice = DiscordUser.objects.get(discord_id="1")
+        self.assertEqual(alice.username, "alice")
+        self.assertEqual(
+            FlashResult.objects.filter(user=alice)
+            .values_list("play_count", "correct_count")
+            .get(),
+            (4, 1),
+        )
+        self.assertEqual(FlashResult.objects.get(user__discord_id="2").play_count, 1)
+        self.assertEqual(QuizResult.objects.get(user__discord_id="2").failed_count, 2)
+
+    def test_rejects_unknown_field(self):
+        events = [
+            {
+                "game": "quiz",
+                "discord_id": "1",
+                "username": "alice",
+                "field": "win_count",
+            }
+        ]
+        res = self.client.post(self.url, events, format="json")
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(QuizResult.objects.exists())
+
+    def test_rejects_out_of_range_values(self):
+        event = {
+            "game": "quiz",
+            "discord_id": "1",
+            "username": "alice",
+            "field": "failed_count",
+        }
+        for invalid in [
+            {"discord_id": str(2**63)},
+            {"discord_id": "0"},
+            {"delta": 10**12},
+        ]:
+            with self.subTest(**invalid):
+                res = self.client.post(self.url, [{**event, **invalid}], format="json")
+                self.assertEqual(res.status_code, 400)
+        self.assertFalse(QuizResult.objects.exists())
+
+
+class GuildResultListAPIViewTests(TestCase):
+    """ギルド内の結果一覧APIのテスト"""
+
+    def setUp(self):
+        self.client = APIClient()
+        token = Token.objects.create(
+            user=get_user_model().objects.create_user("admin", password="password")
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def _create_guild(self, guild_id, size):
+        guild = create_or_update_discord_guild(guild_id, f"guild {guild_id}")
+        for i in range(size):
+            user = create_or_update_discord_user(guild_id * 1000 + i, f"user {i}")
+            guild.members.add(user)
+            if i % 2:
+                increment_result(QuizResult, user, correct_count=i)
+        return guild
+
+    def _get(self, url_name, guild_id):
+        return self.client.generic(
+            "GET",
+            reverse(url_name),
+            json.dumps({"guild_id": guild_id, "guild_name": f"guild {guild_id}"}),
+            content_type="application/json",
+        )
+
+    def test_members_without_results_are_zero(self):
+        self._create_guild(1, 4)
+        res = self._get("discordapp:quiz-result-list", 1)
+        self.assertEqual(res.status_code, 200)
+        counts = {row["discord_id"]: row["correct_count"] for row in res.json()}
+        self.assertEqual(counts, {"1000": 0, "1001": 1, "1002": 0, "1003": 3})
+        # 一覧取得で結果行は作られない
+        self.assertEqual(QuizResult.objects.count(), 2)
+
+    def test_query_count_does_not_depend_on_guild_size(self):
+        self._create_guild(1, 2)
+        self._create_guild(2, 40)
+        for url_name in [
+            "discordapp:quiz-result-list",
+            "discordapp:overslept-result-list",
+            "discordapp:prediction-result-list",
+            "discordapp:bluff-number-result-list",
+            "discordapp:flash-result-list",
+        ]:
+            with CaptureQueriesContext(connection) as small:
+                self.assertEqual(len(self._get(url_name, 1).json()), 2)
+            with CaptureQueriesContext(connection) as large:
+                self.assertEqual(len(self._get(url_name, 2).json()), 40)
+            self.assertEqual(len(small), len(large), url_name)
+
+
+class LeaderboardAPIViewTests(TestCase):
+    """リーダーボードAPIのテスト"""
+
+    def setUp(self):
+        self.client = APIClient()
+        token = Token.objects.create(
+            user=get_user_model().objects.create_user("admin", password="password")
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        guild = create_or_update_discord_guild("1000", "guild")
+        outsider = create_or_update_discord_user("999", "outsider")
+        increment_result(FlashResult, outsider, correct_count=100)
+        self.correct_counts = [5, 3, 3, 8, 1, 3, 0]
+        for i, count in enumerate(self.correct_counts):
+            user = create_or_update_discord_user(str(i), f"user {i}")
+            guild.members.add(user)
+            increment_result(FlashResult, user, play_count=10, correct_count=count)
+
+    def _get(self, **payload):
+        return self.client.generic(
+            "GET",
+            reverse("discordapp:leaderboard", kwargs={"game": "flash"}),
+            json.dumps({"guild_id": "1000", "guild_name": "guild", **payload}),
+            content_type="application/json",
+        )
+
+    def test_pages_through_sorted_results(self):
+        counts = []
+        cursor = None
+        pages = 0
+        while True:
+            payload = {"order_by": "correct_count", "limit": 3}
+            if cursor:
+                payload["cursor"] = cursor
+            data = self._get(**payload).json()
+            counts += [row["correct_count"] for row in data["results"]]
+            pages += 1
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(counts, sorted(self.correct_counts, reverse=True))
+
+    def test_own_rank(self):
+        data = self._get(order_by="correct_count", limit=1, discord_id="2").json()
+        self.assertEqual(data["results"][0]["correct_count"], 8)
+        self.assertEqual(data["me"]["discord_id"], "2")
+        # 8, 5 の次で 3 が3人並ぶため3位
+        self.assertEqual(data["me"]["rank"], 3)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self._get(order_by="win_count").status_code, 400)
+        self.assertEqual(self._get(cursor="broken").status_code, 400)
+        for payload in [
+            {"cursor": ["x"]},
+            {"cursor": {"a": 1}},
+            {"order_by": ["correct_count"]},
+            {"limit": "ten"},
+        ]:
+            with self.subTest(payload=payload):
+                res = self._get(**payload)
+                self.assertEqual(res.status_code, 400)
+                self.assertIn(next(iter(payload)), res.json())
+        with self.assertRaises(ValueError):
+            decode_leaderboard_cursor(["x"])
+
+
+class MetricsRegistryTests(TestCase):
+    """メトリクスの集計と出力のテスト"""
+
+    def test_renders_counters_and_cumulative_histograms(self):
+        metrics = MetricsRegistry()
+        counter = metrics.counter("c_total", "counter", ("route",))
+        histogram = metrics.histogram("h", "histogram", ("route",), buckets=(1, 5))
+        counter.inc('a"b')
+        counter.inc('a"b', amount=2)
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value, "r")
+        self.assertEqual(
+            metrics.render().splitlines(),
+            [
+                "# HELP c_total counter",
+                "# TYPE c_total counter",
+                'c_total{route="a\\"b"} 3',
+                "# HELP h histogram",
+                "# TYPE h histogram",
+                'h_bucket{route="r",le="1.0"} 2',
+                'h_bucket{route="r",le="5.0"} 3',
+                'h_bucket{route="r",le="+Inf"} 4',
+                'h_sum{route="r"} 14.5',
+                'h_count{route="r"} 4',
+            ],
+        )
+
+    def test_threads_record_without_losing_counts(self):
+        metrics = MetricsRegistry()
+        counter = metrics.counter("c_total", "counter")
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            for _ in range(1000):
+                counter.inc()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIn("c_total 8000", metrics.render().splitlines())
+
+
+class MetricsMiddlewareTests(TestCase):
+    """APIのメトリクス（/api/metrics）のテスト"""
+
+    ROUTE = "api/leaderboard/<str:game>/"
+
+    def setUp(self):
+        registry.clear()
+        self.addCleanup(registry.clear)
+        token = Token.objects.create(
+            user=get_user_model().objects.create_user("admin", password="password")
+        )
+        self.headers = {"Authorization": f"Token {token.key}"}
+        create_or_update_discord_guild("1000", "guild")
+
+    def leaderboard(self, client, game="flash"):
+        return client.generic(
+            "GET",
+            reverse("discordapp:leaderboard", kwargs={"game": game}),
+            json.dumps({"guild_id": "1000", "guild_name": "guild"}),
+            content_type="application/json",
+            headers=self.headers,
+        )
+
+    def samples(self) -> dict[str, str]:
+        res = self.client.get("/api/metrics", headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res["Content-Type"].startswith("text/plain; version=0.0.4"))
+        lines = res.content.decode().splitlines()
+        return dict(line.rsplit(" ", 1) for line in lines if not line.startswith("#"))
+
+    def test_records_route_latency_and_queries(self):
+        self.assertEqual(self.leaderboard(self.client).status_code, 200)
+        self.assertEqual(self.leaderboard(self.client, "unknown").status_code, 404)
+
+        # ASGI（非同期のミドルウェア）経由でも記録される
+        async def leaderboard_async():
+            return await self.leaderboard(self.async_client)
+
+        self.assertEqual(async_to_sync(leaderboard_async)().status_code, 200)
+
+        samples = self.samples()
+        labels = f'route="{self.ROUTE}",method="GET"'
+        self.assertEqual(
+            samples[f'discordapp_http_requests_total{{{labels},status="200"}}'], "2"
+        )
+        self.assertEqual(
+            samples[f'discordapp_http_requests_total{{{labels},status="404"}}'], "1"
+        )
+        self.assertEqual(
+            samples[f"discordapp_http_request_duration_seconds_count{{{labels}}}"], "3"
+        )
+        # 認証とリーダーボードの取得でクエリが実行されている
+        self.assertGreater(
+            float(samples[f"discordapp_http_request_db_queries_sum{{{labels}}}"]), 3
+        )
+        self.assertGreater(
+            float(
+                samples[f"discordapp_http_request_db_duration_seconds_sum{{{labels}}}"]
+            ),
+            0,
+        )
+
+    def test_requires_token(self):
+        self.assertEqual(self.client.get("/api/metrics").status_code, 401)
+        res = self.client.get("/api/metrics", headers={"Authorization": "Token wrong"})
+        self.assertEqual(res.status_code, 401)
+
+    def test_records_exceptions(self):
+        client = self.client_class(raise_request_exception=False)
+        with mock.patch(
+            "discordapp.async_views.aget_leaderboard", side_effect=RuntimeError
+        ):
+            self.assertEqual(self.leaderboard(client).status_code, 500)
+        client.get("/api/missing/")
+
+        samples = self.samples()
+        labels = f'route="{self.ROUTE}",method="GET"'
+        self.assertEqual(
+            samples[
+                f'discordapp_http_exceptions_total{{{labels},exception="RuntimeError"}}'
+            ],
+            "1",
+        )
+        self.assertEqual(
+            samples[f'discordapp_http_requests_total{{{labels},status="500"}}'], "1"
+        )
+        self.assertEqual(
+            samples[
+                'discordapp_http_requests_total{route="unmatched",method="GET",status="404"}'
+            ],
+            "1",
+        )
+
+
+class ConcurrentIncrementTests(TransactionTestCase):
+    """並列に加算しても更新が失われないことのテスト"""
+
+    THREADS = 8
+    INCREMENTS = 25
+
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+
+    def test_no_lost_updates(self):
+        user = create_or_update_discord_user("1", "alice")
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(self.INCREMENTS):
+                    increment_result(QuizResult, user, correct_count=1)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            QuizResult.objects.get(user=user).correct_count,
+            self.THREADS * self.INCREMENTS,
+        )
+
+
+class ParseSnowflakeTests(TestCase):
+    """文字列IDを移すときのスノーフレークの解釈のテスト"""
+
+    def test_parse(self):
+        migration = importlib.import_module(
+            "discordapp.migrations.0011_copy_to_snowflake_tables"
+        )
+        self.assertEqual(
+            migration.parse_snowflake(" 123456789012345678 "), 123456789012345678
+        )
+        self.assertEqual(migration.parse_snowflake("007"), 7)
+        for value in ["", "0", "-1", "1e3", "１２３", "not-a-snowflake", str(2**63)]:
+            with self.subTest(value=value):
+                self.assertIsNone(migration.parse_snowflake(value))
+
+
+class TokenManagerTests(TestCase):
+    def test_concurrent_refresh_logs_in_once(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return f"token-{len(calls)}"
+
+        async def run():
+            tokens = TokenManager(fetch)
+            first = await tokens.get()
+            # 同じトークンで同時に401を受けても、取り直しは1回だけ
+            return first, await asyncio.gather(
+                *(tokens.refresh(stale=first) for _ in range(10))
+            )
+
+        first, refreshed = asyncio.run(run())
+        self.assertEqual(first, "token-1")
+        self.assertEqual(set(refreshed), {"token-2"})
+        self.assertEqual(len(calls), 2)
+
+    def test_failed_login_is_shared_by_waiters(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise APIAuthError("down")
+
+        async def run():
+            tokens = TokenManager(fetch)
+            return await asyncio.gather(
+                *(tokens.get() for _ in range(5)), return_exceptions=True
+            )
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(r, APIAuthError) for r in results))
+        self.assertEqual(len(calls), 1)
+
+    def test_token_is_cached_on_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "token")
+
+            async def fetch():
+                return "saved"
+
+            self.assertEqual(asyncio.run(TokenManager(fetch, path).get()), "saved")
+
+            async def unreachable():
+                raise AssertionError("should not log in")
+
+            # 再起動後はファイルのトークンをそのまま使う
+            self.assertEqual(
+                asyncio.run(TokenManager(unreachable, path).get()), "saved"
+            )
+
+
+class ResilientCallerTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.caller = ResilientCaller(
+            RetryPolicy(attempts=3, backoff=0, backoff_max=0),
+            CircuitBreaker(
+                failure_threshold=3, reset_timeout=30, clock=lambda: self.now
+            ),
+        )
+
+    def call(self, outcomes, idempotent):
+        """outcomesを順に返す（例外なら送出する）sendで呼び出し、送信回数を返す"""
+        sent = []
+
+        async def send():
+            outcome = outcomes[min(len(sent), len(outcomes) - 1)]
+            sent.append(outcome)
+            if isinstance(outcome, BaseException):
+                raise outcome
+            return APIResponse(status_code=outcome)
+
+        try:
+            result = asyncio.run(self.caller.call(send, idempotent))
+        except (asyncio.TimeoutError, CircuitOpenError) as e:
+            result = e
+        return result, len(sent)
+
+    def test_client_errors_are_not_retried(self):
+        result, sent = self.call([404], idempotent=True)
+        self.assertEqual((result.status_code, sent), (404, 1))
+
+    def test_unavailable_is_retried_for_writes(self):
+        result, sent = self.call([503, 503, 200], idempotent=False)
+        self.assertEqual((result.status_code, sent), (200, 3))
+
+    def test_timeout_is_retried_only_when_idempotent(self):
+        result, sent = self.call([asyncio.TimeoutError(), 200], idempotent=True)
+        self.assertEqual((result.status_code, sent), (200, 2))
+        # カウンタの加算は二重に処理されるおそれがあるので送り直さない
+        result, sent = self.call([asyncio.TimeoutError(), 200], idempotent=False)
+        self.assertIsInstance(result, asyncio.TimeoutError)
+        self.assertEqual(sent, 1)
+
+    def test_circuit_opens_and_recovers(self):
+        result, sent = self.call([500], idempotent=True)
+        self.assertEqual((result.status_code, sent), (500, 3))
+        self.assertEqual(self.caller.breaker.state, CircuitBreaker.OPEN)
+
+        result, sent = self.call([200], idempotent=True)
+        self.assertIsInstance(result, CircuitOpenError)
+        self.assertEqual(sent, 0)
+
+        self.now = 30
+        result, sent = self.call([200], idempotent=True)
+        self.assertEqual((result.status_code, sent), (200, 1))
+        self.assertEqual(self.caller.breaker.state, CircuitBreaker.CLOSED)
+        metrics = self.caller.metrics()
+        self.assertEqual(metrics["circuit_opened"], 1)
+        self.assertEqual(metrics["short_circuited"], 1)
+
+    def open_circuit(self):
+        self.call([500], idempotent=True)
+        self.now = 30
+        self.assertEqual(self.caller.breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_cancelled_trial_does_not_wedge_the_circuit(self):
+        self.open_circuit()
+
+        async def cancel_trial():
+            started = asyncio.Event()
+
+            async def send():
+                started.set()
+                await asyncio.sleep(60)
+
+            task = asyncio.create_task(self.caller.call(send, idempotent=True))
+            await started.wait()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_trial())
+        result, sent = self.call([200], idempotent=True)
+        self.assertEqual((result.status_code, sent), (200, 1))
+        self.assertEqual(self.caller.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_unexpected_error_in_trial_reopens_the_circuit(self):
+        self.open_circuit()
+        with self.assertRaises(ValueError):
+            self.call([ValueError("bad body")], idempotent=True)
+        self.assertEqual(self.caller.breaker.state, CircuitBreaker.OPEN)
+
+        self.now = 60
+        result, sent = self.call([200], idempotent=True)
+        self.assertEqual((result.status_code, sent), (200, 1))
+
+
+class FakeBatchAPI:
+    """result_batchの呼び出しを記録する偽のAPIクライアント"""
+
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.batches = []
+
+    async def result_batch(self, events):
+        self.batches.append(events)
+        return APIResponse(status_code=self.status_code)
+
+
+class ResultWriteBufferTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.journal = os.path.join(tmp.name, "results.journal")
+
+    def make_buffer(self, api, max_pending=100):
+        return ResultWriteBuffer(
+            api, self.journal, flush_interval=60, max_pending=max_pending
+        )
+
+    def test_increments_are_coalesced_into_one_batch(self):
+        api = FakeBatchAPI()
+
+        async def run():
+            buffer = self.make_buffer(api)
+            await buffer.start()
+            for _ in range(10):
+                buffer.add("quiz", 1, "a", "failed_count")
+            buffer.add("quiz", 2, "b", "failed_count")
+            buffer.add("flash", 1, "a2", "play_count")
+            await buffer.close()
+
+        asyncio.run(run())
+        self.assertEqual(len(api.batches), 1)
+        events = {(e["game"], e["discord_id"]): e for e in api.batches[0]}
+        self.assertEqual(events[("quiz", "1")]["delta"], 10)
+        self.assertEqual(events[("quiz", "2")]["delta"], 1)
+        self.assertEqual(events[("flash", "1")]["username"], "a2")
+        with open(self.journal) as f:
+            self.assertEqual(f.read(), "")
+
+    def test_size_threshold_triggers_flush(self):
+        api = FakeBatchAPI()
+
+        async def run():
+            buffer = self.make_buffer(api, max_pending=2)
+            await buffer.start()
+            buffer.add("quiz", 1, "a", "failed_count")
+            buffer.add("quiz", 2, "b", "failed_count")
+            await asyncio.sleep(0)
+            flushed = len(api.batches)
+            await buffer.close()
+            return flushed
+
+        self.assertEqual(asyncio.run(run()), 1)
+
+    def test_unsent_increments_survive_a_restart(self):
+        async def crash():
+            buffer = self.make_buffer(FakeBatchAPI(status_code=503))
+            await buffer.start()
+            buffer.add("quiz", 1, "a", "failed_count")
+            buffer.add("quiz", 1, "a", "failed_count")
+            self.assertFalse(await buffer.flush())
+            buffer.add("quiz", 1, "a", "failed_count")
+            await buffer._journal_task
+            # close()せずに落ちたことにする
+            buffer._timer.cancel()
+
+        asyncio.run(crash())
+
+        api = FakeBatchAPI()
+
+        async def restart():
+            buffer = self.make_buffer(api)
+            await buffer.start()
+            await buffer.close()
+
+        asyncio.run(restart())
+        self.assertEqual(len(api.batches), 1)
+        self.assertEqual(api.batches[0][0]["delta"], 3)
+
+    def test_cancelled_flush_keeps_the_batch(self):
+        api = FakeBatchAPI()
+
+        async def run():
+            buffer = self.make_buffer(api)
+            await buffer.start()
+            buffer.add("quiz", 1, "a", "failed_count")
+            started = asyncio.Event()
+
+            async def hang(events):
+                started.set()
+                await asyncio.sleep(60)
+
+            with mock.patch.object(api, "result_batch", hang):
+                flush = asyncio.create_task(buffer.flush())
+                await started.wait()
+                buffer.add("quiz", 1, "a", "failed_count")
+                flush.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await flush
+            self.assertEqual(buffer.pending, 1)
+            await buffer.close()
+
+        asyncio.run(run())
+        self.assertEqual(len(api.batches), 1)
+        self.assertEqual(api.batches[0][0]["delta"], 2)
+        with open(self.journal) as f:
+            self.assertEqual(f.read(), "")
+
+    def test_periodic_flush_survives_errors(self):
+        api = FakeBatchAPI()
+        errors = [APIAuthError("login failed with status 502"), RuntimeError("bug")]
+        result_batch = api.result_batch
+
+        async def failing(events):
+            if errors:
+                raise errors.pop(0)
+            return await result_batch(events)
+
+        async def run():
+            buffer = ResultWriteBuffer(
+                api, self.journal, flush_interval=0.01, max_pending=100
+            )
+            await buffer.start()
+            buffer.add("quiz", 1, "a", "failed_count")
+            with mock.patch.object(api, "result_batch", failing):
+                for _ in range(100):
+                    await asyncio.sleep(0.01)
+                    if api.batches:
+                        break
+            self.assertFalse(buffer._timer.done())
+            await buffer.close()
+
+        asyncio.run(run())
+        self.assertEqual(errors, [])
+        self.assertEqual(len(api.batches), 1)
+        self.assertEqual(api.batches[0][0]["delta"], 1)
+
+
+class QuizQuestionPoolAPIViewTests(TestCase):
+    """クイズの問題プールのAPIビューのテスト"""
+
+    def setUp(self):
+        self.client = APIClient()
+        token = Token.objects.create(
+            user=get_user_model().objects.create_user("admin", password="password")
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def add(self, *questions):
+        return self.client.post(
+            reverse("discordapp:quiz-question-pool"),
+            [
+                {"question": q, "choices": ["a", "b", "c"], "answer": 0}
+                for q in questions
+            ],
+            format="json",
+        )
+
+    def pop(self, guild_id):
+        return self.client.post(
+            reverse("discordapp:quiz-question-pop"),
+            {"guild_id": guild_id, "guild_name": f"guild {guild_id}"},
+            format="json",
+        )
+
+    def test_duplicates_are_ignored(self):
+        res = self.add("日本の首都は？", "日本の首都は?", "Ｑ１")
+        self.assertEqual(res.json(), {"created": 2, "fresh": 2})
+        res = self.add("q1", "新しい問題")
+        self.assertEqual(res.json(), {"created": 1, "fresh": 3})
+
+    def test_invalid_question_is_rejected(self):
+        res = self.client.post(
+            reverse("discordapp:quiz-question-pool"),
+            [{"question": "q", "choices": ["a", "a", "b"], "answer": 3}],
+            format="json",
+        )
+        self.assertEqual(res.status_code, 400)
+
+    def test_pop_does_not_repeat_within_guild(self):
+        self.add("q1", "q2")
+        first = self.pop("1").json()["question"]
+        second = self.pop("1").json()["question"]
+        self.assertEqual({first, second}, {"q1", "q2"})
+        self.assertEqual(self.pop("1").status_code, 404)
+        # 別のギルドでは同じ問題も出題できる
+        self.assertEqual(self.pop("2").status_code, 200)
+        res = self.client.get(reverse("discordapp:quiz-question-pool"))
+        self.assertEqual(res.json(), {"fresh": 0})
+
+    def test_concurrent_pops_do_not_share_a_question(self):
+        self.add("q1", "q2")
+        guild = DiscordGuild.objects.create(guild_id=1, name="guild 1")
+        next_question = mixins._next_quiz_question
+        popped = []
+        raced = []
+
+        def race(guild):
+            question = next_question(guild)
+            if not raced:
+                # 選んでから確保するまでの間に、別のリクエストが同じ問題を取り出す
+                raced.append(True)
+                popped.append(mixins.pop_quiz_question(guild))
+            return question
+
+        with mock.patch.object(mixins, "_next_quiz_question", race):
+            popped.append(mixins.pop_quiz_question(guild))
+        self.assertEqual({q.question for q in popped}, {"q1", "q2"})
+        self.assertEqual([q.ask_count for q in popped], [1, 1])
+        self.assertEqual(QuizAsk.objects.filter(guild=guild).count(), 2)
+
+
+class QuizParserTests(TestCase):
+    """モデルの出力例（testdata/quiz_outputs.json）を読めるかのテスト"""
+
+    corpus_path = Path(__file__).resolve().parent / "testdata" / "quiz_outputs.json"
+
+    def test_corpus(self):
+        cases = json.loads(self.corpus_path.read_text(encoding="utf-8"))
+        for case in cases:
+            with self.subTest(case["name"]):
+                self.assertEqual(parse_quizzes(case["output"]), case["expected"])
+
+
+class FakeQuizPoolAPI:
+    """問題プールのAPIを真似る偽のAPIクライアント"""
+
+    def __init__(self, fresh):
+        self.fresh = fresh
+        self.added = []
+
+    async def quiz_question_pool(self):
+        return APIResponse(status_code=200, data={"fresh": self.fresh})
+
+    async def quiz_question_add(self, questions):
+        self.added.extend(questions)
+        return APIResponse(status_code=200, data={"created": len(questions)})
+
+
+class QuizPoolRefillerTests(TestCase):
+    def test_refills_only_valid_missing_questions(self):
+        requested = []
+
+        async def generate(count):
+            requested.append(count)
+            return [
+                {"question": "q1", "choices": ["a", "b", "c"], "answer": 1},
+                {"question": "q2", "choices": ["a", "b"], "answer": 0},
+                {"question": "q3", "choices": ["a", "b", "c"], "answer": 2},
+            ]
+
+        api = FakeQuizPoolAPI(fresh=7)
+        refiller = QuizPoolRefiller(api, generate, target=10, interval=60, batch_size=5)
+        self.assertEqual(asyncio.run(refiller.refill_once()), 2)
+        self.assertEqual(requested, [3])
+        self.assertEqual([q["question"] for q in api.added], ["q1", "q3"])
+
+    def test_full_pool_generates_nothing(self):
+        async def generate(count):
+            self.fail("should not generate")
+
+        api = FakeQuizPoolAPI(fresh=10)
+        refiller = QuizPoolRefiller(api, generate, target=10)
+        self.assertEqual(asyncio.run(refiller.refill_once()), 0)
+
+
+class FakeGenAIClient:
+    """genai.Clientのaio.models.generate_contentを真似る偽のクライアント"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.prompts = []
+        self.aio = self
+        self.models = self
+
+    async def generate_content(self, model, contents, config=None):
+        self.prompts.append(contents)
+        await asyncio.sleep(self.delay)
+        count = int(re.search(r"3択クイズを(\d+)問", contents).group(1))
+        questions = [
+            {"question": f"q{i}", "choices": ["a", "b", "c"], "answer": i % 3}
+            for i in range(count)
+        ]
+        return types.SimpleNamespace(
+            text=json.dumps(questions),
+            usage_metadata=types.SimpleNamespace(
+                prompt_token_count=10, candidates_token_count=5 * count
+            ),
+        )
+
+
+class QuizGeneratorTests(TestCase):
+    def make_generator(self, fake, **kwargs):
+        options = {"concurrency": 1, "timeout": 1, "max_batch": 5, **kwargs}
+        return QuizGenerator(model="test", client_factory=lambda: fake, **options)
+
+    def test_concurrent_requests_are_coalesced(self):
+        fake = FakeGenAIClient(delay=0.01)
+
+        async def run():
+            generator = self.make_generator(fake)
+            questions = await asyncio.gather(
+                *(generator.generate_one() for _ in range(4))
+            )
+            return generator, questions
+
+        generator, questions = asyncio.run(run())
+        self.assertEqual(len(fake.prompts), 1)
+        self.assertEqual(len({q["question"] for q in questions}), 4)
+        metrics = generator.metrics()
+        self.assertEqual(metrics["coalesced_requests"], 4)
+        self.assertEqual(metrics["prompt_tokens"], 10)
+        self.assertEqual(metrics["output_tokens"], 20)
+
+        # Botのメトリクスにも出る
+        instrumentation.watch_quiz_generator(generator)
+        lines = instrumentation.registry.render().splitlines()
+        for sample in [
+            'discordapp_bot_quiz_generation_total{event="calls"} 1',
+            'discordapp_bot_quiz_generation_total{event="coalesced_requests"} 4',
+            'discordapp_bot_quiz_generation_tokens_total{kind="output"} 20',
+        ]:
+            self.assertIn(sample, lines)
+        self.assertTrue(
+            any(
+                line.startswith("discordapp_bot_quiz_generation_seconds_total ")
+                for line in lines
+            )
+        )
+
+    def test_client_is_created_once(self):
+        created = []
+
+        def factory():
+            created.append(1)
+            return FakeGenAIClient()
+
+        async def run():
+            generator = QuizGenerator(
+                model="test", concurrency=1, timeout=1, client_factory=factory
+            )
+            await generator.generate(2)
+            await generator.generate(2)
+
+        asyncio.run(run())
+        self.assertEqual(len(created), 1)
+
+    def test_timeout_fails_waiters(self):
+        fake = FakeGenAIClient(delay=1)
+
+        async def run():
+            generator = self.make_generator(fake, timeout=0.01)
+            with self.assertRaises(QuizGenerationError):
+                await generator.generate_one()
+            return generator.metrics()
+
+        self.assertEqual(asyncio.run(run())["timeouts"], 1)
+
+
+class FakeClock:
+    """sleepで進む偽の時計"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+class FlashFrameTests(TestCase):
+    def test_blank_only_between_repeated_numbers(self):
+        frames = build_flash_frames([12, 34, 34], 0.5, countdown=1)
+        self.assertEqual(
+            [f.content for f in frames],
+            ["🔥 **READY... 1**", "# 　12　", "# 　34　", "# 　 　", "# 　34　"],
+        )
+
+    def test_speed_is_stretched_to_edit_budget(self):
+        frames = build_flash_frames(list(range(5)), 0.8)
+        self.assertEqual(fit_frames_to_budget(frames, 5, 5.0)[1], 0.8)
+        frames = build_flash_frames(list(range(20)), 0.2)
+        fitted, speed = fit_frames_to_budget(frames, 5, 5.0)
+        self.assertGreater(speed, 0.2)
+        self.assertTrue(all(f.duration == speed for f in fitted if f.is_number))
+
+    def test_frames_are_shown_on_schedule(self):
+        clock = FakeClock()
+        shown = []
+
+        async def edit(content):
+            clock.now += 0.1
+            shown.append((round(clock.now, 3), content))
+
+        scheduler = FrameScheduler(
+            edit, burst=5, per=5.0, clock=clock, sleep=clock.sleep
+        )
+        report = asyncio.run(scheduler.play(build_flash_frames([11, 22], 1.0)))
+        # 編集にかかる0.1秒だけ早めに送るので、予定の時刻ちょうどに表示される
+        self.assertEqual([t for t, _ in shown], [0.1, 1.0, 2.0, 3.0, 4.0])
+        self.assertLess(report.max_jitter, 0.11)
+        self.assertEqual(round(clock.now, 3), 5.0)
+
+    def test_stalled_edit_empties_bucket(self):
+        clock = FakeClock()
+        scheduler = FrameScheduler(
+            lambda content: clock.sleep(0), burst=5, per=5.0, clock=clock
+        )
+        scheduler._observe_latency(2.0)
+        self.assertAlmostEqual(scheduler._token_wait(), 1.0)
+
+
+class FlashRenderTests(TestCase):
+    def test_gif_timing_matches_speed(self):
+        data = get_flash_gif([12, 34, 34], 0.5, countdown=1)
+        image = Image.open(io.BytesIO(data))
+        durations = []
+        for index in range(image.n_frames):
+            image.seek(index)
+            durations.append(image.info["duration"])
+        # カウントダウン、(数字 + 空白) x 3、答えの入力待ち
+        self.assertEqual(durations[:7], [1000, 400, 100, 400, 100, 400, 100])
+        self.assertEqual(len(durations), 8)
+
+    def test_identical_settings_reuse_render(self):
+        render_cache.clear()
+        first = get_flash_gif([1, 2, 3], 0.3)
+        self.assertIs(get_flash_gif([1, 2, 3], 0.3), first)
+        self.assertNotEqual(
+            flash_render_key([1, 2, 3], 0.3), flash_render_key([1, 2, 3], 0.4)
+        )
+        self.assertNotEqual(
+            flash_render_key([1, 2, 3], 0.3), flash_render_key([3, 2, 1], 0.3)
+        )
+
+
+def start_bluff_number_game(channel_id=1):
+    game = BluffNumberGame(channel_id=channel_id, host_user_id=10)
+    for user_id in (10, 20, 30):
+        game.add_player(user_id, f"user{user_id}")
+    game.start_game()
+    return game
+
+
+class BluffNumberSnapshotTests(TestCase):
+    def test_round_trip_mid_round(self):
+        game = start_bluff_number_game()
+        game.make_declaration(game.get_current_turn_player().user_id, 12)
+        game.turn_message_id = 99
+        snapshot = json.loads(json.dumps(game.to_snapshot()))
+        restored = BluffNumberGame.from_snapshot(snapshot)
+        self.assertEqual(restored.to_snapshot(), game.to_snapshot())
+        self.assertEqual(restored.current_round.current_declaration, 12)
+        # 復元したゲームでそのまま続きを遊べる
+        user_id = restored.get_current_turn_player().user_id
+        self.assertTrue(restored.make_challenge(user_id)[0])
+        self.assertEqual(len(restored.round_logs), 1)
+
+    def test_finished_round_log_is_shared(self):
+        game = start_bluff_number_game()
+        game.timeout_current_player()
+        restored = BluffNumberGame.from_snapshot(game.to_snapshot())
+        self.assertIs(restored._current_log, restored.round_logs[-1])
+
+
+class BluffNumberStoreTests(TestCase):
+    def test_memory_store_evicts_abandoned_games(self):
+        store = MemoryGameStore(ttl=60)
+        asyncio.run(store.save(start_bluff_number_game(1)))
+        asyncio.run(store.save(start_bluff_number_game(2)))
+        store._snapshots[2]["updated"] -= 120
+        games = asyncio.run(store.load_all())
+        self.assertEqual([g.channel_id for g in games], [1])
+        self.assertEqual(list(store._snapshots), [1])
+
+    def test_database_store_round_trip(self):
+        store = DatabaseGameStore(ttl=60)
+        game = start_bluff_number_game(1)
+        async_to_sync(store.save)(game)
+        async_to_sync(store.save)(game)
+        self.assertEqual(BluffNumberGameState.objects.count(), 1)
+        restored = async_to_sync(store.load_all)()
+        self.assertEqual(restored[0].to_snapshot(), game.to_snapshot())
+        async_to_sync(store.delete)(1)
+        self.assertFalse(BluffNumberGameState.objects.exists())
+
+    def test_database_store_evicts_abandoned_games(self):
+        store = DatabaseGameStore(ttl=60)
+        game = start_bluff_number_game(1)
+        async_to_sync(store.save)(game)
+        state = BluffNumberGameState.objects.get()
+        state.snapshot["updated"] -= 120
+        state.save()
+        self.assertEqual(async_to_sync(store.load_all)(), [])
+        self.assertFalse(BluffNumberGameState.objects.exists())
+
+
+class FakeBluffNumberChannel:
+    """送信・編集・削除を記録するだけの偽のチャンネル"""
+
+    def __init__(self):
+        self.sent = []
+        self.edited = []
+        self.deleted = []
+
+    async def send(self, *args, **kwargs):
+        self.sent.append(kwargs)
+        return types.SimpleNamespace(id=1000 + len(self.sent))
+
+    def get_partial_message(self, message_id):
+        async def edit(**kwargs):
+            self.edited.append(message_id)
+
+        async def delete():
+            self.deleted.append(message_id)
+
+        return types.SimpleNamespace(edit=edit, delete=delete)
+
+
+class BluffNumberTurnTimeoutTests(TestCase):
+    def test_timeout_with_open_action_view_frees_channel(self):
+        """アクション画面を開いたまま放置されても、最終ラウンドならゲームが終わる"""
+        game = start_bluff_number_game(1)
+        game.round_number = game.current_round.round_number = game.MAX_ROUNDS
+        game.message_ids = [5, 6]
+        game.turn_message_id = 6
+        channel = FakeBluffNumberChannel()
+
+        async def instant(seconds):
+            pass
+
+        async def run():
+            bluff_number_views.active_games[1] = game
+            view = bluff_number_views.TurnWaitView(game, channel)
+            # ボタンを押してアクション画面を開いた後、何もしない
+            view.acted = True
+            with mock.patch("asyncio.sleep", instant):
+                await view.on_deadline()
+
+        with mock.patch.object(
+            bluff_number_views, "game_store", MemoryGameStore(ttl=60)
+        ):
+            asyncio.run(run())
+        self.assertEqual(game.phase, GamePhase.GAME_OVER)
+        self.assertNotIn(1, bluff_number_views.active_games)
+        self.assertEqual(channel.edited, [6])
+        self.assertEqual(channel.deleted, [5, 6])
+
+
+class ShardingTests(TestCase):
+    def test_split_shards_covers_every_shard_once(self):
+        groups = split_shards(5, 2)
+        self.assertEqual(groups, [[0, 2, 4], [1, 3]])
+        self.assertEqual(parse_shard_ids("3, 1,3"), [1, 3])
+
+    def test_each_process_gets_its_own_journal(self):
+        self.assertNotEqual(shard_journal_path([0, 2]), shard_journal_path([1]))
+        self.assertTrue(shard_journal_path([0, 2]).endswith(".shards-0-2"))
+
+    def test_games_are_resumed_by_the_owning_shard(self):
+        game = start_bluff_number_game(1)
+        # ギルドID 5 << 22 はシャード数2のときシャード1が受け持つ
+        game.guild_id = 5 << 22
+        shard0 = types.SimpleNamespace(shard_ids=[0], shard_count=2)
+        shard1 = types.SimpleNamespace(shard_ids=[1], shard_count=2)
+        unsharded = types.SimpleNamespace(shard_ids=None, shard_count=None)
+        self.assertFalse(bluff_number_views.handles_game(shard0, game))
+        self.assertTrue(bluff_number_views.handles_game(shard1, game))
+        self.assertTrue(bluff_number_views.handles_game(unsharded, game))
+
+
+class IntentsProfileTests(TestCase):
+    def test_standard_profile_receives_only_used_events(self):
+        intents = client_options("standard")["intents"]
+        self.assertTrue(intents.guilds and intents.members and intents.voice_states)
+        self.assertFalse(intents.presences or intents.guild_messages)
+        self.assertFalse(client_options("minimal")["intents"].members)
+        with self.assertRaises(ValueError):
+            client_options("unknown")
+
+    def test_only_voice_members_are_cached(self):
+        client = discord.Client(**client_options("standard"))
+        guild = client._connection._add_guild_from_data(
+            fake_guild(0, members=20, channels=2, voice=3, presences=False)
+        )
+        # /wakewake がボイスチャンネルのメンバーを取得できる
+        self.assertEqual(len(guild.members), 3)
+        self.assertEqual(len(guild.voice_channels[0].members), 3)
+
+
+class CommandInstrumentationTests(TestCase):
+    """スラッシュコマンドとイベントループの計測のテスト"""
+
+    def setUp(self):
+        instrumentation.registry.clear()
+        self.addCleanup(instrumentation.registry.clear)
+
+    def samples(self) -> dict[str, str]:
+        lines = instrumentation.registry.render().splitlines()
+        return dict(line.rsplit(" ", 1) for line in lines if not line.startswith("#"))
+
+    def run_command(self, body, failure=None):
+        """discord.pyと同じ順にCommandTreeの公開フックを呼んでコマンドを実行する"""
+        responded = []
+        interaction = types.SimpleNamespace(
+            type=discord.InteractionType.application_command,
+            command=types.SimpleNamespace(qualified_name="quiz", name="quiz"),
+            response=types.SimpleNamespace(is_done=lambda: bool(responded)),
+        )
+        interaction.command._has_any_error_handlers = lambda: False
+        tree = instrumentation.InstrumentedCommandTree(
+            discord.Client(intents=discord.Intents.none())
+        )
+
+        async def invoke():
+            self.assertTrue(await tree.interaction_check(interaction))
+            await body(responded)
+            if failure is None:
+                # MyClient.on_app_command_completionと同じ
+                instrumentation.finish_command(interaction, "ok")
+            else:
+                await tree.on_error(interaction, failure)
+
+        asyncio.run(invoke())
+        return interaction
+
+    def test_records_command_timings(self):
+        async def body(responded):
+            await asyncio.sleep(0.05)
+            # deferなどで応答するとis_done()がTrueになる
+            responded.append(True)
+            await asyncio.sleep(0.05)
+            instrumentation.record_backend_wait(0.5)
+
+        self.run_command(body)
+
+        samples = self.samples()
+        self.assertEqual(
+            samples['discordapp_bot_commands_total{command="quiz",outcome="ok"}'], "1"
+        )
+        first = float(
+            samples['discordapp_bot_command_first_response_seconds_sum{command="quiz"}']
+        )
+        total = float(
+            samples['discordapp_bot_command_duration_seconds_sum{command="quiz"}']
+        )
+        self.assertTrue(0.01 <= first < total)
+        self.assertEqual(
+            samples['discordapp_bot_command_backend_seconds_sum{command="quiz"}'], "0.5"
+        )
+        # コマンドの外で待った時間は記録しない
+        instrumentation.record_backend_wait(1.0)
+        self.assertEqual(
+            self.samples()[
+                'discordapp_bot_command_backend_seconds_sum{command="quiz"}'
+            ],
+            "0.5",
+        )
+
+    def test_records_failed_command(self):
+        async def body(responded):
+            instrumentation.record_backend_wait(0.25)
+
+        with self.assertLogs("discord.app_commands.tree", "ERROR"):
+            self.run_command(
+                body, failure=discord.app_commands.AppCommandError("broken")
+            )
+
+        samples = self.samples()
+        self.assertEqual(
+            samples['discordapp_bot_commands_total{command="quiz",outcome="error"}'],
+            "1",
+        )
+        self.assertNotIn(
+            'discordapp_bot_commands_total{command="quiz",outcome="ok"}', samples
+        )
+        self.assertEqual(
+            samples['discordapp_bot_command_backend_seconds_sum{command="quiz"}'],
+            "0.25",
+        )
+        # 応答しなかったコマンドは最初の応答までの時間に含めない
+        self.assertNotIn(
+            'discordapp_bot_command_first_response_seconds_count{command="quiz"}',
+            samples,
+        )
+
+    def test_dumps_stack_of_blocking_call(self):
+        def blocking_call():
+            time.sleep(0.3)
+
+        async def main():
+            monitor = instrumentation.LoopLagMonitor(interval=0.01, threshold=0.05)
+            monitor.start()
+            await asyncio.sleep(0.05)
+            blocking_call()
+            await asyncio.sleep(0.05)
+            await monitor.close()
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            asyncio.run(main())
+        output = stdout.getvalue()
+        self.assertIn("Event loop blocked", output)
+        self.assertIn("in blocking_call", output)
+        samples = self.samples()
+        self.assertEqual(samples["discordapp_bot_event_loop_blocked_total"], "1")
+        self.assertGreaterEqual(
+            float(samples["discordapp_bot_event_loop_lag_seconds_sum"]), 0.25
+        )
+
+    def test_exports_backend_call_metrics(self):
+        caller = ResilientCaller(
+            RetryPolicy(attempts=2, backoff=0, backoff_max=0),
+            CircuitBreaker(failure_threshold=2, reset_timeout=30),
+        )
+        instrumentation.watch_api_client(caller)
+
+        async def unavailable():
+            return APIResponse(status_code=503)
+
+        asyncio.run(caller.call(unavailable, idempotent=True))
+        samples = self.samples()
+        self.assertEqual(
+            samples['discordapp_bot_backend_calls_total{event="attempts"}'], "2"
+        )
+        self.assertEqual(
+            samples['discordapp_bot_backend_calls_total{event="circuit_opened"}'], "1"
+        )
+        self.assertEqual(
+            samples['discordapp_bot_backend_circuit_state{state="open"}'], "1"
+        )
+        self.assertEqual(
+            samples['discordapp_bot_backend_circuit_state{state="closed"}'], "0"
+        )
+
+    def test_records_flash_playback(self):
+        instrumentation.record_flash_playback(
+            PlaybackReport(speed=0.5, effective_speed=0.7, jitter=[0.02, -0.2])
+        )
+        samples = self.samples()
+        self.assertEqual(
+            samples['discordapp_bot_flash_playbacks_total{outcome="slowed"}'], "1"
+        )
+        self.assertEqual(
+            samples["discordapp_bot_flash_frame_jitter_seconds_count"], "2"
+        )
+        self.assertEqual(
+            samples['discordapp_bot_flash_frame_jitter_seconds_bucket{le="0.025"}'], "1"
+        )
+
+    def test_metrics_port_per_process(self):
+        with self.settings(BOT_METRICS_PORT=9464):
+            self.assertEqual(metrics_port(None), 9464)
+            self.assertEqual(metrics_port([2, 5]), 9466)
+        with self.settings(BOT_METRICS_PORT=0):
+            self.assertEqual(metrics_port([2, 5]), 0)
+
+
+class FakeLoadTestAPI:
+    """結果をメモリに保存するAPI（quiz/plusの3回に1回は保存し損ねる）"""
+
+    def __init__(self, results):
+        self.results = results
+        self.tokens = types.SimpleNamespace(get=self._token)
+        self.plus_calls = 0
+
+    async def _token(self):
+        return "token"
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def _add(self, game, discord_id, field):
+        row = self.results.setdefault((game, discord_id), Counter())
+        row[field] += 1
+
+    async def sync_guild_members(self, guild_id, guild_name, members, after, final):
+        return APIResponse(200, {"added": len(members), "removed": 0})
+
+    async def quiz_result_plus(self, discord_id, username):
+        self.plus_calls += 1
+        if self.plus_calls % 3:
+            self._add("quiz", discord_id, "correct_count")
+        return APIResponse(200, {})
+
+    async def quiz_result_minus(self, discord_id, username):
+        self._add("quiz", discord_id, "failed_count")
+        return APIResponse(200, {})
+
+    async def result_batch(self, events):
+        for event in events:
+            self._add(event["game"], event["discord_id"], event["field"])
+        return APIResponse(200, {})
+
+    async def add_member_to_guild(self, guild_id, guild_name, discord_id, username):
+        return APIResponse(200, {})
+
+    async def leaderboard(self, game, guild_id, guild_name, limit=None):
+        await asyncio.sleep(0.001)
+        return APIResponse(503)
+
+    async def quiz_result_retrieve(self, discord_id, username):
+        return APIResponse(200, self.results.get(("quiz", discord_id), Counter()))
+
+    async def flash_result_retrieve(self, discord_id, username):
+        return APIResponse(200, self.results.get(("flash", discord_id), Counter()))
+
+
+class LoadTestTests(TestCase):
+    """負荷試験の集計のテスト"""
+
+    def test_helpers(self):
+        values = [i / 100 for i in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 0.5)
+        self.assertEqual(percentile(values, 99), 0.99)
+        self.assertEqual(percentile([], 95), 0.0)
+        self.assertEqual(parse_mix("quiz=1,flash=0"), {"quiz": 1, "flash": 0})
+        with self.assertRaises(CommandError):
+            parse_mix("dice=1")
+
+    def test_counts_lost_increments_per_endpoint(self):
+        results = {}
+        apis = []
+
+        def api_factory():
+            apis.append(FakeLoadTestAPI(results))
+            return apis[-1]
+
+        simulator = TrafficSimulator(api_factory, bots=3, guilds=2, members=10)
+        asyncio.run(simulator.run(0.2))
+        lost = asyncio.run(simulator.lost_increments())
+
+        stats = simulator.stats
+        self.assertEqual(
+            stats["leaderboard/quiz"].errors, stats["leaderboard/quiz"].requests
+        )
+        self.assertEqual(stats["quiz-result/plus"].errors, 0)
+        plus_calls = sum(api.plus_calls for api in apis)
+        self.assertEqual(stats["quiz-result/plus"].requests, plus_calls)
+        self.assertEqual(
+            lost["quiz-result/plus"], sum(api.plus_calls // 3 for api in apis)
+        )
+        self.assertGreater(lost["quiz-result/plus"], 0)
+        self.assertEqual(lost["quiz-result/minus"], 0)
+        self.assertEqual(lost["results/batch"], 0)
+
+    def test_runs_against_a_started_server(self):
+        # 空いているポートで、スクラッチのDBを使うAPIを実際に起動する
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        out = io.StringIO()
+        call_command(
+            "loadtest",
+            seconds=0.5,
+            bots=2,
+            guilds=1,
+            members=10,
+            port=port,
+            stdout=out,
+        )
+        self.assertRegex(out.getvalue(), r"total: [1-9]\d* requests .* 0 errors")
+
+
+class FakeDiscordGameFlowTests(TestCase):
+    def play(self, flow, **kwargs):
+        async def run():
+            discord_ = fake_discord.FakeDiscord(burst=1000)
+            guild = discord_.guild()
+            players = [guild.member(f"player{i}") for i in range(3)]
+            await flow(discord_, guild.text_channel(), players, **kwargs)
+            return discord_
+
+        return asyncio.run(run())
+
+    def test_quiz_ends_as_soon_as_someone_answers_correctly(self):
+        started = time.monotonic()
+        discord_ = self.play(fake_discord.play_quiz)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(
+            discord_.client.results.added,
+            Counter({("quiz", "failed_count"): 2, ("quiz", "correct_count"): 1}),
+        )
+        self.assertEqual(discord_.client.api.calls["quiz_question_pop"], 1)
+        self.assertEqual(discord_.calls["interaction.edit_message"], 1)
+
+    def test_flash(self):
+        frames = functools.partial(build_flash_frames, countdown=0)
+        with mock.patch.object(flash, "build_flash_frames", frames):
+            discord_ = self.play(fake_discord.play_flash)
+        self.assertEqual(
+            discord_.client.results.added,
+            Counter({("flash", "play_count"): 3, ("flash", "correct_count"): 2}),
+        )
+        self.assertEqual(discord_.calls["interaction.send_modal"], 3)
+        self.assertEqual(discord_.calls["message.delete"], 1)
+
+    def test_bluff_number_plays_three_rounds_and_cleans_up(self):
+        with mock.patch.object(
+            bluff_number_views, "RESULT_PAUSE_SECONDS", 0
+        ), mock.patch.object(bluff_number_views, "game_store", MemoryGameStore(ttl=60)):
+            discord_ = self.play(fake_discord.play_bluff_number)
+        self.assertEqual(bluff_number_views.active_games, {})
+        self.assertEqual(bluff_number_views.deadline_tasks, {})
+        # ゲーム中のメッセージは全て消え、まとめの1件だけが残る
+        channel = next(iter(discord_.client.channels.values()))
+        summaries = [m for m in channel.messages.values() if m.ephemeral_for is None]
+        self.assertEqual(len(summaries), 1)
+        # まとめ以外のメッセージ（コマンドの応答のロビーも含む）は全て消す
+        self.assertEqual(
+            discord_.calls["message.delete"], discord_.calls["channel.send"]
+        )
+
+    def test_wakewake_moves_members_into_groups(self):
+        async def run():
+            discord_ = fake_discord.FakeDiscord()
+            guild = discord_.guild()
+            await fake_discord.play_wakewake(discord_, guild, members=7)
+            return discord_, guild
+
+        discord_, guild = asyncio.run(run())
+        self.assertEqual(
+            sorted(len(c.members) for c in guild.voice_channels), [0, 3, 4]
+        )
+        self.assertEqual(discord_.calls["member.move_to"], 7)
+
+    def test_channel_rate_limit_delays_sends(self):
+        async def run():
+            discord_ = fake_discord.FakeDiscord(burst=2, per=0.2)
+            channel = discord_.guild().text_channel()
+            started = time.monotonic()
+            for _ in range(4):
+                await channel.send("hi")
+            return discord_, time.monotonic() - started
+
+        discord_, elapsed = asyncio.run(run())
+        self.assertEqual(discord_.calls["channel.send"], 4)
+        self.assertEqual(discord_.rate_limited, 2)
+        self.assertGreaterEqual(elapsed, 0.15)
+
+    def test_deleted_message_edit_raises_not_found(self):
+        async def run():
+            discord_ = fake_discord.FakeDiscord()
+            channel = discord_.guild().text_channel()
+            message = await channel.send("hi")
+            await message.delete()
+            await channel.get_partial_message(message.id).edit(content="edited")
+
+        with self.assertRaises(discord.NotFound):
+            asyncio.run(run())
@@ -1,28 +1,28 @@
 from django.urls import include, path
 
+from .async_views import (
+    AsyncAddMemberToGuildView,
+    AsyncIncrementView,
+    AsyncLeaderboardView,
+    AsyncQuizQuestionPopView,
+    AsyncRemoveMemberFromGuildView,
+)
+from .metrics import MetricsView
 from .views import (
-    AddMemberToGuildAPIView,
-    BluffNumberPlayAPIView,
     BluffNumberResultListAPIView,
     BluffNumberResultRetrieveAPIView,
-    BluffNumberWinAPIView,
-    FlashCorrectAPIView,
-    FlashplayAPIView,
     FlashResultListAPIView,
     FlashResultRetrieveAPIView,
+    GuildMemberSyncAPIView,
     LoginAPIView,
     OverSleptResultListAPIView,
-    OverSleptResultPlusAPIView,
     OverSleptResultRetrieveAPIView,
     PredictionResultListAPIView,
-    PredictionResultMinusAPIView,
-    PredictionResultPlusAPIView,
     PredictionResultRetrieveAPIView,
+    QuizQuestionPoolAPIView,
     QuizResultListAPIView,
-    QuizResultMinusAPIView,
-    QuizResultPlusAPIView,
     QuizResultRetrieveAPIView,
-    RemoveMemberFromGuildAPIView,
+    ResultBatchAPIView,
 )
 
 app_name = "discordapp"
@@ -30,14 +30,19 @@ urlpatterns = [
     path("login/", view=LoginAPIView.as_view(), name="login"),
     path(
         "guild/add-member/",
-        view=AddMemberToGuildAPIView.as_view(),
+        view=AsyncAddMemberToGuildView.as_view(),
         name="add-member-to-guild",
     ),
     path(
         "guild/remove-member/",
-        view=RemoveMemberFromGuildAPIView.as_view(),
+        view=AsyncRemoveMemberFromGuildView.as_view(),
         name="remove-member-from-guild",
     ),
+    path(
+        "guild/sync-members/",
+        view=GuildMemberSyncAPIView.as_view(),
+        name="sync-guild-members",
+    ),
     path(
         "quiz-results/",
         view=QuizResultListAPIView.as_view(),
@@ -50,14 +55,24 @@ urlpatterns = [
     ),
     path(
         "quiz-result/plus/",
-        view=QuizResultPlusAPIView.as_view(),
+        view=AsyncIncrementView.as_view(game="quiz", field="correct_count"),
         name="quiz-result-plus",
     ),
     path(
         "quiz-result/minus/",
-        view=QuizResultMinusAPIView.as_view(),
+        view=AsyncIncrementView.as_view(game="quiz", field="failed_count"),
         name="quiz-result-minus",
     ),
+    path(
+        "quiz/questions/",
+        view=QuizQuestionPoolAPIView.as_view(),
+        name="quiz-question-pool",
+    ),
+    path(
+        "quiz/questions/pop/",
+        view=AsyncQuizQuestionPopView.as_view(),
+        name="quiz-question-pop",
+    ),
     path(
         "overslept-results/",
         view=OverSleptResultListAPIView.as_view(),
@@ -70,7 +85,7 @@ urlpatterns = [
     ),
     path(
         "overslept-result/plus/",
-        view=OverSleptResultPlusAPIView.as_view(),
+        view=AsyncIncrementView.as_view(game="overslept", field="overslept_count"),
         name="overslept-result-plus",
     ),
     path(
@@ -85,12 +100,12 @@ urlpatterns = [
     ),
     path(
         "prediction-result/plus/",
-        view=PredictionResultPlusAPIView.as_view(),
+        view=AsyncIncrementView.as_view(game="prediction", field="correct_count"),
         name="prediction-result-plus",
     ),
     path(
         "prediction-result/minus/",
-        view=PredictionResultMinusAPIView.as_view(),
+        view=AsyncIncrementView.as_view(game="prediction", field="failed_count"),
         name="prediction-result-minus",
     ),
     path(
@@ -105,12 +120,12 @@ urlpatterns = [
     ),
     path(
         "bluff-number/play/",
-        view=BluffNumberPlayAPIView.as_view(),
+        view=AsyncIncrementView.as_view(game="bluff_number", field="play_count"),
         name="bluff-number-play",
     ),
     path(
         "bluff-number/win/",
-        view=BluffNumberWinAPIView.as_view(),
+        view=AsyncIncrementView.as_view(game="bluff_number", field="win_count"),
         name="bluff-number-win",
     ),
     path(
@@ -125,12 +140,23 @@ urlpatterns = [
     ),
     path(
         "flash/play/",
-        view=FlashplayAPIView.as_view(),
+        view=AsyncIncrementView.as_view(game="flash", field="play_count"),
         name="flash-play",
     ),
     path(
         "flash/correct/",
-        view=FlashCorrectAPIView.as_view(),
+        view=AsyncIncrementView.as_view(game="flash", field="correct_count"),
         name="flash-correct",
     ),
+    path(
+        "results/batch/",
+        view=ResultBatchAPIView.as_view(),
+        name="result-batch",
+    ),
+    path(
+        "leaderboard/<str:game>/",
+        view=AsyncLeaderboardView.as_view(),
+        name="leaderboard",
+    ),
+    path("metrics", view=MetricsView.as_view(), name="metrics"),
 ]
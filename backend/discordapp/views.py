@@ -5,6 +5,9 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from .mixins import (
+    add_quiz_questions,
+    apply_result_events,
+    count_fresh_quiz_questions,
     create_bluff_number_result,
     create_flash_result,
     create_or_update_discord_guild,
@@ -12,6 +15,8 @@ from .mixins import (
     create_overslept_result,
     create_prediction_result,
     create_quiz_result,
+    get_guild_results,
+    sync_guild_members,
 )
 from .models import (
     BluffNumberResult,
@@ -23,10 +28,13 @@ from .models import (
 from .serializers import (
     BluffNumberResultSerializer,
     FlashResultSerializer,
+    GuildMemberSyncSerializer,
     LoginSerializer,
     OverSleptResultSerializer,
     PredictionResultSerializer,
+    QuizQuestionSerializer,
     QuizResultSerializer,
+    ResultEventSerializer,
 )
 
 
@@ -48,42 +56,6 @@ class LoginAPIView(generics.GenericAPIView):
             )
 
 
-class AddMemberToGuildAPIView(generics.GenericAPIView):
-    """ギルドにメンバーを追加するAPIビュー"""
-
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request, *args, **kwargs):
-        guild_id = request.data.get("guild_id")
-        guild_name = request.data.get("guild_name", "")
-        discord_id = request.data.get("discord_id")
-        username = request.data.get("username")
-        guild = create_or_update_discord_guild(guild_id, guild_name)
-        user = create_or_update_discord_user(discord_id, username)
-        guild.members.add(user)
-        guild.save()
-        return Response({"message": "Member added to guild"}, status=status.HTTP_200_OK)
-
-
-class RemoveMemberFromGuildAPIView(generics.GenericAPIView):
-    """ギルドからメンバーを削除するAPIビュー"""
-
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request, *args, **kwargs):
-        guild_id = request.data.get("guild_id")
-        guild_name = request.data.get("guild_name", "")
-        discord_id = request.data.get("discord_id")
-        username = request.data.get("username")
-        guild = create_or_update_discord_guild(guild_id, guild_name)
-        user = create_or_update_discord_user(discord_id, username)
-        guild.members.remove(user)
-        guild.save()
-        return Response(
-            {"message": "Member removed from guild"}, status=status.HTTP_200_OK
-        )
-
-
 class QuizResultListAPIView(generics.GenericAPIView):
     """QuizResultの一覧を取得するAPIビュー"""
 
@@ -95,9 +67,8 @@ class QuizResultListAPIView(generics.GenericAPIView):
         guild_id = request.data.get("guild_id")
         guild_name = request.data.get("guild_name", "")
         guild = create_or_update_discord_guild(guild_id, guild_name)
-        members = guild.members.all()
         serializers = self.get_serializer(
-            [create_quiz_result(member) for member in members], many=True
+            get_guild_results(QuizResult, guild), many=True
         )
         return Response(serializers.data)
 
@@ -118,42 +89,6 @@ class QuizResultRetrieveAPIView(generics.RetrieveAPIView):
         return Response(serializer.data)
 
 
-class QuizResultPlusAPIView(generics.UpdateAPIView):
-    """QuizResultの正解数を増加させるAPIビュー"""
-
-    queryset = QuizResult.objects.all()
-    serializer_class = QuizResultSerializer
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request, *args, **kwargs):
-        user = create_or_update_discord_user(
-            request.data.get("discord_id"), request.data.get("username")
-        )
-        quiz_result = create_quiz_result(user)
-        quiz_result.correct_count += 1
-        quiz_result.save()
-        serializer = self.get_serializer(quiz_result)
-        return Response(serializer.data)
-
-
-class QuizResultMinusAPIView(generics.UpdateAPIView):
-    """QuizResultの不正解数を増加させるAPIビュー"""
-
-    queryset = QuizResult.objects.all()
-    serializer_class = QuizResultSerializer
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request, *args, **kwargs):
-        user = create_or_update_discord_user(
-            request.data.get("discord_id"), request.data.get("username")
-        )
-        quiz_result = create_quiz_result(user)
-        quiz_result.failed_count += 1
-        quiz_result.save()
-        serializer = self.get_serializer(quiz_result)
-        return Response(serializer.data)
-
-
 class OverSleptResultListAPIView(generics.GenericAPIView):
     """OverSleptResultの一覧を取得するAPIビュー"""
 
@@ -165,9 +100,8 @@ class OverSleptResultListAPIView(generics.GenericAPIView):
         guild_id = request.data.get("guild_id")
         guild_name = request.data.get("guild_name", "")
         guild = create_or_update_discord_guild(guild_id, guild_name)
-        members = guild.members.all()
         serializers = self.get_serializer(
-            [create_overslept_result(member) for member in members], many=True
+            get_guild_results(OverSleptResult, guild), many=True
         )
         return Response(serializers.data)
 
@@ -188,24 +122,6 @@ class OverSleptResultRetrieveAPIView(generics.RetrieveAPIView):
         return Response(serializer.data)
 
 
-class OverSleptResultPlusAPIView(generics.UpdateAPIView):
-    """OverSleptResultの寝坊数を増加させるAPIビュー"""
-
-    queryset = OverSleptResult.objects.all()
-    serializer_class = OverSleptResultSerializer
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request, *args, **kwargs):
-        user = create_or_update_discord_user(
-            request.data.get("discord_id"), request.data.get("username")
-        )
-        overslept_result = create_overslept_result(user)
-        overslept_result.overslept_count += 1
-        overslept_result.save()
-        serializer = self.get_serializer(overslept_result)
-        return Response(serializer.data)
-
-
 class PredictionResultListAPIView(generics.GenericAPIView):
     """PredictionResultの一覧を取得するAPIビュー"""
 
@@ -217,9 +133,8 @@ class PredictionResultListAPIView(generics.GenericAPIView):
         guild_id = request.data.get("guild_id")
         guild_name = request.data.get("guild_name", "")
         guild = create_or_update_discord_guild(guild_id, guild_name)
-        members = guild.members.all()
         serializers = self.get_serializer(
-            [create_prediction_result(member) for member in members], many=True
+            get_guild_results(PredictionResult, guild), many=True
         )
         return Response(serializers.data)
 
@@ -240,42 +155,6 @@ class PredictionResultRetrieveAPIView(generics.RetrieveAPIView):
         return Response(serializer.data)
 
 
-class PredictionResultPlusAPIView(generics.UpdateAPIView):
-    """PredictionResultの正解数を増加させるAPIビュー"""
-
-    queryset = PredictionResult.objects.all()
-    serializer_class = PredictionResultSerializer
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request, *args, **kwargs):
-        user = create_or_update_discord_user(
-            request.data.get("discord_id"), request.data.get("username")
-        )
-        prediction_result = create_prediction_result(user)
-        prediction_result.correct_count += 1
-        prediction_result.save()
-        serializer = self.get_serializer(prediction_result)
-        return Response(serializer.data)
-
-
-class PredictionResultMinusAPIView(generics.UpdateAPIView):
-    """PredictionResultの不正解数を増加させるAPIビュー"""
-
-    queryset = PredictionResult.objects.all()
-    serializer_class = PredictionResultSerializer
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request, *args, **kwargs):
-        user = create_or_update_discord_user(
-            request.data.get("discord_id"), request.data.get("username")
-        )
-        prediction_result = create_prediction_result(user)
-        prediction_result.failed_count += 1
-        prediction_result.save()
-        serializer = self.get_serializer(prediction_result)
-        return Response(serializer.data)
-
-
 class BluffNumberResultListAPIView(generics.GenericAPIView):
     """BluffNumberResultの一覧を取得するAPIビュー"""
 
@@ -287,9 +166,8 @@ class BluffNumberResultListAPIView(generics.GenericAPIView):
         guild_id = request.data.get("guild_id")
         guild_name = request.data.get("guild_name", "")
         guild = create_or_update_discord_guild(guild_id, guild_name)
-        members = guild.members.all()
         serializers = self.get_serializer(
-            [create_bluff_number_result(member) for member in members], many=True
+            get_guild_results(BluffNumberResult, guild), many=True
         )
         return Response(serializers.data)
 
@@ -310,42 +188,6 @@ class BluffNumberResultRetrieveAPIView(generics.RetrieveAPIView):
         return Response(serializer.data)
 
 
-class BluffNumberPlayAPIView(generics.UpdateAPIView):
-    """BluffNumberResultのプレイ数を増加させるAPIビュー"""
-
-    queryset = BluffNumberResult.objects.all()
-    serializer_class = BluffNumberResultSerializer
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request, *args, **kwargs):
-        discord_id = request.data.get("discord_id")
-        username = request.data.get("username")
-        user = create_or_update_discord_user(discord_id, username)
-        bluff_number_result = create_bluff_number_result(user)
-        bluff_number_result.play_count += 1
-        bluff_number_result.save()
-        serializer = self.get_serializer(bluff_number_result)
-        return Response(serializer.data)
-
-
-class BluffNumberWinAPIView(generics.UpdateAPIView):
-    """BluffNumberResultの勝利数を増加させるAPIビュー"""
-
-    queryset = BluffNumberResult.objects.all()
-    serializer_class = BluffNumberResultSerializer
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request, *args, **kwargs):
-        discord_id = request.data.get("discord_id")
-        username = request.data.get("username")
-        user = create_or_update_discord_user(discord_id, username)
-        bluff_number_result = create_bluff_number_result(user)
-        bluff_number_result.win_count += 1
-        bluff_number_result.save()
-        serializer = self.get_serializer(bluff_number_result)
-        return Response(serializer.data)
-
-
 class FlashResultListAPIView(generics.GenericAPIView):
     """FlashResultの一覧を取得するAPIビュー"""
 
@@ -357,9 +199,8 @@ class FlashResultListAPIView(generics.GenericAPIView):
         guild_id = request.data.get("guild_id")
         guild_name = request.data.get("guild_name", "")
         guild = create_or_update_discord_guild(guild_id, guild_name)
-        members = guild.members.all()
         serializers = self.get_serializer(
-            [create_flash_result(member) for member in members], many=True
+            get_guild_results(FlashResult, guild), many=True
         )
         return Response(serializers.data)
 
@@ -380,37 +221,63 @@ class FlashResultRetrieveAPIView(generics.RetrieveAPIView):
         return Response(serializer.data)
 
 
-class FlashplayAPIView(generics.UpdateAPIView):
-    """FlashResultのプレイ数を増加させるAPIビュー"""
+class GuildMemberSyncAPIView(generics.GenericAPIView):
+    """ギルドのメンバー一覧をまとめて同期するAPIビュー
 
-    queryset = FlashResult.objects.all()
-    serializer_class = FlashResultSerializer
+    メンバーはIDの昇順に区切って複数回に分けて送れる
+    （mixins.sync_guild_membersを参照）。
+    """
+
+    serializer_class = GuildMemberSyncSerializer
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        discord_id = request.data.get("discord_id")
-        username = request.data.get("username")
-        user = create_or_update_discord_user(discord_id, username)
-        flash_result_instance = create_flash_result(user)
-        flash_result_instance.play_count += 1
-        flash_result_instance.save()
-        serializer = self.get_serializer(flash_result_instance)
-        return Response(serializer.data)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        added, removed = sync_guild_members(
+            data["guild_id"],
+            data["guild_name"],
+            {m["discord_id"]: m["username"] for m in data["members"]},
+            after=data["after"],
+            final=data["final"],
+        )
+        return Response(
+            {"message": "Members synced", "added": added, "removed": removed},
+            status=status.HTTP_200_OK,
+        )
 
 
-class FlashCorrectAPIView(generics.UpdateAPIView):
-    """FlashResultの正解数を増加させるAPIビュー"""
+class ResultBatchAPIView(generics.GenericAPIView):
+    """結果イベントの一覧をまとめて適用するAPIビュー"""
 
-    queryset = FlashResult.objects.all()
-    serializer_class = FlashResultSerializer
+    serializer_class = ResultEventSerializer
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        discord_id = request.data.get("discord_id")
-        username = request.data.get("username")
-        user = create_or_update_discord_user(discord_id, username)
-        flash_result_instance = create_flash_result(user)
-        flash_result_instance.correct_count += 1
-        flash_result_instance.save()
-        serializer = self.get_serializer(flash_result_instance)
-        return Response(serializer.data)
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        applied = apply_result_events(serializer.validated_data)
+        return Response(
+            {"message": "Results applied", "applied": applied},
+            status=status.HTTP_200_OK,
+        )
+
+
+class QuizQuestionPoolAPIView(generics.GenericAPIView):
+    """クイズの問題プールの残数を取得し、問題を補充するAPIビュー"""
+
+    serializer_class = QuizQuestionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        return Response({"fresh": count_fresh_quiz_questions()})
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        created = add_quiz_questions(serializer.validated_data)
+        return Response(
+            {"created": created, "fresh": count_fresh_quiz_questions()},
+            status=status.HTTP_200_OK,
+        )